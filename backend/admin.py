@@ -29,6 +29,9 @@ from werkzeug.utils import secure_filename
 from flask_cors import CORS
 try:
     from .managers.background_manager import get_slots, set_slots, list_images
+    from .managers.background_schedule import active_background
+    from .managers import image_pipeline
+    from .managers.log_buffer import LogBuffer
 except ImportError:
     import sys
     from pathlib import Path
@@ -36,6 +39,9 @@ except ImportError:
     if str(backend_dir) not in sys.path:
         sys.path.insert(0, str(backend_dir))
     from managers.background_manager import get_slots, set_slots, list_images
+    from managers.background_schedule import active_background
+    from managers import image_pipeline
+    from managers.log_buffer import LogBuffer
 
 
 print(f"[DEBUG] Running admin.py from {Path(__file__).resolve()}")
@@ -79,7 +85,15 @@ SPA_DIST = ADMIN_DIST_DIR
 
 STATIC_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
-main_app_logs = []
+# Image variants are content addressed (see image_pipeline): cache them for good
+VARIANT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Console output of the main app: the last ADMIN_LOG_LINES lines in memory,
+# older ones optionally kept in ADMIN_LOG_FILE (rotated)
+main_app_logs = LogBuffer(
+    capacity=int(os.getenv("ADMIN_LOG_LINES", "5000")),
+    spill_path=os.getenv("ADMIN_LOG_FILE") or None,
+)
 app_process = None
 
 # === Git utilities ===
@@ -468,6 +482,22 @@ def api_get_backgrounds():
                 s["path"] = None
     return jsonify(slots), 200
 
+@app.route("/admin/backgrounds/active", methods=["GET"])
+def api_active_background():
+    """
+    The background to show now and when it next changes (see
+    background_schedule), with its variants and placeholder (image_pipeline).
+    """
+    active = dict(active_background(css_path=str(CSS_FILE_PATH)))
+    active.update(image_pipeline.image_info(active["path"]))
+    return jsonify(active), 200
+
+@app.route("/static/assets/variants/<path:filename>", methods=["GET"])
+def serve_image_variant(filename):
+    response = send_from_directory(image_pipeline.VARIANTS_DIR, filename)
+    response.headers["Cache-Control"] = VARIANT_CACHE_CONTROL
+    return response
+
 @app.route("/admin/backgrounds", methods=["POST"])
 def api_set_backgrounds():
     payload = request.get_json() or {}
@@ -506,6 +536,7 @@ def update_background():
         os.makedirs(STATIC_IMAGES_DIR, exist_ok=True)
         save_path = STATIC_IMAGES_DIR / secure_filename(file.filename)
         file.save(save_path)
+        image_pipeline.import_image(str(save_path))
         new_path = url_for("static", filename=f"assets/images/{file.filename}")
         slots[idx]["path"] = new_path
 
@@ -539,6 +570,7 @@ def api_import_background():
         f.save(dest)
     except Exception as e:
         return jsonify({"error": f"could not save: {e}"}), 500
+    image = image_pipeline.import_image(str(dest))
 
     url = f"/static/assets/images/{filename}"
 
@@ -554,7 +586,15 @@ def api_import_background():
         slots = slots[:4]
     write_slots_to_css_json(CSS_FILE_PATH, slots)
 
-    return jsonify({"status": "success", "url": url, "slots": slots}), 200
+    return jsonify({
+        "status": "success",
+        "url": url,
+        "variants": image["variants"],
+        "placeholder": image["placeholder"],
+        # variants are made in the background, see /admin/backgrounds/active
+        "processing": image_pipeline.is_processing(filename),
+        "slots": slots,
+    }), 200
 
 @app.route("/admin/check_update", methods=["GET"])
 def admin_check_update():
@@ -814,7 +854,8 @@ def admin_start():
                 "--threads=8",
                 "--host=127.0.0.1",
                 "--port=5000",
-                "backend.main:app",
+                "--call",
+                "backend.main:create_app",
             ]
             app_process = subprocess.Popen(
                 cmd,
@@ -852,7 +893,15 @@ def admin_status():
 
 @app.route("/admin/logs_data")
 def logs_data():
-    return "\n".join(main_app_logs)
+    """
+    Without parameters: the buffered log as plain text.
+    With ?after=<seq>: JSON with only the newer lines (see LogBuffer.since).
+    """
+    after = request.args.get("after", type=int)
+    if after is None:
+        return main_app_logs.text()
+    limit = request.args.get("limit", default=2000, type=int)
+    return jsonify(main_app_logs.since(after, limit=limit))
 
 def auto_update_worker():
     while True:
@@ -884,13 +933,32 @@ def serve_spa(path):
         return send_from_directory(str(SPA_DIST), path)
     return send_from_directory(str(SPA_DIST), "index.html")
 
+MAIN_APP_READY_URL = "http://127.0.0.1:5000/readyz"
+MAIN_APP_READY_TIMEOUT = 120  # seconds
+
+def wait_for_main_app_ready(timeout=MAIN_APP_READY_TIMEOUT, interval=0.5):
+    """
+    Poll the main app's /readyz until it reports ready (static GTFS loaded and
+    first snapshot built). Returns its JSON body, or None on timeout or exit.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if app_process is not None and app_process.poll() is not None:
+            return None  # the main app exited
+        try:
+            response = requests.get(MAIN_APP_READY_URL, timeout=2)
+            if response.status_code == 200:
+                return response.json()
+        except requests.RequestException:
+            pass  # not listening yet
+        time.sleep(interval)
+    return None
+
 def auto_start_main_app():
     """Auto-start the main app when admin server starts"""
     if os.environ.get('WERKZEUG_RUN_MAIN') != 'true' and os.getenv("FLASK_ENV") == "development":
         return
     def delayed_start():
-        time.sleep(5)
-        
         if app.config["APP_RUNNING"]:
             logger.info("Main application is already running, skipping auto-start")
             return
@@ -902,8 +970,15 @@ def auto_start_main_app():
                 if status_code == 200:
                     response_data = data.get_json()
                     if response_data.get("status") == "started":
-                        logger.info("✅ BdeB-Go has started successfully!")
-                        time.sleep(3)
+                        started = time.monotonic()
+                        ready = wait_for_main_app_ready()
+                        if ready:
+                            logger.info(
+                                "✅ BdeB-Go is ready in %.1f s (static GTFS %s ms, first snapshot %s ms)",
+                                time.monotonic() - started, ready.get("static_ms"), ready.get("first_snapshot_ms"),
+                            )
+                        else:
+                            logger.error("❌ BdeB-Go did not become ready within %d s", MAIN_APP_READY_TIMEOUT)
                     elif response_data.get("status") == "already_running":
                         logger.info("✅ BdeB-Go was already running")
                 else:
@@ -917,6 +992,8 @@ def auto_start_main_app():
 auto_start_main_app()  
 
 if __name__ == "__main__":
+    # Variants of images added outside the console (or before the manifest existed)
+    threading.Thread(target=image_pipeline.sync_manifest, name="image-sync", daemon=True).start()
     if os.getenv("FLASK_DEV_MODE") == "true":
         print("[WARNING] Running in Flask development mode - not recommended for production")
         app.run(debug=True, use_reloader=True, host="127.0.0.1", port=5001)
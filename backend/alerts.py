@@ -1,5 +1,19 @@
+import bisect
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
 
 from backend.utils import get_weather_alerts
+from backend import metrics
+
+# Processed alerts memoized by fingerprint of the raw alert
+ALERT_CACHE_SIZE = 512
+# How long start/end events stay in the /api/data payload
+ALERT_EVENT_WINDOW = 300  # seconds
 
 def get_text(text_source):
     """
@@ -31,79 +45,465 @@ def get_text(text_source):
             return item
     return ""
 
-def process_stm_alerts(stm_alerts_data, weather_api_key):
+def fingerprint_stm_alert(alert):
+    """Stable hash of a raw STM i3 alert (a JSON dict)."""
+    raw = json.dumps(alert, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def fingerprint_exo_alert(alert):
+    """Stable hash of a raw GTFS-RT Alert message."""
+    return hashlib.blake2b(alert.SerializeToString(deterministic=True), digest_size=8).hexdigest()
+
+
+class AlertCache:
+    """
+    Bounded LRU of processed alerts by fingerprint, so unchanged alerts are
+    not filtered, translated and classified again on every refresh. Alerts
+    that were filtered out are cached too (as None).
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=ALERT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint):
+        with self._lock:
+            value = self._entries.get(fingerprint, self._MISSING)
+            if value is not self._MISSING:
+                self._entries.move_to_end(fingerprint)
+        hit = value is not self._MISSING
+        metrics.inc("bdeb_alert_cache_total", result="hit" if hit else "miss")
+        return hit, (value if hit else None)
+
+    def put(self, fingerprint, value):
+        with self._lock:
+            self._entries[fingerprint] = value
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_stm_cache = AlertCache()
+_exo_cache = AlertCache()
+
+
+class AlertTracker:
+    """
+    Active alerts per source, by fingerprint. ``update`` records a "start"
+    event for each alert not seen in the previous refresh and an "end" event
+    for each one gone since; ``events`` returns the recent ones so the
+    display can animate new alerts.
+    """
+
+    def __init__(self, window=ALERT_EVENT_WINDOW):
+        self.window = window
+        self._active = {}  # source -> {fingerprint: header}
+        self._events = deque(maxlen=ALERT_CACHE_SIZE)
+        self._lock = threading.Lock()
+
+    def update(self, source, alerts, now=None):
+        """``alerts``: processed alerts of one source (each with an "id")."""
+        now = time.time() if now is None else now
+        current = {alert["id"]: alert.get("header", "") for alert in alerts if alert.get("id")}
+        with self._lock:
+            previous = self._active.get(source, {})
+            for fingerprint, header in current.items():
+                if fingerprint not in previous:
+                    self._events.append({"type": "start", "id": fingerprint, "source": source, "header": header, "at": now})
+            for fingerprint, header in previous.items():
+                if fingerprint not in current:
+                    self._events.append({"type": "end", "id": fingerprint, "source": source, "header": header, "at": now})
+            self._active[source] = current
+
+    def events(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return [event for event in self._events if now - event["at"] <= self.window]
+
+
+alert_tracker = AlertTracker()
+
+
+def stm_active_periods(raw):
+    """[(start, end), ...] from an i3 ``active_periods`` (dict or list); None = unbounded."""
+    if not raw:
+        return []
+    periods = []
+    for period in raw if isinstance(raw, list) else [raw]:
+        if not isinstance(period, dict):
+            continue
+        try:
+            start = float(period["start"]) if period.get("start") else None
+            end = float(period["end"]) if period.get("end") else None
+        except (TypeError, ValueError):
+            continue
+        periods.append((start, end))
+    return periods
+
+
+def exo_active_periods(alert):
+    """[(start, end), ...] from a GTFS-RT Alert (0 or missing = unbounded)."""
+    return [(float(period.start) or None, float(period.end) or None) for period in alert.active_period]
+
+
+def custom_active_periods(message):
+    """A pending custom message is shown from its scheduledTime (local ISO time) on."""
+    if message.get("status") != "pending" or not message.get("scheduledTime"):
+        return []
+    try:
+        return [(datetime.fromisoformat(message["scheduledTime"]).timestamp(), None)]
+    except (TypeError, ValueError):
+        return []
+
+
+class AlertSchedule:
+    """
+    Alerts of every source (STM, Exo, custom messages) with their active
+    periods, [(start, end), ...] (None = unbounded; no periods = always
+    active). The sorted start/end times form the timeline: the active set is
+    computed when a source changes or the clock passes the next boundary, and
+    served as-is in between, so requests do not parse or scan any period.
+    Alerts starting later are kept and shown as soon as their start passes.
+    """
+
+    SOURCES = ("stm", "exo", "custom")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}         # source -> [(alert, periods)]
+        self._signatures = {}      # source -> (id(), periods) of its entries, to skip unchanged refreshes
+        self._boundaries = []      # sorted start/end times of every period
+        self._next_change = None   # first boundary after the last computation
+        self._active = []          # active alerts, in source then feed order
+        self._active_ids = set()   # id() of the active alerts
+        self._dirty = True
+
+    def replace(self, source, entries):
+        """
+        Set the alerts of ``source``: [(alert, periods), ...]. Nothing is
+        recomputed when the same alert objects come back with the same
+        periods (memoized feed alerts); the previous entries are still held,
+        so their id() cannot have been reused by a new alert.
+        """
+        entries = [(alert, tuple(periods)) for alert, periods in entries]
+        signature = tuple((id(alert), periods) for alert, periods in entries)
+        with self._lock:
+            if self._signatures.get(source) == signature:
+                return
+            self._signatures[source] = signature
+            self._sources[source] = entries
+            self._boundaries = sorted({
+                t for items in self._sources.values() for _, periods in items
+                for period in periods for t in period if t is not None
+            })
+            self._dirty = True
+
+    def _refresh(self, now):
+        active = []
+        for source in sorted(self._sources, key=lambda s: self.SOURCES.index(s) if s in self.SOURCES else len(self.SOURCES)):
+            for alert, periods in self._sources[source]:
+                if not periods or any((start is None or start <= now) and (end is None or now < end)
+                                      for start, end in periods):
+                    active.append(alert)
+        self._active = active
+        self._active_ids = {id(alert) for alert in active}
+        position = bisect.bisect_right(self._boundaries, now)
+        self._next_change = self._boundaries[position] if position < len(self._boundaries) else None
+        self._dirty = False
+
+    def active(self, now=None):
+        """The alerts active at ``now``."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._dirty or (self._next_change is not None and now >= self._next_change):
+                self._refresh(now)
+            return list(self._active)
+
+    def is_active(self, alert):
+        """Whether ``alert`` was active at the last ``active()`` call."""
+        return id(alert) in self._active_ids
+
+    def next_change(self):
+        """Unix time of the next activation or expiry (None if none is scheduled)."""
+        with self._lock:
+            return self._next_change
+
+
+alert_schedule = AlertSchedule()
+
+
+# Bus rows carry the direction name, STM alerts the i3 direction code
+STM_DIRECTION_CODES = {"Est": "E", "Ouest": "W", "Nord": "N", "Sud": "S"}
+
+
+class AlertIndex:
+    """
+    Processed alerts keyed by (agency, route, stop, direction), built once per
+    alerts refresh so each bus/train row finds its alerts with a few dict
+    lookups. None in a key means "any": an alert registered without a
+    direction applies to both directions. An alert added for several keys is
+    stored once and returned once.
+    """
+
+    __slots__ = ("alerts", "_by_key", "_positions")
+
+    def __init__(self):
+        self.alerts = []      # unique alerts, in the order they were added
+        self._by_key = {}     # (agency, route, stop, direction) -> [positions in alerts]
+        self._positions = {}  # id(alert) -> position in alerts
+
+    def add(self, alert, agency, routes=(None,), stops=(None,), directions=(None,)):
+        position = self._positions.get(id(alert))
+        if position is None:
+            position = self._positions[id(alert)] = len(self.alerts)
+            self.alerts.append(alert)
+        for route in routes or (None,):
+            for stop in stops or (None,):
+                for direction in directions or (None,):
+                    bucket = self._by_key.setdefault((agency, route, stop, direction), [])
+                    if position not in bucket:
+                        bucket.append(position)
+
+    def lookup(self, agency, route=None, stop=None, direction=None):
+        """Alerts for this row, including those registered with wildcards, in insertion order."""
+        positions = set()
+        for r in {route, None}:
+            for s in {stop, None}:
+                for d in {direction, None}:
+                    bucket = self._by_key.get((agency, r, s, d))
+                    if bucket:
+                        positions.update(bucket)
+        return [self.alerts[position] for position in sorted(positions)]
+
+    def __len__(self):
+        return len(self.alerts)
+
+
+# ─── classification ───────────────────────────────────────────
+# GTFS-RT Alert.Effect / Alert.Cause numbers (Chrono) -> names (as in STM i3)
+EFFECT_NAMES = {
+    1: "NO_SERVICE", 2: "REDUCED_SERVICE", 3: "SIGNIFICANT_DELAYS", 4: "DETOUR",
+    5: "ADDITIONAL_SERVICE", 6: "MODIFIED_SERVICE", 7: "OTHER_EFFECT", 8: "UNKNOWN_EFFECT",
+    9: "STOP_MOVED", 10: "NO_EFFECT", 11: "ACCESSIBILITY_ISSUE",
+}
+CAUSE_NAMES = {
+    1: "UNKNOWN_CAUSE", 2: "OTHER_CAUSE", 3: "TECHNICAL_PROBLEM", 4: "STRIKE",
+    5: "DEMONSTRATION", 6: "ACCIDENT", 7: "HOLIDAY", 8: "WEATHER", 9: "MAINTENANCE",
+    10: "CONSTRUCTION", 11: "POLICE_ACTIVITY", 12: "MEDICAL_EMERGENCY",
+}
+
+# Effects that say what happens; the others (MODIFIED_SERVICE, OTHER_EFFECT,
+# UNKNOWN_EFFECT) leave the category to the text
+EFFECT_CATEGORIES = {
+    "NO_SERVICE": "no_service",
+    "REDUCED_SERVICE": "reduced_service",
+    "SIGNIFICANT_DELAYS": "delay",
+    "DETOUR": "detour",
+    "ADDITIONAL_SERVICE": "additional_service",
+    "STOP_MOVED": "stop_moved",
+    "NO_EFFECT": "normal_service",
+    "ACCESSIBILITY_ISSUE": "elevator_outage",
+}
+# Used when neither the effect nor the text says anything
+CAUSE_CATEGORIES = {
+    "STRIKE": "no_service",
+    "TECHNICAL_PROBLEM": "delay",
+    "ACCIDENT": "delay",
+    "MEDICAL_EMERGENCY": "delay",
+    "POLICE_ACTIVITY": "delay",
+    "WEATHER": "delay",
+}
+
+# French/English keywords per category, most specific first. All of them are
+# compiled into one regex, so classifying is a single scan of the text. Past
+# participles are anchored so verbs do not match ("vous déplacer" is not
+# "déplacé").
+CATEGORY_KEYWORDS = (
+    ("stop_moved", (r"d[ée]plac[ée]e?s?\b", r"stop moved", r"moved stop")),
+    ("stop_relocated", (r"relocalis[ée]e?s?\b", r"relocated")),
+    ("stop_cancelled", (r"annul[ée]e?s?\b", r"cancell?ed")),
+    ("elevator_outage", (r"ascenseurs?", r"[ée]l[ée]vateurs?", r"elevators?")),
+    ("no_service", (r"aucun service", r"service interrompu", r"interruption", r"no service", r"suspended")),
+    ("reduced_service", (r"service r[ée]duit", r"fr[ée]quence r[ée]duite", r"reduced service")),
+    ("detour", (r"d[ée]tour(?:n[ée]e?s?)?", r"detour")),
+    ("delay", (r"retards?", r"ralentissements?", r"delays?")),
+    ("normal_service", (r"service normal", r"normal service")),
+)
+_CATEGORY_PRIORITY = {category: rank for rank, (category, _) in enumerate(CATEGORY_KEYWORDS)}
+_KEYWORD_RE = re.compile(
+    "|".join(f"(?P<{category}>\\b(?:{'|'.join(words)}))" for category, words in CATEGORY_KEYWORDS),
+    re.IGNORECASE,
+)
+# Stop-level details the effect enum cannot express: they refine it
+_STOP_CATEGORIES = {"stop_cancelled", "stop_relocated", "stop_moved"}
+
+# Badge shown next to a bus stop for each stop-level category
+CATEGORY_BADGES = {"stop_moved": "deplace", "stop_relocated": "relocalise", "stop_cancelled": "annule"}
+
+
+def match_keywords(text):
+    """Most specific keyword category found in ``text``, or None."""
+    best = None
+    for match in _KEYWORD_RE.finditer(text or ""):
+        category = match.lastgroup
+        if best is None or _CATEGORY_PRIORITY[category] < _CATEGORY_PRIORITY[best]:
+            best = category
+    return best
+
+
+def says_normal_service(text):
+    """
+    Whether ``text`` announces normal service anywhere. A metro line status
+    is normal even when it also mentions an elevator outage, which
+    match_keywords would rank first.
+    """
+    return any(match.lastgroup == "normal_service" for match in _KEYWORD_RE.finditer(text or ""))
+
+
+def classify_alert(text, effect=None, cause=None):
+    """
+    Category of an alert, computed once at ingest: the effect enum (name or
+    GTFS-RT number) when it is specific, refined by stop-level keywords
+    ("arrêt déplacé" on a DETOUR alert); else the keywords of ``text``; else
+    the cause; else "other".
+    """
+    if isinstance(effect, int):
+        effect = EFFECT_NAMES.get(effect)
+    if isinstance(cause, int):
+        cause = CAUSE_NAMES.get(cause)
+    keyword_category = match_keywords(text)
+    effect_category = EFFECT_CATEGORIES.get(str(effect).upper()) if effect else None
+    if effect_category:
+        if keyword_category in _STOP_CATEGORIES:
+            return keyword_category
+        return effect_category
+    if keyword_category:
+        return keyword_category
+    return CAUSE_CATEGORIES.get(str(cause).upper(), "other") if cause else "other"
+
+
+# STM alerts kept for the display
+STM_ALLOWED_ROUTES = {"171", "180", "164"}
+STM_ALLOWED_DIRECTIONS = {"W", "E"}
+STM_ALLOWED_STOP_CODES = {"50270", "62374"}
+
+STM_STOP_CODE_TO_NAME = {
+    "50270": "Collège de Bois-de-Boulogne",
+    "62374": "Henri-Bourassa/du Bois-de-Boulogne"  # Adjust as necessary.
+}
+
+
+def _process_stm_alert(alert, fingerprint):
+    """(processed alert, [(route, stop, direction), ...]) or None if filtered out."""
+    available_routes = set()
+    available_directions = set()
+    available_stop_codes = set()
+    entities = []  # (route, stop, direction) of each informed entity, None if not given
+    for entity in alert.get('informed_entities', []):
+        route = str(entity['route_short_name']).strip() if 'route_short_name' in entity else None
+        stop = str(entity['stop_code']).strip() if 'stop_code' in entity else None
+        direction = str(entity['direction_id']).strip() if 'direction_id' in entity else None
+        entities.append((route, stop, direction))
+        if route is not None:
+            available_routes.add(route)
+        if direction is not None:
+            available_directions.add(direction)
+        if stop is not None:
+            available_stop_codes.add(stop)
+
+    # --- Exception: if route "164" and direction "W", skip the alert for route 164.
+    if "164" in available_routes and "W" in available_directions:
+        available_routes.discard("164")
+    # ------------------------------------------------
+
+    valid_routes = sorted(available_routes & STM_ALLOWED_ROUTES)
+    valid_directions = sorted(available_directions & STM_ALLOWED_DIRECTIONS)
+    valid_stops = sorted(available_stop_codes & STM_ALLOWED_STOP_CODES)
+    if not (valid_routes and valid_directions and valid_stops):
+        return None
+
+    # Each informed entity is registered as it is (a missing field matches
+    # any), not the product of every route, stop and direction of the alert
+    keys = list(dict.fromkeys(
+        (route, stop, direction) for route, stop, direction in entities
+        if (route is None or route in valid_routes)
+        and (stop is None or stop in valid_stops)
+        and (direction is None or direction in valid_directions)
+        and (route, stop, direction) != (None, None, None)
+    ))
+
+    # Extract French texts using our helper.
+    desc_text = get_text(alert.get('description_texts', []))
+    header_text = get_text(alert.get('header_texts', []))
+    friendly_stops = [STM_STOP_CODE_TO_NAME.get(s, s) for s in valid_stops]
+
+    category = classify_alert(desc_text, alert.get('effect'), alert.get('cause'))
+    processed = {
+        'id': fingerprint,
+        'header': f"🚍 Info Bus: {header_text}" if header_text else "🚍 Info Bus",
+        'description': desc_text,
+        'severity': alert.get('effect', 'alert'),
+        'routes': ", ".join(valid_routes),
+        'stop': ", ".join(friendly_stops),
+        'category': category,
+        'badge': CATEGORY_BADGES.get(category),
+        'active_periods': stm_active_periods(alert.get('active_periods')),
+    }
+    return processed, keys
+
+
+# Shown while the weather is bad; always the same object (and id), so the
+# alert schedule sees an unchanged STM source from one request to the next
+WEATHER_ALERT = {
+    'id': "weather",
+    'header': "🚨 Avertissement météorologique",
+    'description': "Retards possibles en raison des conditions météo. Vérifiez l’horaire avant de partir.",
+    'severity': "weather_alert",
+    'routes': "Tous",
+    'stop': "STM et Exo"
+}
+
+
+def process_stm_alerts(stm_alerts_data, weather_api_key, index=None):
     """
     Process STM alerts for display alongside EXO alerts.
-    Only alerts with at least one informed entity matching the allowed criteria are kept.
+    Only alerts with at least one informed entity matching the allowed criteria are kept,
+    and registered in ``index`` (an AlertIndex) under the (route, stop, direction) of each informed entity.
+    Each raw alert is processed once: results are memoized by fingerprint.
     """
     filtered_alerts = []
     if not stm_alerts_data:
         return filtered_alerts
 
-    # Allowed sets.
-    allowed_routes = {"171", "180", "164"}
-    allowed_directions = {"W", "E"}
-    allowed_stop_codes = {"50270", "62374"}
-
-    # Mapping stop names.
-    stop_code_to_name = {
-        "50270": "Collège de Bois-de-Boulogne",
-        "62374": "Henri-Bourassa/du Bois-de-Boulogne"  # Adjust as necessary.
-    }
-
     for alert in stm_alerts_data.get('alerts', []):
-        # Extract French texts using our helper.
-        desc_text = get_text(alert.get('description_texts', []))
-        header_text = get_text(alert.get('header_texts', []))
-
-        available_routes = set()
-        available_directions = set()
-        available_stop_codes = set()
-        for entity in alert.get('informed_entities', []):
-            if 'route_short_name' in entity:
-                available_routes.add(str(entity['route_short_name']).strip())
-            if 'direction_id' in entity:
-                available_directions.add(str(entity['direction_id']).strip())
-            if 'stop_code' in entity:
-                available_stop_codes.add(str(entity['stop_code']).strip())
-        
-        # --- Exception: if route "164" and direction "W", skip the alert for route 164.
-        if "164" in available_routes and "W" in available_directions:
-            available_routes.discard("164")
-        # ------------------------------------------------
-
-        if (available_routes & allowed_routes and
-            available_directions & allowed_directions and
-            available_stop_codes & allowed_stop_codes):
-
-            valid_routes = sorted(available_routes & allowed_routes)
-            valid_stops = sorted(available_stop_codes & allowed_stop_codes)
-            friendly_stops = [stop_code_to_name.get(s, s) for s in valid_stops]
-
-            routes_str = ", ".join(valid_routes) if valid_routes else "Non spécifié"
-            stops_str = ", ".join(friendly_stops) if friendly_stops else "Inconnu"
-
-            final_header = f"🚍 Info Bus: {header_text}" if header_text else "🚍 Info Bus"
-
-            filtered_alerts.append({
-                'header': final_header,
-                'description': desc_text,
-                'severity': alert.get('effect', 'alert'),
-                'routes': routes_str,
-                'stop': stops_str,
-            })
+        fingerprint = fingerprint_stm_alert(alert)
+        hit, result = _stm_cache.get(fingerprint)
+        if not hit:
+            result = _process_stm_alert(alert, fingerprint)
+            _stm_cache.put(fingerprint, result)
+        if result is None:
+            continue
+        processed, keys = result
+        filtered_alerts.append(processed)
+        if index is not None:
+            for route, stop, direction in keys:
+                index.add(processed, "stm", (route,), (stop,), (direction,))
 
     # === Append Weather Alerts ===
     weather_alerts = get_weather_alerts(weather_api_key)
     if weather_alerts:
-        for _ in weather_alerts:
-            filtered_alerts.append({
-                'header': "🚨 Avertissement météorologique",
-                'description': "Retards possibles en raison des conditions météo. Vérifiez l’horaire avant de partir.",
-                'severity': "weather_alert",
-                'routes': "Tous",
-                'stop': "STM et Exo"
-            })
+        filtered_alerts.append(WEATHER_ALERT)
 
     return filtered_alerts
 
@@ -111,49 +511,80 @@ def process_stm_alerts(stm_alerts_data, weather_api_key):
 
 
 
-def process_exo_alerts(exo_alert_entities):
+EXO_STOP_ID_TO_ROUTE = {
+    "MTL7D": "Dir Lucien l'Allier",
+    "MTL7B": "Saint-Jérôme",
+    "MTL59A": "Mascouche",
+    "MTL59C": "Ahuntsic"
+}
+
+
+def _process_exo_alert(alert, fingerprint):
+    """(processed alert, [(route, stop, direction), ...]) or None if filtered out."""
+    keys = []  # (route, stop, direction) of each watched informed entity
+    for informed_entity in alert.informed_entity:
+        if informed_entity.HasField('stop_id') and informed_entity.stop_id in EXO_STOP_ID_TO_ROUTE:
+            keys.append((
+                informed_entity.route_id if informed_entity.HasField('route_id') else None,
+                informed_entity.stop_id,
+                str(informed_entity.direction_id) if informed_entity.HasField('direction_id') else None,
+            ))
+    if not keys:
+        return None
+
+    fr_description = ""
+    for translation in alert.description_text.translation:
+        if translation.language == 'fr':
+            fr_description = translation.text
+            break
+    if not fr_description:
+        fr_description = "Description non disponible en français"
+
+    stop_ids = list(dict.fromkeys(stop for _, stop, _ in keys))
+    train_routes = list(dict.fromkeys(EXO_STOP_ID_TO_ROUTE[stop] for stop in stop_ids))
+    processed = {
+        'id': fingerprint,
+        'header': "🚨🚊 Info Train",
+        'description': fr_description,
+        'severity': alert.effect,
+        'category': classify_alert(
+            fr_description,
+            alert.effect if alert.HasField('effect') else None,
+            alert.cause if alert.HasField('cause') else None,
+        ),
+        'active_periods': exo_active_periods(alert),
+        'stop_id': stop_ids[0],
+        'train_route': ", ".join(train_routes),
+    }
+    return processed, keys
+
+
+def process_exo_alerts(exo_alert_entities, index=None):
     """
     Filter EXO alerts for certain stop_ids/routes, returning structured data.
-    This function remains unchanged.
+    An alert naming several watched stops is kept once, and registered in
+    ``index`` (an AlertIndex) under each of them. Each raw alert is processed
+    once: results are memoized by fingerprint.
     """
     filtered_alerts = []
 
     if not exo_alert_entities:
         return filtered_alerts
 
-    stop_id_to_route = {
-        "MTL7D": "Dir Lucien l'Allier",
-        "MTL7B": "Saint-Jérôme",
-        "MTL59A": "Mascouche",
-        "MTL59C": "Ahuntsic"
-    }
-    valid_stop_ids = set(stop_id_to_route.keys())
-
     for entity in exo_alert_entities:
-        if entity.HasField('alert'):
-            alert = entity.alert
-
-            for informed_entity in alert.informed_entity:
-                if informed_entity.HasField('stop_id'):
-                    stop_id = informed_entity.stop_id
-                    if stop_id in valid_stop_ids:
-                        train_route = stop_id_to_route[stop_id]
-
-                        fr_description = ""
-                        for translation in alert.description_text.translation:
-                            if translation.language == 'fr':
-                                fr_description = translation.text
-                                break
-                        if not fr_description:
-                            fr_description = "Description non disponible en français"
-
-                        filtered_alerts.append({
-                            'header': "🚨🚊 Info Train",
-                            'description': fr_description,
-                            'severity': alert.effect,
-                            'stop_id': stop_id,
-                            'train_route': train_route,
-                        })
+        if not entity.HasField('alert'):
+            continue
+        fingerprint = fingerprint_exo_alert(entity.alert)
+        hit, result = _exo_cache.get(fingerprint)
+        if not hit:
+            result = _process_exo_alert(entity.alert, fingerprint)
+            _exo_cache.put(fingerprint, result)
+        if result is None:
+            continue
+        processed, keys = result
+        filtered_alerts.append(processed)
+        if index is not None:
+            for route, stop, direction in keys:
+                index.add(processed, "exo", (route,), (stop,), (direction,))
 
     return filtered_alerts
-
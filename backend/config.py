@@ -5,29 +5,83 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # STM API Credentials
+# The *_BASE variables point the backend at another server, e.g. the local
+# mock in scripts/mock_upstream.py
 STM_API_KEY = os.getenv("STM_API_KEY")
-STM_REALTIME_ENDPOINT = "https://api.stm.info/pub/od/gtfs-rt/ic/v2/tripUpdates"
-STM_VEHICLE_POSITIONS_ENDPOINT = "https://api.stm.info/pub/od/gtfs-rt/ic/v2/vehiclePositions"
-STM_ALERTS_ENDPOINT = "https://api.stm.info/pub/od/i3/v2/messages/etatservice"
+STM_DEFAULT_BASE = "https://api.stm.info/pub/od"
+STM_API_BASE = os.getenv("STM_API_BASE", STM_DEFAULT_BASE).rstrip("/")
+STM_REALTIME_ENDPOINT = f"{STM_API_BASE}/gtfs-rt/ic/v2/tripUpdates"
+STM_VEHICLE_POSITIONS_ENDPOINT = f"{STM_API_BASE}/gtfs-rt/ic/v2/vehiclePositions"
+STM_ALERTS_ENDPOINT = f"{STM_API_BASE}/i3/v2/messages/etatservice"
 
 # NEW Chrono API (replacing old Exo API)
 CHRONO_TOKEN = os.getenv("CHRONO_TOKEN")
-CHRONO_BASE_URL = "https://exo.chrono-saeiv.com/api/opendata/v1"
+CHRONO_DEFAULT_BASE = "https://exo.chrono-saeiv.com/api/opendata/v1"
+CHRONO_BASE_URL = os.getenv("CHRONO_BASE_URL", CHRONO_DEFAULT_BASE).rstrip("/")
 
 # Chrono GTFS-RT endpoints 
-CHRONO_TRIP_UPDATE_URL = f"{CHRONO_BASE_URL}/TRAINS/tripupdate?token={CHRONO_TOKEN}"
-CHRONO_VEHICLE_POSITION_URL = f"{CHRONO_BASE_URL}/TRAINS/vehicleposition?token={CHRONO_TOKEN}"
-CHRONO_ALERTS_URL = f"{CHRONO_BASE_URL}/TRAINS/alert?token={CHRONO_TOKEN}"
+CHRONO_TRIP_UPDATE_URL = f"{CHRONO_BASE_URL}/TRAINS/tripupdate?token={CHRONO_TOKEN or ''}"
+CHRONO_VEHICLE_POSITION_URL = f"{CHRONO_BASE_URL}/TRAINS/vehicleposition?token={CHRONO_TOKEN or ''}"
+CHRONO_ALERTS_URL = f"{CHRONO_BASE_URL}/TRAINS/alert?token={CHRONO_TOKEN or ''}"
 
 # Weather API key
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
+WEATHER_DEFAULT_BASE = "http://api.weatherapi.com/v1"
+WEATHER_API_BASE = os.getenv("WEATHER_API_BASE", WEATHER_DEFAULT_BASE).rstrip("/")
 
 # Global delay configuration
 GLOBAL_DELAY_MINUTES = int(os.getenv("GLOBAL_DELAY_MINUTES", "0"))
 
-if not STM_API_KEY:
-    raise ValueError("STM_API_KEY not found in environment variables")
-if not CHRONO_TOKEN:
-    raise ValueError("CHRONO_TOKEN not found in environment variables")
-if not WEATHER_API_KEY:
-    raise ValueError("WEATHER_API_KEY not found in environment variables")
\ No newline at end of file
+# Fraction of a known train delay kept at each downstream stop without its own
+# update (1.0 carries the delay unchanged along the trip)
+EXO_DELAY_DECAY = float(os.getenv("EXO_DELAY_DECAY", "1.0"))
+
+# Chrono request budget per endpoint and circuit breaker (see feeds.EndpointGuard).
+# One request per minute per endpoint, as the 60 s cache used to allow: raise
+# it only within the quota Chrono grants the token.
+CHRONO_REQUESTS_PER_MIN = float(os.getenv("CHRONO_REQUESTS_PER_MIN", "1"))
+CHRONO_BURST = int(os.getenv("CHRONO_BURST", "1"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_BACKOFF_BASE = float(os.getenv("CIRCUIT_BACKOFF_BASE", "30"))
+CIRCUIT_BACKOFF_MAX = float(os.getenv("CIRCUIT_BACKOFF_MAX", "900"))
+
+# Last-known-good caches persisted across restarts (see snapshots.py)
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "snapshot.json.gz"))
+SNAPSHOT_SAVE_INTERVAL = float(os.getenv("SNAPSHOT_SAVE_INTERVAL", "30"))
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", str(6 * 3600)))
+# Upstream bodies (Chrono delays, positions) go stale within minutes: older
+# ones are neither restored nor served by feeds.guarded_fetch
+LAST_GOOD_MAX_AGE = float(os.getenv("LAST_GOOD_MAX_AGE", "300"))
+# Current weather restored at startup
+SNAPSHOT_WEATHER_MAX_AGE = float(os.getenv("SNAPSHOT_WEATHER_MAX_AGE", "3600"))
+
+# Upstream feed recording/replay (see feeds.py): "live", "record" or "replay"
+FEED_MODE = os.getenv("FEED_MODE", "live").strip().lower()
+FEED_ARCHIVE_DIR = os.getenv("FEED_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "feed_archive"))
+FEED_ARCHIVE_MAX_MB = float(os.getenv("FEED_ARCHIVE_MAX_MB", "500"))
+FEED_REPLAY_SPEED = float(os.getenv("FEED_REPLAY_SPEED", "1.0"))
+FEED_REPLAY_LOOP = os.getenv("FEED_REPLAY_LOOP", "1") == "1"
+
+# Static GTFS folders (filled from the admin console)
+GTFS_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "GTFS")
+STM_GTFS_DIR = os.path.join(GTFS_BASE, "stm")
+EXO_GTFS_DIR = os.path.join(GTFS_BASE, "exo")
+
+if FEED_MODE not in ("live", "record", "replay"):
+    raise ValueError(f"FEED_MODE must be live, record or replay (got {FEED_MODE!r})")
+
+
+def validate():
+    """
+    Raise ValueError if a key needed to reach the real APIs is missing (not
+    needed for a mock or a replay). Called by main.create_app(), so scripts
+    importing the config do not need the keys.
+    """
+    if FEED_MODE == "replay":
+        return
+    if not STM_API_KEY and STM_API_BASE == STM_DEFAULT_BASE:
+        raise ValueError("STM_API_KEY not found in environment variables")
+    if not CHRONO_TOKEN and CHRONO_BASE_URL == CHRONO_DEFAULT_BASE:
+        raise ValueError("CHRONO_TOKEN not found in environment variables")
+    if not WEATHER_API_KEY and WEATHER_API_BASE == WEATHER_DEFAULT_BASE:
+        raise ValueError("WEATHER_API_KEY not found in environment variables")
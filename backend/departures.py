@@ -0,0 +1,253 @@
+# departures.py
+"""
+Vectorized next-departure engine for the watched stops.
+
+Static schedules are flattened once into parallel NumPy arrays (scheduled
+seconds, trip index, service index) grouped by a watch key (a stop_id for Exo,
+a route/stop combo for STM). Each refresh then computes the remaining time,
+delay and at-stop flag of every candidate in a few array operations, instead
+of building a datetime per stop_time row. Rows of services that do not run
+today (calendar.txt and calendar_dates.txt, see ServiceCalendar) are masked
+out.
+"""
+import csv
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import logging
+logger = logging.getLogger('BdeB-GTFS.departures')
+
+SECONDS_PER_DAY = 24 * 3600
+AT_STOP_MINUTES = 2
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def parse_gtfs_time(time_str):
+    """Convert a GTFS 'HH:MM:SS' time (hours may exceed 23) to seconds."""
+    parts = time_str.strip().split(":")
+    hours = int(parts[0])
+    minutes = int(parts[1])
+    seconds = int(parts[2]) if len(parts) > 2 else 0
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def seconds_since_midnight(dt):
+    return dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+class DepartureBoard:
+    """
+    Static schedule of every watched key, stored as contiguous arrays.
+    Rows of the same key are adjacent; ``groups[key]`` is their slice.
+    """
+
+    __slots__ = ("keys", "groups", "seconds", "trips", "services",
+                 "trip_ids", "service_ids", "_rows_by_trip")
+
+    def __init__(self, keys, groups, seconds, trips, services, trip_ids, service_ids, rows_by_trip):
+        self.keys = keys
+        self.groups = groups
+        self.seconds = seconds
+        self.trips = trips
+        self.services = services
+        self.trip_ids = trip_ids
+        self.service_ids = service_ids
+        self._rows_by_trip = rows_by_trip
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def delay_array(self, delays):
+        """
+        Expand {(delay_key, watch_key): delay_seconds} into one value per row.
+        Only the entries present in the realtime feed are visited.
+        """
+        row_delays = np.zeros(len(self.seconds), dtype=np.int32)
+        for key, delay_seconds in delays.items():
+            rows = self._rows_by_trip.get(key)
+            if rows is not None:
+                row_delays[rows] = delay_seconds
+        return row_delays
+
+    def service_mask(self, active_services):
+        """Boolean row mask of the services running today (None: all)."""
+        if active_services is None:
+            return None
+        active = np.fromiter(
+            (service_id in active_services for service_id in self.service_ids),
+            dtype=bool,
+            count=len(self.service_ids),
+        )
+        return active[self.services]
+
+
+class ServiceCalendar:
+    """
+    Weekly services (calendar.txt) and their exceptions (calendar_dates.txt)
+    of one feed. ``active()`` gives the service_ids running on a day,
+    computed once per day.
+    """
+
+    def __init__(self, weekly, exceptions):
+        self.weekly = weekly          # service_id -> (start date, end date, running weekdays)
+        self.exceptions = exceptions  # date -> {service_id: added (True) / removed (False)}
+        self._lock = threading.Lock()
+        self._day = None
+        self._active = None
+
+    def __len__(self):
+        return len(self.weekly) + len(self.exceptions)
+
+    def _compute(self, day):
+        weekday = day.weekday()
+        active = {
+            service_id for service_id, (start, end, weekdays) in self.weekly.items()
+            if start <= day <= end and weekday in weekdays
+        }
+        for service_id, added in self.exceptions.get(day, {}).items():
+            if added:
+                active.add(service_id)
+            else:
+                active.discard(service_id)
+        return frozenset(active)
+
+    def active(self, day=None):
+        """
+        service_ids running on ``day`` (today by default). None, meaning
+        every service, when the feed has no calendar or none of its services
+        runs that day (an expired feed): the schedule is better than nothing.
+        """
+        day = day or datetime.now().date()
+        with self._lock:
+            if day != self._day:
+                self._day = day
+                self._active = self._compute(day) if len(self) else None
+                if self._active is not None and not self._active:
+                    logger.warning("No service runs on %s in the GTFS calendar, showing every service", day)
+                    self._active = None
+            return self._active
+
+
+def _parse_date(value):
+    return datetime.strptime(value.strip(), "%Y%m%d").date()
+
+
+def load_service_calendar(gtfs_dir):
+    """ServiceCalendar of the calendar.txt / calendar_dates.txt of ``gtfs_dir`` (either may be missing)."""
+    weekly = {}
+    exceptions = {}
+    try:
+        with open(os.path.join(gtfs_dir, "calendar.txt"), "r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                try:
+                    weekdays = frozenset(i for i, name in enumerate(WEEKDAYS) if row[name].strip() == "1")
+                    weekly[row["service_id"]] = (_parse_date(row["start_date"]), _parse_date(row["end_date"]), weekdays)
+                except (KeyError, ValueError) as e:
+                    logger.error("Error parsing calendar.txt row for service_id %s: %s", row.get("service_id"), e)
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(gtfs_dir, "calendar_dates.txt"), "r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                try:
+                    # exception_type 1 adds the service that day, 2 removes it
+                    exceptions.setdefault(_parse_date(row["date"]), {})[row["service_id"]] = row["exception_type"].strip() == "1"
+                except (KeyError, ValueError) as e:
+                    logger.error("Error parsing calendar_dates.txt row for service_id %s: %s", row.get("service_id"), e)
+    except OSError:
+        pass
+    return ServiceCalendar(weekly, exceptions)
+
+
+def build_departure_board(rows, delay_key=None):
+    """
+    Build a DepartureBoard from (watch_key, seconds, trip_id, service_id) rows,
+    where seconds is the scheduled GTFS time (hours may exceed 23).
+    ``delay_key(trip_id)`` gives the id realtime delays are keyed by
+    (defaults to the trip_id itself).
+    """
+    by_key = {}
+    for watch_key, seconds, trip_id, service_id in rows:
+        by_key.setdefault(watch_key, []).append((seconds, trip_id, service_id))
+
+    trip_index = {}
+    service_index = {}
+    seconds = []
+    trips = []
+    services = []
+    groups = {}
+    rows_by_trip = {}
+    for watch_key, entries in by_key.items():
+        start = len(seconds)
+        for sched_seconds, trip_id, service_id in entries:
+            row = len(seconds)
+            seconds.append(sched_seconds)
+            trips.append(trip_index.setdefault(trip_id, len(trip_index)))
+            services.append(service_index.setdefault(service_id, len(service_index)))
+            lookup = delay_key(trip_id) if delay_key else trip_id
+            rows_by_trip.setdefault((lookup, watch_key), []).append(row)
+        groups[watch_key] = slice(start, len(seconds))
+
+    return DepartureBoard(
+        keys=list(groups),
+        groups=groups,
+        seconds=np.asarray(seconds, dtype=np.int32),
+        trips=np.asarray(trips, dtype=np.int32),
+        services=np.asarray(services, dtype=np.int32),
+        trip_ids=list(trip_index),
+        service_ids=list(service_index),
+        rows_by_trip={k: np.asarray(v, dtype=np.int64) for k, v in rows_by_trip.items()},
+    )
+
+
+def remaining_seconds(scheduled_seconds, now_seconds, include_now=True):
+    """
+    Seconds until the next occurrence of each scheduled time of day.
+    With include_now=False a time equal to now rolls over to tomorrow.
+    """
+    remaining = (scheduled_seconds % SECONDS_PER_DAY - now_seconds) % SECONDS_PER_DAY
+    if not include_now:
+        remaining = np.where(remaining == 0, SECONDS_PER_DAY, remaining)
+    return remaining
+
+
+def next_departures(board, now_seconds, delays=None, active_services=None, include_now=True):
+    """
+    Pick the next scheduled departure of every watched key.
+
+    Returns {watch_key: dict} with the chosen row's trip_id, scheduled time of
+    day (seconds), minutes remaining to the scheduled time, realtime delay in
+    seconds and at-stop flag. Keys without any running service are omitted.
+    """
+    if not len(board):
+        return {}
+
+    remaining = remaining_seconds(board.seconds, now_seconds, include_now)
+    minutes = remaining // 60
+    row_delays = board.delay_array(delays) if delays else np.zeros(len(board), dtype=np.int32)
+    at_stop = minutes < AT_STOP_MINUTES
+
+    mask = board.service_mask(active_services)
+    if mask is not None:
+        remaining = np.where(mask, remaining, np.iinfo(remaining.dtype).max)
+
+    results = {}
+    for watch_key, group in board.groups.items():
+        group_remaining = remaining[group]
+        if not len(group_remaining):
+            continue
+        best = int(np.argmin(group_remaining))
+        row = group.start + best
+        if mask is not None and not mask[row]:
+            continue
+        results[watch_key] = {
+            "trip_id": board.trip_ids[board.trips[row]],
+            "scheduled_seconds": int(board.seconds[row] % SECONDS_PER_DAY),
+            "minutes_remaining": int(minutes[row]),
+            "delay_seconds": int(row_delays[row]),
+            "at_stop": bool(at_stop[row]),
+        }
+    return results
@@ -0,0 +1,654 @@
+# display.py
+"""
+Data pipeline behind /api/data: static GTFS tables, upstream fetches, the
+processing of each feed and the caches kept between requests.
+
+main.py imports this module lazily (in the warm-up thread), so the server
+binds before NumPy, protobuf and requests are loaded.
+"""
+import os, time, json, logging, atexit
+
+from .config            import WEATHER_API_KEY, WEATHER_API_BASE, STM_GTFS_DIR, EXO_GTFS_DIR
+from .config            import LAST_GOOD_MAX_AGE, SNAPSHOT_MAX_AGE, SNAPSHOT_WEATHER_MAX_AGE
+from .utils             import is_service_unavailable, optional_mtime
+from .feeds             import fetch, export_last_good, import_last_good
+from .snapshots         import save_snapshot, load_snapshot, encode_bytes, decode_bytes
+from .departures        import load_service_calendar
+from .geo               import load_stop_index
+from .shapes            import load_shapes
+from .eta               import stm_eta, exo_eta
+from .                   import metrics
+
+from .loaders.stm       import (
+    fetch_stm_alerts,
+    fetch_stm_realtime_data,
+    fetch_stm_positions_dict,
+    load_stm_gtfs_trips,
+    load_stm_stop_times,
+    load_stm_routes,
+    build_stm_departure_board,
+    build_stm_trip_stops,
+    track_stm_vehicles,
+    process_stm_trip_updates,
+    debug_print_stm_occupancy_status,
+    STM_WATCHED_ROUTES,
+)
+
+from .loaders.exo       import (
+    fetch_exo_alerts,
+    fetch_exo_realtime_data,
+    load_exo_gtfs_trips,
+    load_exo_stop_times,
+    index_exo_stop_times,
+    index_exo_watched_arrivals,
+    build_exo_departure_board,
+    build_exo_trip_stops,
+    track_exo_vehicles,
+    EXO_WATCHED_ROUTES,
+    process_exo_vehicle_positions,
+    process_exo_train_schedule_with_occupancy,
+    chrono_feed_state,
+)
+
+from .managers.message_manager import message_store
+from .alerts            import (
+    AlertIndex,
+    STM_DIRECTION_CODES,
+    alert_schedule,
+    alert_tracker,
+    custom_active_periods,
+    process_stm_alerts,
+    process_exo_alerts,
+    says_normal_service,
+)
+
+logger = logging.getLogger('BdeB-GTFS')
+
+
+_weather_cache = {
+    "ts":   0,     # last fetch timestamp
+    "data": None,  # cached weather dict
+    "fetched_at": None,  # when data was fetched (None: never)
+}
+
+CACHE_TTL = 5 * 60  # seconds (5 minutes)
+
+_chrono_cache = {
+    "timestamp": 0,
+    "data": None
+}
+# How long processed trains are reused; the Chrono request budget itself is
+# enforced by the endpoint guards in feeds.py, which serve the last good feed
+CHRONO_CACHE_TTL = 15
+
+# ─── last-known-good snapshot (see snapshots.py) ──────────────
+snapshot_ages = {}  # entry name -> age in seconds when restored
+
+def snapshot_max_age(name):
+    """How old a restored entry may be (-1: never restored, e.g. the "chrono_trains" of older snapshots)."""
+    if name.startswith("feed:"):
+        return LAST_GOOD_MAX_AGE
+    if name == "weather":
+        return SNAPSHOT_WEATHER_MAX_AGE
+    if name == "eta_history":
+        return SNAPSHOT_MAX_AGE
+    return -1
+
+def snapshot_entries():
+    """
+    Caches worth keeping across a restart, as snapshot entries. The
+    processed trains are not kept: their minutes and delays are only right
+    when computed, so they are rebuilt from the (restored) feeds.
+    """
+    entries = {}
+    if _weather_cache["data"] and _weather_cache["fetched_at"]:
+        entries["weather"] = {"ts": _weather_cache["fetched_at"], "data": _weather_cache["data"]}
+    entries["eta_history"] = {"ts": time.time(), "data": {"stm": stm_eta.export_history(), "exo": exo_eta.export_history()}}
+    for source, (status_code, content, fetched_at) in export_last_good().items():
+        entries[f"feed:{source}"] = {"ts": fetched_at, "data": {"status": status_code, "body": encode_bytes(content)}}
+    return entries
+
+def restore_snapshot():
+    """
+    Warm the caches from the last snapshot and save a new one at exit;
+    returns the age of each restored entry (also kept in snapshot_ages).
+    Each entry is dropped past its own snapshot_max_age.
+    """
+    entries = {name: entry for name, entry in load_snapshot().items() if entry["age"] <= snapshot_max_age(name)}
+    if "weather" in entries:
+        _weather_cache.update(ts=entries["weather"]["ts"], data=entries["weather"]["data"],
+                              fetched_at=entries["weather"]["ts"])
+    if "eta_history" in entries:
+        stm_eta.import_history(entries["eta_history"]["data"].get("stm", []))
+        exo_eta.import_history(entries["eta_history"]["data"].get("exo", []))
+    responses = {}
+    for name, entry in entries.items():
+        if name.startswith("feed:"):
+            data = entry["data"]
+            responses[name[len("feed:"):]] = (data["status"], decode_bytes(data["body"]), entry["ts"])
+    import_last_good(responses)
+    atexit.register(lambda: save_snapshot(snapshot_entries, force=True))
+    snapshot_ages.clear()
+    snapshot_ages.update((name, round(entry["age"], 1)) for name, entry in entries.items())
+    return snapshot_ages
+
+# ====================================================================
+# Static GTFS data, loaded by main.warm_up() (see /readyz)
+# ====================================================================
+stm_routes_fp      = os.path.join(STM_GTFS_DIR, "routes.txt")
+stm_trips_fp       = os.path.join(STM_GTFS_DIR, "trips.txt")
+stm_stop_times_fp  = os.path.join(STM_GTFS_DIR, "stop_times.txt")
+stm_stops_fp       = os.path.join(STM_GTFS_DIR, "stops.txt")
+stm_shapes_fp      = os.path.join(STM_GTFS_DIR, "shapes.txt")
+exo_trips_fp       = os.path.join(EXO_GTFS_DIR, "trips.txt")
+exo_stop_times_fp  = os.path.join(EXO_GTFS_DIR, "stop_times.txt")
+exo_stops_fp       = os.path.join(EXO_GTFS_DIR, "stops.txt")
+exo_shapes_fp      = os.path.join(EXO_GTFS_DIR, "shapes.txt")
+exo_calendar_fps   = (os.path.join(EXO_GTFS_DIR, "calendar.txt"), os.path.join(EXO_GTFS_DIR, "calendar_dates.txt"))
+
+_stm_static = {}
+_exo_static = {}
+
+def load_static_data():
+    """Load and index the STM and Exo static GTFS tables."""
+    routes_map = load_stm_routes(stm_routes_fp)
+    trips = load_stm_gtfs_trips(stm_trips_fp, routes_map)
+    stop_times = load_stm_stop_times(stm_stop_times_fp)
+    stops = load_stop_index(stm_stops_fp)
+    # Shapes of the watched routes only (the STM shapes.txt covers the whole network)
+    shapes = load_shapes(stm_shapes_fp, {
+        trip.shape_id for trip in trips.values() if trip.route_id in STM_WATCHED_ROUTES and trip.shape_id
+    })
+    stm_eta.shapes = shapes
+    _stm_static.update(
+        trips=trips,
+        stop_times=stop_times,
+        departures=build_stm_departure_board(trips, stop_times),
+        stops=stops,
+        shapes=shapes,
+        eta_trips=build_stm_trip_stops(trips, stop_times, stops, shapes),
+        calendar=load_service_calendar(STM_GTFS_DIR),
+    )
+    get_exo_static()
+
+def get_exo_static():
+    """
+    Return the Exo static tables, reloading and re-indexing them only when
+    trips.txt, stop_times.txt, stops.txt, shapes.txt or the calendar changed
+    on disk (e.g. after a GTFS update).
+    """
+    try:
+        mtimes = (os.path.getmtime(exo_trips_fp), os.path.getmtime(exo_stop_times_fp),
+                  optional_mtime(exo_stops_fp), optional_mtime(exo_shapes_fp),
+                  *(optional_mtime(fp) for fp in exo_calendar_fps))
+    except OSError:
+        return _exo_static
+    if mtimes != _exo_static.get("mtimes"):
+        trips = load_exo_gtfs_trips(exo_trips_fp)
+        stop_times = load_exo_stop_times(exo_stop_times_fp)
+        stops = load_stop_index(exo_stops_fp)
+        # Shapes of the watched lines only
+        shapes = load_shapes(exo_shapes_fp, {
+            trip.shape_id for trip in trips.values() if trip.route_id in EXO_WATCHED_ROUTES and trip.shape_id
+        })
+        exo_eta.shapes = shapes
+        _exo_static.update(
+            mtimes=mtimes,
+            trips=trips,
+            stop_times=stop_times,
+            trip_stops=index_exo_stop_times(stop_times),
+            watched_arrivals=index_exo_watched_arrivals(stop_times),
+            departures=build_exo_departure_board(stop_times, trips),
+            stops=stops,
+            shapes=shapes,
+            eta_trips=build_exo_trip_stops(stop_times, trips, stops, shapes),
+            calendar=load_service_calendar(EXO_GTFS_DIR),
+        )
+    return _exo_static
+
+def debug_occupancy(desired):
+    debug_print_stm_occupancy_status(desired, _stm_static["trips"])
+
+def get_weather():
+    """Fetch weather from WeatherAPI at most once per CACHE_TTL."""
+    now = time.time()
+    # if cache is stale, refresh it
+    if now - _weather_cache["ts"] > CACHE_TTL:
+        metrics.inc("bdeb_cache_requests_total", cache="weather", result="miss")
+        try:
+            resp = fetch(
+                "weather",
+                f"{WEATHER_API_BASE}/current.json"
+                f"?key={WEATHER_API_KEY}"
+                "&q=Montreal,QC"
+                "&aqi=no"
+                "&lang=fr",
+                timeout=5
+            ).json()
+            _weather_cache["data"] = {
+                "icon": "https:" + resp["current"]["condition"]["icon"],
+                "text":  resp["current"]["condition"]["text"],
+                "temp":  int(round(resp["current"]["temp_c"])),
+            }
+            _weather_cache["fetched_at"] = now
+        except Exception:
+            # leave last good data or None
+            pass
+        _weather_cache["ts"] = now
+    else:
+        metrics.inc("bdeb_cache_requests_total", cache="weather", result="hit")
+
+    return _weather_cache["data"] or {"icon":"", "text":"", "temp":""}
+
+# ====================================================================
+# Metro Alerts Processing Functions
+# ====================================================================
+def process_metro_alerts():
+    """
+    Fetch and process metro line alerts from STM API.
+    Returns a list of metro lines with their current status.
+    """
+    try:
+        alerts_data = fetch_stm_alerts()
+        if not alerts_data:
+            logger.warning("No metro alerts data received")
+            return get_default_metro_status()
+        
+        # Handle case where alerts_data might be a string (JSON string)
+        if isinstance(alerts_data, str):
+            try:
+                alerts_data = json.loads(alerts_data)
+            except json.JSONDecodeError as e:
+                logger.error("Failed to parse alerts_data as JSON: %s", e)
+                return get_default_metro_status()
+        
+        # Handle different response formats from STM API
+        alerts_list = []
+        if isinstance(alerts_data, dict):
+            # If it's a dict, look for common keys that contain the alerts list
+            if 'alerts' in alerts_data:
+                alerts_list = alerts_data['alerts']
+            elif 'entity' in alerts_data:
+                alerts_list = alerts_data['entity']
+            elif 'data' in alerts_data:
+                alerts_list = alerts_data['data']
+            else:
+                # If none of the common keys exist, treat the dict as a single alert
+                alerts_list = [alerts_data]
+        elif isinstance(alerts_data, list):
+            alerts_list = alerts_data
+        else:
+            logger.error("Unexpected alerts_data type: %s", type(alerts_data))
+            return get_default_metro_status()
+        
+        logger.debug("Processing %d alerts for metro status", len(alerts_list))
+        
+        # Initialize metro lines with default normal status
+        metro_status = {
+            "1": {
+                "name": "Ligne 1",
+                "color": "Verte", 
+                "status": "Service normal du métro",
+                "statusColor": "text-green-400",
+                "icon": "green-line",
+                "is_normal": True
+            },
+            "2": {
+                "name": "Ligne 2",
+                "color": "Orange",
+                "status": "Service normal du métro", 
+                "statusColor": "text-green-400",
+                "icon": "orange-line",
+                "is_normal": True
+            },
+            "4": {
+                "name": "Ligne 4", 
+                "color": "Jaune",
+                "status": "Service normal du métro",
+                "statusColor": "text-green-400", 
+                "icon": "yellow-line",
+                "is_normal": True
+            },
+            "5": {
+                "name": "Ligne 5",
+                "color": "Bleue", 
+                "status": "Service normal du métro",
+                "statusColor": "text-green-400",
+                "icon": "blue-line", 
+                "is_normal": True
+            }
+        }
+        
+        # Process alerts from API
+        for alert in alerts_list:
+            try:
+                # Ensure alert is a dictionary
+                if not isinstance(alert, dict):
+                    logger.warning("Expected alert to be a dict, got %s: %s", type(alert), alert)
+                    continue
+                
+                # Check if alert has informed_entities for metro lines
+                informed_entities = alert.get("informed_entities", [])
+                if not isinstance(informed_entities, list):
+                    continue
+                    
+                for entity in informed_entities:
+                    if not isinstance(entity, dict):
+                        continue
+                        
+                    route_short_name = entity.get("route_short_name")
+                    
+                    # Only process metro lines (1, 2, 4, 5)
+                    if route_short_name in ["1", "2", "4", "5"]:
+                        # Get French description text
+                        description_texts = alert.get("description_texts", [])
+                        if not isinstance(description_texts, list):
+                            continue
+                            
+                        french_description = None
+                        
+                        for desc in description_texts:
+                            if isinstance(desc, dict) and desc.get("language") == "fr":
+                                french_description = desc.get("text", "")
+                                break
+                        
+                        if french_description:
+                            # Check if it's a normal service message
+                            # The text is the line status itself, so it decides (not the effect)
+                            is_normal_service = says_normal_service(french_description)
+                            
+                            metro_status[route_short_name]["status"] = french_description
+                            metro_status[route_short_name]["is_normal"] = is_normal_service
+                            metro_status[route_short_name]["statusColor"] = "text-green-400" if is_normal_service else "text-red-400"
+                            
+                            logger.debug("Updated metro line %s: %.50s...", route_short_name, french_description)
+                            
+            except Exception as e:
+                logger.error("Error processing individual metro alert: %s", e)
+                logger.error("Alert data: %s", alert)
+                continue
+        
+        # Convert to list format expected by frontend
+        metro_lines = []
+        for line_id, line_data in metro_status.items():
+            metro_lines.append({
+                "id": int(line_id),
+                "name": line_data["name"],
+                "color": line_data["color"],
+                "status": line_data["status"],
+                "statusColor": line_data["statusColor"],
+                "icon": line_data["icon"],
+                "is_normal": line_data["is_normal"]
+            })
+        
+        # Sort by line ID to maintain consistent order
+        metro_lines.sort(key=lambda x: x["id"])
+        
+        logger.info("Processed %d metro lines with alerts", len(metro_lines), extra={"sample": "metro_lines_processed"})
+        return metro_lines
+        
+    except Exception as e:
+        logger.error("Error in process_metro_alerts: %s", e)
+        logger.error("alerts_data type: %s", type(alerts_data) if 'alerts_data' in locals() else 'undefined')
+        return get_default_metro_status()
+
+def get_default_metro_status():
+    """
+    Returns default metro status when API is unavailable.
+    """
+    return [
+        {
+            "id": 1,
+            "name": "Ligne 1",
+            "color": "Verte",
+            "status": "Données non disponibles pour le moment",
+            "statusColor": "text-green-400",
+            "icon": "green-line",
+            "is_normal": True
+        },
+        {
+            "id": 2,
+            "name": "Ligne 2", 
+            "color": "Orange",
+            "status": "Données non disponibles pour le moment",
+            "statusColor": "text-green-400",
+            "icon": "orange-line",
+            "is_normal": True
+        },
+        {
+            "id": 4,
+            "name": "Ligne 4",
+            "color": "Jaune", 
+            "status": "Données non disponibles pour le moment",
+            "statusColor": "text-green-400",
+            "icon": "yellow-line",
+            "is_normal": True
+        },
+        {
+            "id": 5,
+            "name": "Ligne 5",
+            "color": "Bleue",
+            "status": "Données non disponibles pour le moment", 
+            "statusColor": "text-green-400",
+            "icon": "blue-line",
+            "is_normal": True
+        }
+    ]
+
+# ====================================================================
+# Merge STM alerts into bus rows and update location styling
+# ====================================================================
+def merge_alerts_into_buses(buses, alert_index):
+    """
+    For each bus row, look up the STM alerts registered in ``alert_index``
+    (an AlertIndex) for its route, stop and direction. If the alert
+    badge (see alerts.CATEGORY_BADGES) is "annule", "deplace" or "relocalise",
+    append a styled HTML badge next to the bus's location.
+    """
+    for bus in buses:
+        route_id = bus.get("route_id", "").strip()
+        stop_id = str(bus.get("stop_id", "")).strip()
+        direction = STM_DIRECTION_CODES.get(bus.get("direction"))
+        bus_location = bus.get("location", "").strip()
+        for alert in alert_index.lookup("stm", route_id, stop_id, direction):
+            if not alert_schedule.is_active(alert):
+                continue  # starts later (or already over)
+            badge = alert.get("badge")
+            if badge == "deplace":
+                bus["location"] = f"{bus_location} <span class='alert-badge alert-deplace'>Arrêt déplacé</span>"
+                break
+            elif badge == "relocalise":
+                bus["location"] = f"{bus_location} <span class='alert-badge alert-relocalise'>Arrêt relocalisé</span>"
+                break
+            elif badge == "annule":
+                bus["location"] = f"{bus_location} <span class='alert-badge alert-annule'>Arrêt annulé</span>"
+                bus["canceled"] = True
+                break
+    return buses
+
+# ====================================================================
+# Custom messages (admin console), scheduled with the feed alerts
+# ====================================================================
+def schedule_custom_messages(generation, messages):
+    """MessageStore subscriber: reschedule the custom messages on every change."""
+    # Custom messages are kept as they are (including keys such as status and scheduledTime)
+    alert_schedule.replace("custom", ((c, custom_active_periods(c)) for c in messages if isinstance(c, dict)))
+    logger.debug("Custom messages generation %d scheduled (%d messages)", generation, len(messages))
+
+message_store.subscribe(schedule_custom_messages)
+schedule_custom_messages(message_store.generation, message_store.messages())
+
+# ====================================================================
+# /api/data payload: buses, trains, metro, and alerts
+# ====================================================================
+def build_display_data():
+    """Fetch, process and merge every feed into the /api/data payload."""
+    api_debug = {
+        "called_at": time.strftime('%H:%M:%S'),
+        "endpoint": "/api/data"
+    }    
+    timer = metrics.StageTimer()
+    # ========== ALERTS ==========
+    stm_alert_json = fetch_stm_alerts()
+    timer.lap("fetch_stm_alerts")
+    alert_index = AlertIndex()
+    processed_stm = process_stm_alerts(stm_alert_json, WEATHER_API_KEY, alert_index) if stm_alert_json else []
+    timer.lap("process_stm_alerts")
+
+    exo_alert_entities = fetch_exo_alerts()
+    timer.lap("fetch_exo_alerts")
+    metrics.inc("bdeb_entities_total", len(exo_alert_entities) if exo_alert_entities else 0, feed="chrono_alerts")
+    logger.debug("EXO alerts returned: %d entities", len(exo_alert_entities) if exo_alert_entities else 0)
+    processed_exo = process_exo_alerts(exo_alert_entities, alert_index)
+    timer.lap("process_exo_alerts")
+    logger.debug("Processed EXO alerts: %d alerts", len(processed_exo))
+    # Feed alerts go to the schedule with their active periods; a feed that
+    # did not answer keeps its last alerts until they expire
+    if stm_alert_json is not None:
+        alert_schedule.replace("stm", ((alert, alert.get("active_periods", ())) for alert in processed_stm))
+    if exo_alert_entities is not None:
+        alert_schedule.replace("exo", ((alert, alert["active_periods"]) for alert in processed_exo))
+    message_store.check_disk()
+    filtered_alerts = alert_schedule.active()
+
+    # Start/end events, only for feeds that answered (an outage is not an end)
+    if stm_alert_json is not None:
+        alert_tracker.update("stm", [alert for alert in processed_stm if alert_schedule.is_active(alert)])
+    if exo_alert_entities is not None:
+        alert_tracker.update("exo", [alert for alert in processed_exo if alert_schedule.is_active(alert)])
+    timer.lap("custom_messages")
+
+    # ========== STM BUSES ==========
+    stm_trip_entities = fetch_stm_realtime_data()
+    timer.lap("fetch_stm_trip_updates")
+    metrics.inc("bdeb_entities_total", len(stm_trip_entities), feed="stm_trip_updates")
+    positions_dict = fetch_stm_positions_dict(["171", "180", "164"], _stm_static["trips"])
+    timer.lap("fetch_stm_vehicle_positions")
+    metrics.inc("bdeb_entities_total", len(positions_dict), feed="stm_vehicle_positions")
+    track_stm_vehicles(positions_dict, _stm_static["eta_trips"], stm_eta)
+    timer.lap("track_stm_vehicles")
+    buses = process_stm_trip_updates(
+        stm_trip_entities,
+        _stm_static["trips"],
+        _stm_static["stop_times"],
+        positions_dict,
+        _stm_static["departures"],
+        _stm_static["stops"],
+        stm_eta,
+        _stm_static["calendar"],
+    )
+    timer.lap("process_stm_trip_updates")
+
+    if logger.isEnabledFor(logging.DEBUG):
+        status_map = {0: "INCOMING_AT", 1: "STOPPED_AT", 2: "IN_TRANSIT_TO"}
+        for b in buses:
+            raw_stat = b.get("current_status")
+            if isinstance(raw_stat, int):
+                stat_str = status_map.get(raw_stat, f"Unknown({raw_stat})")
+            else:
+                stat_str = str(raw_stat)
+            logger.debug(
+                "Merged STM bus", extra={"fields": {
+                    "route": b["route_id"], "trip": b["trip_id"], "stop": b["stop_id"],
+                    "arrival": b["arrival_time"], "occupancy": b["occupancy"], "at_stop": b["at_stop"],
+                    "lat": b.get("lat"), "lon": b.get("lon"), "dist_m": b.get("distance_m"),
+                    "current_status": stat_str,
+                }}
+            )
+
+    # Merge alerts into bus rows – update bus location with styled alert badges.
+    buses = merge_alerts_into_buses(buses, alert_index)
+    timer.lap("merge_bus_alerts")
+
+    # ========== EXO TRAINS WITH CACHING ==========
+    current_time = time.time()
+    
+    if current_time - _chrono_cache["timestamp"] < CHRONO_CACHE_TTL and _chrono_cache["data"]:
+        exo_trains = _chrono_cache["data"]
+        api_debug["chrono_cache"] = "using_cache"
+        metrics.inc("bdeb_cache_requests_total", cache="chrono", result="hit")
+    else:
+        # Fetch data
+        exo_static = get_exo_static()
+        fresh_exo_trips = exo_static["trips"]
+        fresh_exo_stop_times = exo_static["stop_times"]
+
+        exo_trip_updates, exo_vehicle_positions = fetch_exo_realtime_data()
+        timer.lap("fetch_chrono_realtime")
+        metrics.inc("bdeb_entities_total", len(exo_trip_updates), feed="chrono_trip_updates")
+        metrics.inc("bdeb_entities_total", len(exo_vehicle_positions), feed="chrono_vehicle_positions")
+        
+        if len(exo_trip_updates) > 0 or len(exo_vehicle_positions) > 0:
+            metrics.inc("bdeb_cache_requests_total", cache="chrono", result="miss")
+            track_exo_vehicles(exo_vehicle_positions, exo_static["eta_trips"], exo_eta)
+            exo_vehicle_data = process_exo_vehicle_positions(exo_vehicle_positions, fresh_exo_stop_times, exo_static["stops"], exo_static["watched_arrivals"])
+            timer.lap("process_exo_vehicle_positions")
+            exo_trains = process_exo_train_schedule_with_occupancy(
+                fresh_exo_stop_times,
+                fresh_exo_trips,
+                exo_vehicle_data,
+                exo_trip_updates,
+                exo_static["trip_stops"],
+                exo_static["departures"],
+                exo_static["shapes"],
+                exo_static["stops"],
+                exo_eta,
+                exo_static["calendar"],
+            )
+            timer.lap("process_exo_train_schedule")
+            _chrono_cache["data"] = exo_trains
+            _chrono_cache["timestamp"] = current_time
+            api_debug["chrono_cache"] = f"fresh_data_{len(exo_trip_updates)}trips_{len(exo_vehicle_positions)}vehicles"
+        else:
+            # No usable feed (held back with nothing recent, or failing):
+            # recompute from the static schedule, with the trains last seen
+            # estimated from their position, rather than re-serving the
+            # minutes and delays of the last good trains as they were
+            metrics.inc("bdeb_cache_requests_total", cache="chrono",
+                        result="stale" if _chrono_cache["data"] else "static_fallback")
+            exo_vehicle_data = process_exo_vehicle_positions([], fresh_exo_stop_times, watched_arrivals=exo_static["watched_arrivals"])
+            exo_trains = process_exo_train_schedule_with_occupancy(
+                fresh_exo_stop_times,
+                fresh_exo_trips,
+                exo_vehicle_data,
+                [],
+                exo_static["trip_stops"],
+                exo_static["departures"],
+                exo_static["shapes"],
+                exo_static["stops"],
+                exo_eta,
+                exo_static["calendar"],
+            )
+            api_debug["chrono_cache"] = "rate_limited_estimated"
+            timer.lap("process_exo_train_schedule")
+    
+    if is_service_unavailable():
+        for train in exo_trains:
+            train["no_service_text"] = "Aucun service aujourd'hui"
+            train["arrival_time"] = "N/A"
+            train["delayed_text"] = None
+            train["early_text"] = None
+
+    # ========== METRO LINES ==========
+    metro_lines = process_metro_alerts()
+    timer.lap("metro_status")
+
+    weather = get_weather()
+    timer.lap("weather")
+
+    save_snapshot(snapshot_entries)
+
+    return {       
+        "buses": buses,
+        "next_trains": exo_trains,
+        "metro_lines": metro_lines,
+        "current_time": time.strftime("%I:%M:%S %p"),
+        "alerts": filtered_alerts,
+        "alert_events": alert_tracker.events(),
+        "weather": weather,
+        "data_age": {
+            "chrono": dict(chrono_feed_state),
+            "weather": {"age_seconds": round(time.time() - _weather_cache["fetched_at"], 1)
+                        if _weather_cache["fetched_at"] else None},
+        },
+    }
@@ -0,0 +1,233 @@
+# eta.py
+"""
+Arrival estimates for vehicles without a realtime prediction for our stop.
+
+Each watched trip is described once (TripStops): its stops in order with
+their scheduled arrival and coordinates. On every refresh the latest
+position of each vehicle is located on its trip: the segment (stop i to
+i + 1) it is on and the fraction of it done, from the distances to all the
+stops of the trip in one array operation (or from its shape, when the trip
+has one).
+
+The time left to a stop is the rest of the current segment plus the
+following segments, each taken from the learned travel time of that
+segment (an exponential moving average of the times observed when vehicles
+pass from stop to stop) or from the schedule until ETA_MIN_SAMPLES were
+seen. The time elapsed since the position fix is subtracted, so a position
+kept from a feed that is now held back still gives a usable estimate for
+ETA_MAX_FIX_AGE seconds.
+
+The learned times are kept in the snapshot (see display.snapshot_entries).
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from .geo import haversine_m
+from . import metrics
+
+import logging
+logger = logging.getLogger('BdeB-GTFS.eta')
+
+ETA_HISTORY_ALPHA = 0.2      # weight of a new observation in the moving average
+ETA_MIN_SAMPLES = 3          # observations before a segment's learned time is used
+ETA_MIN_SEGMENT_S = 20       # floor for segments scheduled at 0 s
+ETA_MAX_FIX_AGE = 10 * 60    # older positions are not used
+ETA_MAX_PASS_GAP = 30 * 60   # longer gaps between two stops are not learned
+ETA_MAX_DETOUR_M = 1500      # farther off the line of its stops, the vehicle is not on this trip
+ETA_FORGET_AFTER = 2 * 3600  # vehicles not seen for this long are dropped
+
+
+@dataclass(slots=True, eq=False)
+class TripStops:
+    route_id: str
+    stop_ids: tuple          # external stop ids, in stop_sequence order
+    index: dict              # stop_id -> position in stop_ids
+    scheduled: np.ndarray    # scheduled arrival (seconds after midnight), int32
+    lat: np.ndarray          # stop coordinates (NaN when unknown), float64
+    lon: np.ndarray
+    seg_m: np.ndarray        # straight-line length of each segment
+    shape_id: str | None = None
+    along_m: np.ndarray | None = None  # distance of each stop along the shape
+
+
+def build_trip_stops(route_id, stops, stop_index, shape_id=None, shapes=None):
+    """
+    TripStops of a trip from its [(stop_id, scheduled_seconds), ...] in
+    order; coordinates come from a geo.StopIndex, stop distances from a
+    shapes.ShapeIndex when the trip has a shape.
+    """
+    stop_ids = tuple(stop_id for stop_id, _ in stops)
+    positions = [stop_index.position(stop_id) if stop_index is not None else None for stop_id in stop_ids]
+    lat = np.array([p[0] if p else np.nan for p in positions], dtype=np.float64)
+    lon = np.array([p[1] if p else np.nan for p in positions], dtype=np.float64)
+    along = None
+    if shapes is not None and shape_id in shapes:
+        along = np.array([
+            np.nan if (a := shapes.stop_along(shape_id, stop_id, stop_index)) is None else a
+            for stop_id in stop_ids
+        ], dtype=np.float64)
+        # a usable shape gives increasing distances for the stops it knows
+        known = along[~np.isnan(along)]
+        if len(known) < 2 or np.any(np.diff(known) < 0):
+            along = None
+    return TripStops(
+        route_id=route_id,
+        stop_ids=stop_ids,
+        index={stop_id: i for i, stop_id in enumerate(stop_ids)},
+        scheduled=np.array([seconds for _, seconds in stops], dtype=np.int32),
+        lat=lat,
+        lon=lon,
+        seg_m=haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:]),
+        shape_id=shape_id if along is not None else None,
+        along_m=along,
+    )
+
+
+@dataclass(slots=True, frozen=True)
+class Progress:
+    trip: TripStops
+    segment: int      # the vehicle is between stop ``segment`` and the next one
+    fraction: float   # share of that segment done
+    fix_ts: float     # unix time of the position
+
+
+def locate(trip, lat, lon, shapes=None):
+    """(segment, fraction) of a position on its trip, None if it cannot be placed."""
+    n = len(trip.stop_ids)
+    if n < 2 or lat is None or lon is None:
+        return None
+    if trip.along_m is not None and shapes is not None:
+        projection = shapes.project(trip.shape_id, lat, lon)
+        if projection is not None:
+            along = trip.along_m
+            known = ~np.isnan(along)
+            rows = np.flatnonzero(known)
+            k = int(np.searchsorted(along[known], projection.along_m, side="right")) - 1
+            if 0 <= k < len(rows) - 1:
+                start, end = rows[k], rows[k + 1]
+                span = along[end] - along[start]
+                done = (projection.along_m - along[start]) / span if span > 0 else 0.0
+                # stops without a distance in between share the span evenly
+                position = start + done * (end - start)
+                segment = min(int(position), n - 2)
+                return segment, float(position - segment)
+
+    distances = haversine_m(lat, lon, trip.lat, trip.lon)
+    detour = distances[:-1] + distances[1:] - trip.seg_m
+    if np.isnan(detour).all():
+        return None
+    segment = int(np.nanargmin(detour))
+    if detour[segment] > ETA_MAX_DETOUR_M:
+        return None
+    before, after = distances[segment], distances[segment + 1]
+    fraction = before / (before + after) if before + after > 0 else 0.0
+    return segment, float(fraction)
+
+
+class EtaEstimator:
+    """
+    Latest progress of the vehicles of one feed and learned segment times.
+    ``observe`` is called with every position, ``estimate`` for the stops
+    without a prediction.
+    """
+
+    def __init__(self, feed, shapes=None):
+        self.feed = feed
+        self.shapes = shapes
+        self._lock = threading.Lock()
+        self._segments = {}  # (route_id, from_stop, to_stop) -> [seconds, samples]
+        self._passes = {}    # vehicle key -> (trip, segment, unix time entered, exact)
+        self._latest = {}    # vehicle key -> Progress
+
+    def segment_seconds(self, trip, segment):
+        """Expected travel time from stop ``segment`` to the next one."""
+        learned = self._segments.get((trip.route_id, trip.stop_ids[segment], trip.stop_ids[segment + 1]))
+        if learned is not None and learned[1] >= ETA_MIN_SAMPLES:
+            return learned[0]
+        return max(int(trip.scheduled[segment + 1]) - int(trip.scheduled[segment]), ETA_MIN_SEGMENT_S)
+
+    def _learn(self, trip, first, last, elapsed):
+        """Spread ``elapsed`` over segments first..last-1, in proportion to their expected times."""
+        expected = [self.segment_seconds(trip, s) for s in range(first, last)]
+        total = sum(expected)
+        for s, share in zip(range(first, last), expected):
+            sample = elapsed * share / total
+            key = (trip.route_id, trip.stop_ids[s], trip.stop_ids[s + 1])
+            learned = self._segments.get(key)
+            if learned is None:
+                self._segments[key] = [sample, 1]
+            else:
+                learned[0] += ETA_HISTORY_ALPHA * (sample - learned[0])
+                learned[1] += 1
+
+    def observe(self, key, trip, lat, lon, fix_ts=None):
+        """
+        Record the position of vehicle ``key`` on ``trip``; learns the time
+        between the stops it passed since the last position. Returns its
+        Progress, None if the position cannot be placed on the trip.
+        """
+        fix_ts = fix_ts or time.time()
+        placed = locate(trip, lat, lon, self.shapes)
+        if placed is None:
+            return None
+        segment, fraction = placed
+        progress = Progress(trip, segment, fraction, fix_ts)
+        with self._lock:
+            self._latest[key] = progress
+            previous = self._passes.get(key)
+            if previous is None or previous[0] is not trip:
+                self._passes[key] = (trip, segment, fix_ts, False)
+            elif segment > previous[1]:
+                # The vehicle passed stops previous+1..segment since the last entry
+                _, first, entered, exact = previous
+                if exact and 0 < fix_ts - entered <= ETA_MAX_PASS_GAP:
+                    self._learn(trip, first, segment, fix_ts - entered)
+                self._passes[key] = (trip, segment, fix_ts, True)
+        return progress
+
+    def progress(self, key, now=None):
+        """Latest Progress of a vehicle, None if unknown or older than ETA_MAX_FIX_AGE."""
+        now = now or time.time()
+        progress = self._latest.get(key)
+        if progress is None or now - progress.fix_ts > ETA_MAX_FIX_AGE:
+            return None
+        return progress
+
+    def estimate(self, progress, stop_id, now=None):
+        """Seconds until the vehicle reaches ``stop_id``, None if it is not ahead of it."""
+        now = now or time.time()
+        trip = progress.trip
+        target = trip.index.get(stop_id)
+        if target is None or target <= progress.segment:
+            return None
+        seconds = (1 - progress.fraction) * self.segment_seconds(trip, progress.segment)
+        for segment in range(progress.segment + 1, target):
+            seconds += self.segment_seconds(trip, segment)
+        metrics.inc("bdeb_eta_estimates_total", feed=self.feed)
+        return max(0.0, seconds - max(0.0, now - progress.fix_ts))
+
+    def prune(self, now=None):
+        """Forget vehicles not seen for ETA_FORGET_AFTER."""
+        now = now or time.time()
+        with self._lock:
+            for key in [k for k, p in self._latest.items() if now - p.fix_ts > ETA_FORGET_AFTER]:
+                del self._latest[key]
+                self._passes.pop(key, None)
+
+    def export_history(self):
+        """Learned segment times as [[route, from, to, seconds, samples], ...]."""
+        with self._lock:
+            return [[*key, round(value[0], 1), value[1]] for key, value in self._segments.items()]
+
+    def import_history(self, rows):
+        with self._lock:
+            for route_id, from_stop, to_stop, seconds, samples in rows:
+                self._segments[(route_id, from_stop, to_stop)] = [float(seconds), int(samples)]
+        return len(rows)
+
+
+stm_eta = EtaEstimator("stm")
+exo_eta = EtaEstimator("exo")
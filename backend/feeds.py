@@ -0,0 +1,443 @@
+# feeds.py
+"""
+Fetch layer for the upstream feeds (STM, Chrono, WeatherAPI).
+
+Every upstream GET goes through ``fetch(source, url, ...)``. FEED_MODE picks
+what happens:
+
+  live    plain HTTP request (default)
+  record  HTTP request, and the raw body is archived under FEED_ARCHIVE_DIR
+  replay  no network: the archived body matching the replay clock is served
+
+The archive holds one gzip file per response, ``<source>/<unix_ms>-<status>.gz``.
+The oldest files are removed once the archive grows past FEED_ARCHIVE_MAX_MB.
+In replay mode the clock starts at the first archived response and advances
+FEED_REPLAY_SPEED times faster than real time (looping with FEED_REPLAY_LOOP).
+
+Rate-limited endpoints use ``guarded_fetch``, which adds a request budget,
+Retry-After handling and a circuit breaker, and falls back to the last good
+response (see EndpointGuard) for at most LAST_GOOD_MAX_AGE seconds.
+
+    python -m backend.feeds     # summary of the archive
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from . import metrics
+from .config import (
+    FEED_MODE,
+    FEED_ARCHIVE_DIR,
+    FEED_ARCHIVE_MAX_MB,
+    FEED_REPLAY_SPEED,
+    FEED_REPLAY_LOOP,
+    CHRONO_REQUESTS_PER_MIN,
+    CHRONO_BURST,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_BACKOFF_BASE,
+    CIRCUIT_BACKOFF_MAX,
+    LAST_GOOD_MAX_AGE,
+)
+import logging
+logger = logging.getLogger('BdeB-GTFS.feeds')
+
+FEED_MODES = ("live", "record", "replay")
+
+_lock = threading.Lock()
+_archive_files = None  # [(unix_ms, size, path)] oldest first, while recording
+_archive_bytes = 0
+_replay_index = None   # {source: ([unix_ms], [path])}
+_replay_clock = {}     # start/end of the archive and when replay began
+
+
+class ArchivedResponse:
+    """The parts of requests.Response the loaders use, served from the archive."""
+
+    def __init__(self, status_code, content, recorded_at):
+        self.status_code = status_code
+        self.content = content
+        self.recorded_at = recorded_at
+        self.headers = {}
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} (replayed)", response=self)
+
+
+def fetch(source, url, headers=None, timeout=10):
+    """
+    GET an upstream feed. ``source`` names the feed in the archive, e.g.
+    "stm_trip_updates". Network errors propagate like requests.get.
+    """
+    if FEED_MODE == "replay":
+        response = _replay(source)
+        metrics.inc("bdeb_upstream_responses_total", source=source, status=response.status_code)
+        return response
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout)
+    except requests.exceptions.RequestException:
+        metrics.inc("bdeb_upstream_responses_total", source=source, status="error")
+        raise
+    finally:
+        metrics.observe("bdeb_upstream_seconds", time.perf_counter() - started, source=source)
+    metrics.inc("bdeb_upstream_responses_total", source=source, status=response.status_code)
+    if FEED_MODE == "record":
+        try:
+            record(source, response.status_code, response.content)
+        except OSError as e:
+            logger.error("Could not archive %s: %s", source, e)
+    return response
+
+
+# ====================================================================
+# Guarded endpoints (rate-limited upstreams such as Chrono)
+# ====================================================================
+class EndpointGuard:
+    """
+    Decides whether a rate-limited endpoint may be called right now and
+    keeps its last good response.
+
+    - token budget: ``rate_per_minute`` requests, bursts of up to ``burst``
+    - a 429's Retry-After (seconds or HTTP date) blocks the endpoint until then
+    - after ``failure_threshold`` failures in a row (429, 5xx, network error)
+      the circuit opens for ``backoff_base`` seconds, doubling on every
+      reopen up to ``backoff_max``; then a single probe goes out (half-open,
+      the other callers still get "circuit_open" until it answers): a
+      success or a client error closes the circuit, a failure reopens it
+    """
+
+    def __init__(self, rate_per_minute, burst, failure_threshold, backoff_base, backoff_max):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.blocked_until = 0.0  # monotonic
+        self.failures = 0
+        self.opens = 0
+        self.state = "closed"
+        self.probing = False      # the half-open probe is in flight
+        self.last_good = None     # (status_code, content, wall time)
+
+    def check(self, now):
+        """None if a request may go out now, else why not."""
+        if now < self.blocked_until:
+            return "circuit_open" if self.state == "open" else "retry_after"
+        if self.state != "closed":
+            if self.probing:
+                return "circuit_open"
+            self.state = "half_open"
+        self.tokens = min(self.burst, self.tokens + max(now - self.refilled_at, 0) * self.rate)
+        self.refilled_at = now
+        if self.tokens < 1:
+            return "budget"
+        self.tokens -= 1
+        self.probing = self.state == "half_open"
+        return None
+
+    def _close(self):
+        self.failures = 0
+        self.opens = 0
+        self.state = "closed"
+        self.probing = False
+
+    def on_success(self, status_code, content):
+        self._close()
+        self.last_good = (status_code, content, time.time())
+
+    def on_client_error(self):
+        """A 4xx other than 429: the upstream answered, retrying faster will not help."""
+        self._close()
+
+    def on_abort(self):
+        """The request died without an answer (not a network error): free the probe."""
+        self.probing = False
+
+    def on_failure(self, now, retry_after=None):
+        self.probing = False
+        self.failures += 1
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            backoff = min(self.backoff_base * 2 ** self.opens, self.backoff_max)
+            self.opens += 1
+            self.state = "open"
+            self.blocked_until = max(self.blocked_until, now + backoff)
+
+    def status(self, now=None):
+        now = time.monotonic() if now is None else now
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": max(round(self.blocked_until - now, 1), 0),
+            "tokens": round(self.tokens, 2),
+            "age_seconds": round(time.time() - self.last_good[2], 1) if self.last_good else None,
+        }
+
+
+class GuardedResponse(ArchivedResponse):
+    """Response of guarded_fetch: fresh, or the last good one (``stale``) with its age."""
+
+    def __init__(self, status_code, content, recorded_at, stale=False, reason=None):
+        super().__init__(status_code, content, recorded_at)
+        self.stale = stale
+        self.reason = reason
+
+    @property
+    def age(self):
+        return time.time() - self.recorded_at if self.recorded_at else None
+
+
+_guards = {}
+
+
+def get_guard(source):
+    with _lock:
+        guard = _guards.get(source)
+        if guard is None:
+            guard = _guards[source] = EndpointGuard(
+                CHRONO_REQUESTS_PER_MIN, CHRONO_BURST,
+                CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_BACKOFF_BASE, CIRCUIT_BACKOFF_MAX,
+            )
+        return guard
+
+
+def parse_retry_after(value):
+    """Retry-After header (delta-seconds or HTTP date) -> seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def guarded_fetch(source, url, headers=None, timeout=10):
+    """
+    fetch() through the endpoint's guard. When the guard holds the request
+    back or the upstream fails, the last good response is returned with
+    ``stale=True`` (status 503 with an empty body if there is none, or it is
+    older than LAST_GOOD_MAX_AGE).
+    """
+    if FEED_MODE == "replay":
+        response = fetch(source, url, headers=headers, timeout=timeout)
+        return GuardedResponse(response.status_code, response.content, response.recorded_at)
+
+    guard = get_guard(source)
+    now = time.monotonic()
+    with _lock:
+        reason = guard.check(now)
+    if reason is None:
+        try:
+            response = fetch(source, url, headers=headers, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            logger.warning("%s: %s", source, e, extra={"sample": f"guard_error_{source}"})
+            response = None
+        except BaseException:
+            with _lock:
+                guard.on_abort()
+            raise
+        with _lock:
+            if response is not None and response.status_code == 200:
+                guard.on_success(response.status_code, response.content)
+                return GuardedResponse(200, response.content, guard.last_good[2])
+            retry_after = None
+            if response is not None and response.status_code == 429:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response is not None and 400 <= response.status_code < 500 and response.status_code != 429:
+                # Client errors (bad token...) will not get better by retrying faster
+                guard.on_client_error()
+                return GuardedResponse(response.status_code, response.content, time.time())
+            guard.on_failure(now, retry_after)
+            reason = "rate_limited" if response is not None and response.status_code == 429 else "upstream_error"
+            if guard.state == "open":
+                logger.warning("%s: circuit open for %.0f s after %d failures", source,
+                               guard.blocked_until - now, guard.failures)
+
+    metrics.inc("bdeb_upstream_skipped_total", source=source, reason=reason)
+    last_good = guard.last_good
+    if last_good is None or time.time() - last_good[2] > LAST_GOOD_MAX_AGE:
+        return GuardedResponse(503, b"", None, stale=True, reason=reason)
+    return GuardedResponse(last_good[0], last_good[1], last_good[2], stale=True, reason=reason)
+
+
+def guard_status():
+    """State of every guarded endpoint, e.g. for /api/metrics."""
+    now = time.monotonic()
+    with _lock:
+        return {source: guard.status(now) for source, guard in _guards.items()}
+
+
+def export_last_good():
+    """{source: (status_code, content, fetched_at)} of the guarded endpoints, for snapshots."""
+    with _lock:
+        return {source: guard.last_good for source, guard in _guards.items() if guard.last_good}
+
+
+def import_last_good(responses):
+    """
+    Restore last good responses saved by export_last_good (e.g. after a
+    restart); those older than LAST_GOOD_MAX_AGE are dropped.
+    """
+    for source, (status_code, content, fetched_at) in responses.items():
+        if time.time() - fetched_at > LAST_GOOD_MAX_AGE:
+            continue
+        guard = get_guard(source)
+        with _lock:
+            if guard.last_good is None or guard.last_good[2] < fetched_at:
+                guard.last_good = (status_code, content, fetched_at)
+
+
+# ====================================================================
+# Recording
+# ====================================================================
+def _scan_archive():
+    files = []
+    if os.path.isdir(FEED_ARCHIVE_DIR):
+        for source in os.scandir(FEED_ARCHIVE_DIR):
+            if not source.is_dir():
+                continue
+            for entry in os.scandir(source.path):
+                stamp = _parse_name(entry.name)
+                if stamp:
+                    files.append((stamp[0], entry.stat().st_size, entry.path))
+    files.sort()
+    return files
+
+
+def _parse_name(name):
+    """'<unix_ms>-<status>.gz' -> (unix_ms, status), None for other files."""
+    if not name.endswith(".gz"):
+        return None
+    try:
+        stamp, status = name[:-3].split("-")
+        return int(stamp), int(status)
+    except ValueError:
+        return None
+
+
+def record(source, status_code, content, recorded_at=None):
+    """Archive one response body and rotate out the oldest files if needed."""
+    global _archive_files, _archive_bytes
+    unix_ms = int((recorded_at or time.time()) * 1000)
+    directory = os.path.join(FEED_ARCHIVE_DIR, source)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{unix_ms}-{status_code}.gz")
+    with gzip.open(path, "wb", compresslevel=6) as f:
+        f.write(content)
+    size = os.path.getsize(path)
+
+    with _lock:
+        if _archive_files is None:
+            _archive_files = _scan_archive()
+            _archive_bytes = sum(entry[1] for entry in _archive_files)
+        else:
+            _archive_files.append((unix_ms, size, path))
+            _archive_bytes += size
+        limit = FEED_ARCHIVE_MAX_MB * 1024 * 1024
+        while _archive_bytes > limit and len(_archive_files) > 1:
+            _, old_size, old_path = _archive_files.pop(0)
+            _archive_bytes -= old_size
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+    return path
+
+
+# ====================================================================
+# Replay
+# ====================================================================
+def _load_replay_index():
+    index = {}
+    if os.path.isdir(FEED_ARCHIVE_DIR):
+        for source in os.scandir(FEED_ARCHIVE_DIR):
+            if not source.is_dir():
+                continue
+            entries = sorted(
+                (stamp[0], entry.path)
+                for entry in os.scandir(source.path)
+                if (stamp := _parse_name(entry.name))
+            )
+            if entries:
+                index[source.name] = ([e[0] for e in entries], [e[1] for e in entries])
+    stamps = [s for times, _ in index.values() for s in (times[0], times[-1])]
+    _replay_clock.update(
+        start=min(stamps, default=0),
+        end=max(stamps, default=0),
+        started=time.time(),
+    )
+    logger.info("Replaying %d archived responses from %s at %sx",
+                sum(len(t) for t, _ in index.values()), FEED_ARCHIVE_DIR, FEED_REPLAY_SPEED)
+    return index
+
+
+def replay_time_ms():
+    """Archive timestamp (unix ms) the replay is currently at."""
+    elapsed = (time.time() - _replay_clock["started"]) * 1000 * FEED_REPLAY_SPEED
+    span = _replay_clock["end"] - _replay_clock["start"]
+    if FEED_REPLAY_LOOP and span > 0:
+        elapsed %= span + 1
+    return _replay_clock["start"] + elapsed
+
+
+def _replay(source):
+    global _replay_index
+    with _lock:
+        if _replay_index is None:
+            _replay_index = _load_replay_index()
+    times, paths = _replay_index.get(source, ([], []))
+    if not times:
+        logger.warning("No archived responses for %s", source, extra={"sample": f"replay_missing_{source}"})
+        return ArchivedResponse(404, b"", None)
+    # Latest response recorded at or before the replay clock (the first one
+    # until the clock reaches it)
+    position = max(bisect_right(times, replay_time_ms()) - 1, 0)
+    path = paths[position]
+    with gzip.open(path, "rb") as f:
+        content = f.read()
+    _, status_code = _parse_name(os.path.basename(path))
+    return ArchivedResponse(status_code, content, times[position] / 1000)
+
+
+def reset():
+    """Forget the cached archive/replay state (after FEED_ARCHIVE_DIR changes)."""
+    global _archive_files, _archive_bytes, _replay_index
+    with _lock:
+        _archive_files = None
+        _archive_bytes = 0
+        _replay_index = None
+        _replay_clock.clear()
+
+
+if __name__ == "__main__":
+    files = _scan_archive()
+    print(f"Archive: {FEED_ARCHIVE_DIR} ({len(files)} responses, "
+          f"{sum(f[1] for f in files) / 1024 / 1024:.1f} MB, mode {FEED_MODE})")
+    by_source = {}
+    for unix_ms, size, path in files:
+        by_source.setdefault(os.path.basename(os.path.dirname(path)), []).append(unix_ms)
+    for source, stamps in sorted(by_source.items()):
+        first = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stamps[0] / 1000))
+        last = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stamps[-1] / 1000))
+        print(f"   {source:<28}{len(stamps):>6}   {first} → {last}")
@@ -1,7 +1,5 @@
-import requests
 import os
 import csv
-import time
 from datetime import datetime, timedelta
 from google.transit import gtfs_realtime_pb2
 from ..config import (
@@ -9,8 +7,16 @@ from ..config import (
     CHRONO_TRIP_UPDATE_URL,
     CHRONO_VEHICLE_POSITION_URL,
     CHRONO_ALERTS_URL,
+    EXO_DELAY_DECAY,
 )
 from ..utils import load_csv_dict
+from ..feeds import guarded_fetch
+from ..departures import build_departure_board, next_departures, parse_gtfs_time, seconds_since_midnight
+from ..geo import is_at_stop
+from ..shapes import TRAIN_SPEED_MPS, eta_seconds
+from ..eta import build_trip_stops
+from .records import ExoTrip, ExoStopTime, intern_id, parse_flag, parse_int
+from .ids import IdRegistry
 import logging
 logger = logging.getLogger('BdeB-GTFS.exo')
 
@@ -19,42 +25,78 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 def normalize_trip_id(trip_id):
     return trip_id.split('-')[0].strip()
 
+# Integer ids for the Exo static tables: full GTFS trip_ids, train numbers
+# (normalized trip_ids, as used by the Chrono realtime feeds) and stop_ids
+exo_trip_ids = IdRegistry()
+exo_train_ids = IdRegistry(normalize=normalize_trip_id)
+exo_stop_ids = IdRegistry(normalize=str.strip)
+
+# Age of the Chrono data last returned by fetch_exo_realtime_data (older than
+# a few seconds when the last good response is served while throttled)
+chrono_feed_state = {"age_seconds": None, "stale": False, "reason": None}
+
 def fetch_exo_realtime_data():
+    """
+    Chrono trip updates and vehicle positions. Requests go through the
+    endpoint guards (budget, Retry-After, circuit breaker); when one is held
+    back, the last good feed is used instead and chrono_feed_state says so.
+    """
     headers = { "accept": "application/x-protobuf" }
     
-    trip_updates_response = requests.get(CHRONO_TRIP_UPDATE_URL, headers=headers)
-    vehicle_positions_response = requests.get(CHRONO_VEHICLE_POSITION_URL, headers=headers)
-
-    if trip_updates_response.status_code == 429:
-        print("Chrono API rate limited for trip updates")
-    if vehicle_positions_response.status_code == 429:
-        print("Chrono API rate limited for vehicle positions")
-    print(f"=== FETCH_EXO_REALTIME_DATA CALLED AT {time.strftime('%H:%M:%S')} ===")
+    trip_updates_response = guarded_fetch("chrono_trip_updates", CHRONO_TRIP_UPDATE_URL, headers=headers)
+    vehicle_positions_response = guarded_fetch("chrono_vehicle_positions", CHRONO_VEHICLE_POSITION_URL, headers=headers)
+
+    for name, response in (("trip updates", trip_updates_response), ("vehicle positions", vehicle_positions_response)):
+        if response.reason == "rate_limited":
+            logger.warning("Chrono API rate limited for %s", name, extra={"sample": f"chrono_429_{name}"})
     if trip_updates_response.status_code == 200 and vehicle_positions_response.status_code == 200:
-        print("Chrono API Fetch Success")
+        stale = trip_updates_response.stale or vehicle_positions_response.stale
+        age = max(trip_updates_response.age or 0, vehicle_positions_response.age or 0)
+        chrono_feed_state.update(
+            age_seconds=round(age, 1),
+            stale=stale,
+            reason=trip_updates_response.reason or vehicle_positions_response.reason,
+        )
+        if stale:
+            logger.info("Chrono API held back (%s), using data from %.0f s ago", chrono_feed_state["reason"], age,
+                        extra={"sample": "chrono_stale"})
+        else:
+            logger.info("Chrono API Fetch Success", extra={"sample": "chrono_fetch_success"})
         trip_updates_feed = gtfs_realtime_pb2.FeedMessage()
         vehicle_positions_feed = gtfs_realtime_pb2.FeedMessage()
         trip_updates_feed.ParseFromString(trip_updates_response.content)
         vehicle_positions_feed.ParseFromString(vehicle_positions_response.content)    
         return trip_updates_feed.entity, vehicle_positions_feed.entity
     else:
-        print(f"Chrono API Error: {trip_updates_response.status_code}, {vehicle_positions_response.status_code}")
+        chrono_feed_state.update(age_seconds=None, stale=True,
+                                 reason=trip_updates_response.reason or vehicle_positions_response.reason)
+        logger.error(
+            "Chrono API Error: %s, %s", trip_updates_response.status_code, vehicle_positions_response.status_code,
+            extra={"fields": {"trip_updates": trip_updates_response.status_code,
+                              "vehicle_positions": vehicle_positions_response.status_code},
+                   "sample": "chrono_error"},
+        )
         return [], []
 
 def fetch_exo_alerts():
-    """Updated function to use new Chrono API"""
+    """
+    Chrono alert entities, or None when the feed did not answer (error
+    status, unparsable body, network error), so the caller can keep the
+    alerts it has instead of ending them.
+    """
     headers = { "accept": "application/x-protobuf" }
-    print(f"DEBUG: fetch_exo_alerts calling URL: {CHRONO_ALERTS_URL}")  
+    logger.debug("fetch_exo_alerts calling %s", CHRONO_ALERTS_URL)
     try:
-        response = requests.get(CHRONO_ALERTS_URL, headers=headers)
+        response = guarded_fetch("chrono_alerts", CHRONO_ALERTS_URL, headers=headers)
         if response.status_code == 200:
             feed = gtfs_realtime_pb2.FeedMessage()
             feed.ParseFromString(response.content)
             return feed.entity
-        return []
+        logger.warning("Chrono alerts unavailable: %s", response.status_code, extra={"sample": "chrono_alerts_error"})
+        return None
     except Exception as e:
-        print(f"Error fetching Chrono alerts: {str(e)}")
-        return []
+        logger.error("Error fetching Chrono alerts: %s", e)
+        return None
 
 
 def load_exo_gtfs_trips(filepath):
@@ -63,22 +105,171 @@ def load_exo_gtfs_trips(filepath):
     with open(filepath, mode="r", encoding="utf-8-sig") as file:
         reader = csv.DictReader(file)
         for row in reader:
-            trips_data[row["trip_id"]] = {  
-                "route_id": row["route_id"],
-                "direction_id": row.get("direction_id", "0"),
-                "wheelchair_accessible": row.get("wheelchair_accessible", "0"),
-                "bikes_allowed": row.get("bikes_allowed", "0")
-            }
+            trips_data[exo_trip_ids.intern(row["trip_id"])] = ExoTrip(
+                train_id=exo_train_ids.intern(row["trip_id"]),
+                route_id=intern_id(row["route_id"]),
+                direction_id=parse_int(row.get("direction_id")),
+                service_id=intern_id(row.get("service_id")),
+                wheelchair_accessible=parse_flag(row.get("wheelchair_accessible")),
+                bikes_allowed=parse_flag(row.get("bikes_allowed")),
+                shape_id=intern_id(row.get("shape_id")) or None,
+            )
     return trips_data
 
 def load_exo_stop_times(filepath):
+    """Load Exo stop_times as ExoStopTime records, skipping malformed rows."""
     stop_times_data = []
     with open(filepath, mode="r", encoding="utf-8-sig") as file:
         reader = csv.DictReader(file)
         for row in reader:
-            stop_times_data.append(row)
+            try:
+                arrival_seconds = parse_gtfs_time(row["arrival_time"])
+                departure_seconds = parse_gtfs_time(row["departure_time"] or row["arrival_time"])
+                stop_sequence = int(row["stop_sequence"])
+            except (KeyError, ValueError, IndexError, AttributeError):
+                continue
+            stop_times_data.append(ExoStopTime(
+                trip_id=exo_trip_ids.intern(row["trip_id"]),
+                train_id=exo_train_ids.intern(row["trip_id"]),
+                stop_id=exo_stop_ids.intern(row["stop_id"]),
+                stop_sequence=stop_sequence,
+                arrival_seconds=arrival_seconds,
+                departure_seconds=departure_seconds,
+            ))
     return stop_times_data
 
+def index_exo_stop_times(stop_times):
+    """
+    Group Exo stop_times by train (normalized trip_id), ordered by stop_sequence.
+    Returns {train_id: [stop_id, ...]} so realtime delays can be walked along
+    a trip without rescanning the whole stop_times list on every refresh.
+    """
+    sequences = {}
+    for stop_time in stop_times:
+        # Service variants share the same train number, and the same stops
+        sequences.setdefault(stop_time.train_id, {})[stop_time.stop_sequence] = stop_time.stop_id
+
+    return {
+        trip_id: [stops[seq] for seq in sorted(stops)]
+        for trip_id, stops in sequences.items()
+    }
+
+# Stops and routes shown on the display
+EXO_WATCHED_STOPS = ("MTL7D", "MTL7B", "MTL59A")
+EXO_WATCHED_ROUTES = ("4", "6")
+
+def index_exo_watched_arrivals(stop_times):
+    """
+    {train_id: [(stop_id, arrival_seconds), ...]} of the watched stops, so a
+    located train finds its arrivals with one lookup instead of a scan of
+    every stop_time (service variants of a train each keep their rows).
+    """
+    desired_stops = {exo_stop_ids.get(stop_id) for stop_id in EXO_WATCHED_STOPS}
+    arrivals = {}
+    for stop_time in stop_times:
+        if stop_time.stop_id in desired_stops:
+            arrivals.setdefault(stop_time.train_id, []).append((stop_time.stop_id, stop_time.arrival_seconds))
+    return arrivals
+
+def build_exo_trip_stops(exo_stop_times, exo_trips, stop_index, shapes=None):
+    """
+    eta.TripStops of every train of the watched routes, by train id (the
+    service variants of a train share its stops, the first one is kept).
+    """
+    by_trip = {}
+    for stop_time in exo_stop_times:
+        trip_data = exo_trips.get(stop_time.trip_id)
+        if trip_data is not None and trip_data.route_id in EXO_WATCHED_ROUTES:
+            by_trip.setdefault(stop_time.trip_id, []).append(stop_time)
+    trip_stops = {}
+    for trip_id, stop_times in by_trip.items():
+        trip_data = exo_trips[trip_id]
+        if trip_data.train_id in trip_stops:
+            continue
+        stop_times.sort(key=lambda st: st.stop_sequence)
+        trip_stops[trip_data.train_id] = build_trip_stops(
+            trip_data.route_id,
+            [(exo_stop_ids.name(st.stop_id), st.arrival_seconds) for st in stop_times],
+            stop_index,
+            trip_data.shape_id,
+            shapes,
+        )
+    return trip_stops
+
+def track_exo_vehicles(entities, trip_stops, estimator):
+    """Feed the position of every located train to the ETA estimator."""
+    for entity in entities:
+        if not entity.HasField("vehicle") or not entity.vehicle.HasField("position"):
+            continue
+        vehicle = entity.vehicle
+        train_id = exo_train_ids.get(vehicle.trip.trip_id)
+        trip = trip_stops.get(train_id)
+        if trip is not None:
+            fix_ts = vehicle.timestamp if vehicle.HasField("timestamp") else None
+            estimator.observe(train_id, trip, vehicle.position.latitude, vehicle.position.longitude, fix_ts)
+    estimator.prune()
+
+def build_exo_departure_board(exo_stop_times, exo_trips):
+    """
+    Flatten the stop_times of the watched stops (routes 4 and 6 only) into a
+    DepartureBoard keyed by stop id. Realtime delays are matched on the train.
+    """
+    watched_stops = {exo_stop_ids.get(stop_id) for stop_id in EXO_WATCHED_STOPS}
+    rows = []
+    for stop_time in exo_stop_times:
+        if stop_time.stop_id not in watched_stops:
+            continue
+        trip_data = exo_trips.get(stop_time.trip_id)
+        if trip_data is None or trip_data.route_id not in EXO_WATCHED_ROUTES:
+            continue
+        rows.append((stop_time.stop_id, stop_time.departure_seconds, stop_time.trip_id, trip_data.service_id))
+    return build_departure_board(rows, delay_key=lambda trip: exo_trips[trip].train_id)
+
+def propagate_exo_delays(exo_trip_updates, trip_stop_index, decay=EXO_DELAY_DECAY):
+    """
+    Build {(train_id, stop_id): delay_minutes} from Chrono trip updates.
+    The feed often lists only the next few stops of a trip, so the last known
+    delay is carried forward to every downstream stop without its own update,
+    multiplied by ``decay`` at each such stop (1.0 keeps it unchanged).
+    Trains and stops absent from the static GTFS are ignored.
+    """
+    real_delays = {}
+    for entity in exo_trip_updates:
+        if not entity.HasField('trip_update'):
+            continue
+        train_id = exo_train_ids.get(entity.trip_update.trip.trip_id)
+        if train_id is None:
+            continue
+
+        known_delays = {}
+        for stop_update in entity.trip_update.stop_time_update:
+            stop_id = exo_stop_ids.get(stop_update.stop_id)
+            if stop_id is None:
+                continue
+            if stop_update.HasField('arrival'):
+                known_delays[stop_id] = stop_update.arrival.delay
+            elif stop_update.HasField('departure'):
+                known_delays[stop_id] = stop_update.departure.delay
+
+        trip_stops = trip_stop_index.get(train_id, ())
+
+        carried = None
+        for stop_id in trip_stops:
+            if stop_id in known_delays:
+                carried = known_delays[stop_id]
+            elif carried is not None:
+                carried *= decay
+            else:
+                # Upstream of the first update: nothing to propagate yet
+                continue
+            real_delays[(train_id, stop_id)] = int(carried // 60)
+
+        # Updates for stops missing from the static sequence
+        for stop_id, delay_seconds in known_delays.items():
+            real_delays.setdefault((train_id, stop_id), delay_seconds // 60)
+
+    return real_delays
+
 def exo_map_occupancy_status(status):
     mapping = {
         "MANY_SEATS_AVAILABLE": "MANY_SEATS_AVAILABLE",
@@ -112,6 +303,10 @@ stop_id_map = {
     "MTL59A": "Gare Ahuntsic",
 }
 
+# Route 6 serves the watched stop both ways: trips.txt direction_id 1 runs
+# to Mascouche, 0 to Gare Centrale
+EXO_ROUTE_6_DIRECTIONS = {0: "Gare Centrale", 1: "Mascouche"}
+
 def exo_map_train_details(schedule, trips_data, stop_id_map):
     mapped_schedule = []
     for train in schedule:
@@ -127,11 +322,9 @@ def exo_map_train_details(schedule, trips_data, stop_id_map):
             else:
                 direction = "Unknown"
         elif route_id == "6":
-            direction_id = trips_data.get(train["trip_id"], {}).get("direction_id", "0")
-            direction = (
-                "Mascouche" if direction_id == "0"
-                else "Unknown"
-            )
+            # trips_data is keyed by GTFS trip id, the schedule rows carry the train number
+            trip_data = trips_data.get(exo_trip_ids.get(train.get("gtfs_trip_id") or trip_id))
+            direction = EXO_ROUTE_6_DIRECTIONS.get(trip_data.direction_id, "Unknown") if trip_data else "Unknown"
         else:
             direction = "Unknown"
         
@@ -155,47 +348,58 @@ def exo_map_train_details(schedule, trips_data, stop_id_map):
             "minutes_remaining": minutes_remaining,
             "stop_id": stop_id,
             "at_stop": train.get("at_stop", False),
+            "distance_m": train.get("distance_m"),
+            "remaining_m": train.get("remaining_m"),
+            "estimated_minutes": train.get("estimated_minutes"),
+            "estimated": train.get("estimated", False),
         }
         mapped_schedule.append(mapped_train)
     return mapped_schedule
 
-def process_exo_vehicle_positions(entities, stop_times):
-    desired_stops = {"MTL7D", "MTL7B", "MTL59A"}
-    closest_vehicles = {stop_id: None for stop_id in desired_stops}
+def process_exo_vehicle_positions(entities, stop_times, stop_index=None, watched_arrivals=None):
+    """
+    Next train of each watched stop among the vehicles of the feed, with its
+    occupancy and, given a ``stop_index`` (stops.txt), its distance to the stop.
+    ``watched_arrivals`` (index_exo_watched_arrivals) is built from
+    ``stop_times`` when not given.
+    """
+    if watched_arrivals is None:
+        watched_arrivals = index_exo_watched_arrivals(stop_times)
+    closest_vehicles = {stop_id: None for stop_id in EXO_WATCHED_STOPS}
+    current_seconds = seconds_since_midnight(datetime.now())
 
     for entity in entities:
         if entity.HasField("vehicle"):
             vehicle = entity.vehicle
             raw_trip_id = vehicle.trip.trip_id
-            trip_id = normalize_trip_id(raw_trip_id)
+            train_id = exo_train_ids.get(raw_trip_id)
+            if train_id is None:
+                continue
+            trip_id = exo_train_ids.name(train_id)
             route_id = vehicle.trip.route_id
             exo_occupancy_status = vehicle.occupancy_status if vehicle.HasField("occupancy_status") else "UNKNOWN"
-            for stop_time in stop_times:
-                csv_trip_id = normalize_trip_id(stop_time["trip_id"])
-                candidate_stop = stop_time["stop_id"].strip()
-                logger.debug(f"Comparing realtime trip_id: {trip_id} with CSV trip_id: {csv_trip_id} for stop {candidate_stop}")
-                if csv_trip_id == trip_id and candidate_stop in desired_stops:
-                    stop_id = candidate_stop
-                    arrival_time_str = stop_time["arrival_time"]
-                    h, m, s = map(int, arrival_time_str.split(":"))
-                    arrival_time_seconds = h * 3600 + m * 60 + s
-
-                    current_time = datetime.now()
-                    current_seconds = current_time.hour * 3600 + current_time.minute * 60 + current_time.second
-
-                    if arrival_time_seconds < current_seconds:
-                        continue
-
-                    if (closest_vehicles[stop_id] is None or
-                            arrival_time_seconds < closest_vehicles[stop_id]["arrival_time_seconds"]):
-                        closest_vehicles[stop_id] = {
-                            "trip_id": trip_id,
-                            "route_id": route_id,
-                            "occupancy": exo_map_occupancy_status(exo_occupancy_status),
-                            "stop_id": stop_id,
-                            "arrival_time_seconds": arrival_time_seconds,
-                        }
-                        logger.debug(f"Match found for stop {stop_id}: {closest_vehicles[stop_id]}")
+            lat = lon = None
+            if vehicle.HasField("position"):
+                lat = vehicle.position.latitude
+                lon = vehicle.position.longitude
+            for candidate_stop, arrival_time_seconds in watched_arrivals.get(train_id, ()):
+                stop_id = exo_stop_ids.name(candidate_stop)
+
+                if arrival_time_seconds < current_seconds:
+                    continue
+
+                if (closest_vehicles[stop_id] is None or
+                        arrival_time_seconds < closest_vehicles[stop_id]["arrival_time_seconds"]):
+                    closest_vehicles[stop_id] = {
+                        "trip_id": trip_id,
+                        "route_id": route_id,
+                        "occupancy": exo_map_occupancy_status(exo_occupancy_status),
+                        "stop_id": stop_id,
+                        "arrival_time_seconds": arrival_time_seconds,
+                        "lat": lat,
+                        "lon": lon,
+                    }
+                    logger.debug("Match found for stop %s: %s", stop_id, closest_vehicles[stop_id])
                         
     filtered_vehicles = []
     for vehicle in closest_vehicles.values():
@@ -205,6 +409,9 @@ def process_exo_vehicle_positions(entities, stop_times):
             minutes = (seconds % 3600) // 60
             arrival_dt = datetime.now().replace(hour=hours, minute=minutes, second=0, microsecond=0)
             arrival_str = arrival_dt.strftime("%I:%M %p")
+            distance_m = None
+            if stop_index is not None:
+                distance_m = stop_index.distance_to(vehicle["stop_id"], vehicle["lat"], vehicle["lon"])
             
             filtered_vehicles.append({
                 "trip_id": vehicle["trip_id"],
@@ -212,67 +419,90 @@ def process_exo_vehicle_positions(entities, stop_times):
                 "occupancy": vehicle["occupancy"],
                 "stop_id": vehicle["stop_id"],
                 "arrival_time": arrival_str,
+                "distance_m": None if distance_m is None else int(round(distance_m)),
+                "lat": vehicle["lat"],
+                "lon": vehicle["lon"],
             })
 
-    print("Filtered Chrono Vehicle Positions with Stop IDs:", filtered_vehicles)
+    logger.debug("Filtered Chrono Vehicle Positions with Stop IDs: %s", filtered_vehicles)
     return filtered_vehicles
 
-def process_exo_train_schedule_with_occupancy(exo_stop_times, exo_trips, vehicle_positions, exo_trip_updates):
+def process_exo_train_schedule_with_occupancy(exo_stop_times, exo_trips, vehicle_positions, exo_trip_updates, trip_stop_index=None, departure_board=None, shapes=None, stop_index=None, estimator=None, calendar=None):
+    """
+    Next train of each watched stop with its realtime delay. A train without
+    a prediction for the stop is estimated from its last known position
+    (``estimator``, see eta.py, which also covers a held-back feed), or from
+    the distance left along the trip's shape (``shapes`` and ``stop_index``)
+    at an average speed. Only the services running today (``calendar``, a
+    departures.ServiceCalendar) are considered.
+    """
     from datetime import datetime, timedelta
     current_time = datetime.now()
-    current_seconds = current_time.hour * 3600 + current_time.minute * 60 + current_time.second
+    current_seconds = seconds_since_midnight(current_time)
 
     occupancy_lookup = {}
+    distance_lookup = {}
+    position_lookup = {}
     for vehicle in vehicle_positions:
         key = (vehicle["trip_id"], vehicle["route_id"])
         occupancy_lookup[key] = vehicle.get("occupancy", "UNKNOWN")
-        logger.debug(f"Cached occupancy - Trip: {vehicle['trip_id']}, Route: {vehicle['route_id']} -> {occupancy_lookup[key]}")
-
-    real_delays = {}
-    for entity in exo_trip_updates:
-        if entity.HasField('trip_update'):
-            raw_trip_id = entity.trip_update.trip.trip_id
-            trip_id = normalize_trip_id(raw_trip_id)
-            for stop_update in entity.trip_update.stop_time_update:
-                stop_id = stop_update.stop_id.strip()
-                delay_seconds = stop_update.arrival.delay if stop_update.HasField('arrival') else 0
-                real_delays[(trip_id, stop_id)] = delay_seconds // 60
-
-    desired_stops = {"MTL7D", "MTL7B", "MTL59A"}
-    closest_trains = {stop: None for stop in desired_stops}
-
-    for stop_time in exo_stop_times:
-        candidate_stop = stop_time["stop_id"].strip()
-        if candidate_stop not in desired_stops:
-            continue
-
-        raw_trip_id = stop_time["trip_id"]
-        trip_id = normalize_trip_id(raw_trip_id)  
-        trip_data = exo_trips.get(raw_trip_id, {})
-        route_id = trip_data.get("route_id")
-        direction_id = trip_data.get("direction_id")
-
-        if route_id not in ("4", "6"):
-            continue
+        if vehicle.get("distance_m") is not None:
+            distance_lookup[(vehicle["trip_id"], vehicle["stop_id"])] = vehicle["distance_m"]
+        if vehicle.get("lat") is not None:
+            position_lookup[(vehicle["trip_id"], vehicle["stop_id"])] = (vehicle["lat"], vehicle["lon"])
+        logger.debug("Cached occupancy - Trip: %s, Route: %s -> %s", vehicle['trip_id'], vehicle['route_id'], occupancy_lookup[key])
+
+    if trip_stop_index is None:
+        trip_stop_index = index_exo_stop_times(exo_stop_times)
+    if departure_board is None:
+        departure_board = build_exo_departure_board(exo_stop_times, exo_trips)
+    real_delays = propagate_exo_delays(exo_trip_updates, trip_stop_index)
+
+    departures = next_departures(
+        departure_board,
+        current_seconds,
+        delays={key: minutes * 60 for key, minutes in real_delays.items()},
+        active_services=calendar.active(current_time.date()) if calendar is not None else None,
+    )
+
+    closest_trains = {stop: None for stop in EXO_WATCHED_STOPS}
+
+    for stop_id, departure in departures.items():
+        candidate_stop = exo_stop_ids.name(stop_id)
+        trip_data = exo_trips[departure["trip_id"]]
+        trip_id = exo_train_ids.name(trip_data.train_id)
+        route_id = trip_data.route_id
 
         exo_occupancy_status = occupancy_lookup.get((trip_id, route_id), "UNKNOWN")
-        logger.debug(f"[Train] Looking up occupancy for {(trip_id, route_id)}: {exo_occupancy_status}")
+        logger.debug("[Train] Looking up occupancy for %s: %s", (trip_id, route_id), exo_occupancy_status)
+
+        original_datetime = datetime(1900, 1, 1) + timedelta(seconds=departure["scheduled_seconds"])
+        actual_delay = departure["delay_seconds"] // 60
+        minutes_remaining = departure["minutes_remaining"]
+
+        # No prediction for this stop: estimate from the train's last position
+        remaining_m = estimated_minutes = None
+        estimated = False
+        if (trip_data.train_id, stop_id) not in real_delays:
+            progress = estimator.progress(trip_data.train_id) if estimator is not None else None
+            seconds = estimator.estimate(progress, candidate_stop) if progress else None
+            position = position_lookup.get((trip_id, candidate_stop))
+            if shapes is not None and position and trip_data.shape_id:
+                remaining_m = shapes.remaining_m(trip_data.shape_id, *position, stop_id=candidate_stop, stop_index=stop_index)
+                if seconds is None:
+                    seconds = eta_seconds(remaining_m, TRAIN_SPEED_MPS)
+            if seconds is not None:
+                estimated_minutes = int(seconds // 60)
+                if progress is not None:
+                    # Learned from the trains before it: shown like a realtime delay
+                    actual_delay = estimated_minutes - departure["minutes_remaining"]
+                    minutes_remaining = estimated_minutes
+                    estimated = True
 
-        original_time_str = stop_time["departure_time"]
-        original_datetime = datetime.strptime(original_time_str, "%H:%M:%S")
-        actual_delay = real_delays.get((trip_id, candidate_stop), 0)
         adjusted_datetime = original_datetime + timedelta(minutes=actual_delay)
         original_arrival_time = original_datetime.strftime("%I:%M %p")
         adjusted_arrival_time = adjusted_datetime.strftime("%I:%M %p")
 
-        arrival_time_seconds = (original_datetime.hour * 3600 +
-                                original_datetime.minute * 60 +
-                                original_datetime.second)
-        if arrival_time_seconds < current_seconds:
-            arrival_time_seconds += 24 * 3600
-
-        minutes_remaining = (arrival_time_seconds - current_seconds) // 60
-
         delayed_text = None
         early_text = None
         if actual_delay > 0:
@@ -280,11 +510,14 @@ def process_exo_train_schedule_with_occupancy(exo_stop_times, exo_trips, vehicle
         elif actual_delay < 0:
             early_text = f"En avance (prévu à {original_arrival_time})"
 
-        at_stop_flag = (minutes_remaining < 2)
+        # A located train is at the stop by distance, the others by schedule
+        distance_m = distance_lookup.get((trip_id, candidate_stop))
+        at_stop = departure["at_stop"] if distance_m is None else is_at_stop(distance_m)
 
-        train_info = {
+        closest_trains[candidate_stop] = {
             "stop_id": candidate_stop,
             "trip_id": trip_id,
+            "gtfs_trip_id": exo_trip_ids.name(departure["trip_id"]),
             "route_id": route_id,
             "arrival_time": adjusted_arrival_time,
             "original_arrival_time": original_arrival_time,
@@ -292,13 +525,13 @@ def process_exo_train_schedule_with_occupancy(exo_stop_times, exo_trips, vehicle
             "occupancy": exo_occupancy_status,
             "delayed_text": delayed_text,
             "early_text": early_text,
-            "at_stop": at_stop_flag,
+            "at_stop": at_stop,
+            "distance_m": distance_m,
+            "remaining_m": None if remaining_m is None else int(round(remaining_m)),
+            "estimated_minutes": estimated_minutes,
+            "estimated": estimated,
         }
 
-        prev = closest_trains[candidate_stop]
-        if (prev is None) or (minutes_remaining < prev["minutes_remaining"]):
-            closest_trains[candidate_stop] = train_info
-
     filtered_schedule = [train for train in closest_trains.values() if train]
 
     from .exo import exo_map_train_details, stop_id_map
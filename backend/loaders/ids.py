@@ -0,0 +1,70 @@
+# ids.py
+"""
+Dense integer ids for GTFS identifiers.
+
+Each static table is stored against small integers assigned once at load time,
+so dict keys are ints instead of per-row strings. Realtime feeds resolve their
+string ids with a single lookup per entity, and ``name()`` maps back to the
+external id for output.
+"""
+
+# stm_stop_times packs (trip, stop) into one int; STM has well under 2**20 stops
+STOP_BITS = 20
+STOP_MASK = (1 << STOP_BITS) - 1
+
+
+def stop_time_key(trip, stop):
+    return (trip << STOP_BITS) | stop
+
+
+def split_stop_time_key(key):
+    return key >> STOP_BITS, key & STOP_MASK
+
+
+class IdRegistry:
+    """
+    Bidirectional map between external string ids and dense ints.
+    ``normalize`` (e.g. normalize_trip_id) is applied before interning; raw
+    ids already resolved are remembered so normalization runs once per id.
+    """
+
+    __slots__ = ("_ids", "_names", "_aliases", "_normalize")
+
+    def __init__(self, normalize=None):
+        self._ids = {}
+        self._names = []
+        self._aliases = {}
+        self._normalize = normalize
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def intern(self, name):
+        """Return the id of ``name``, assigning the next free one if new."""
+        key = self._normalize(name) if self._normalize else name
+        ident = self._ids.get(key)
+        if ident is None:
+            ident = len(self._names)
+            self._ids[key] = ident
+            self._names.append(key)
+        if self._normalize:
+            self._aliases[name] = ident
+        return ident
+
+    def get(self, name):
+        """Resolve an id seen at load time (None for unknown ids)."""
+        if not self._normalize:
+            return self._ids.get(name)
+        ident = self._aliases.get(name)
+        if ident is None:
+            ident = self._ids.get(self._normalize(name))
+            if ident is not None:
+                self._aliases[name] = ident
+        return ident
+
+    def name(self, ident):
+        """External id for output."""
+        return self._names[ident]
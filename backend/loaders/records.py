@@ -0,0 +1,60 @@
+# records.py
+"""
+Compact record types for the static GTFS tables.
+
+Only the fields the display actually uses are kept, already parsed to their
+numeric types, and repeated identifiers are interned so every trip of a route
+shares the same string object.
+"""
+import sys
+from dataclasses import dataclass
+
+
+def intern_id(value):
+    """Strip and intern a GTFS identifier (None stays None)."""
+    if value is None:
+        return None
+    return sys.intern(value.strip())
+
+
+def parse_flag(value):
+    """GTFS accessibility flags: "1" means yes, anything else means no/unknown."""
+    return (value or "").strip() == "1"
+
+
+def parse_int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# Trip, train and stop fields hold ids from the registries in loaders/ids.py
+
+@dataclass(slots=True)
+class ExoTrip:
+    train_id: int  # normalized trip_id (train number) shared by service variants
+    route_id: str
+    direction_id: int
+    service_id: str | None
+    wheelchair_accessible: bool
+    bikes_allowed: bool
+    shape_id: str | None = None
+
+
+@dataclass(slots=True)
+class ExoStopTime:
+    trip_id: int
+    train_id: int
+    stop_id: int
+    stop_sequence: int
+    arrival_seconds: int
+    departure_seconds: int
+
+
+@dataclass(slots=True)
+class StmTrip:
+    route_id: str  # route short name, e.g. "171"
+    service_id: str | None
+    wheelchair_accessible: bool
+    shape_id: str | None = None
@@ -1,4 +1,3 @@
-import requests
 import os
 import csv
 import time
@@ -11,111 +10,75 @@ from backend.config import (
     STM_ALERTS_ENDPOINT
 )
 from backend.utils import load_csv_dict  
-# Cache for calendar data
-_calendar_data = None
-_calendar_dates_data = None
+from backend.alerts import says_normal_service
+from backend.feeds import fetch
+from backend.departures import (
+    SECONDS_PER_DAY,
+    AT_STOP_MINUTES,
+    build_departure_board,
+    next_departures,
+    parse_gtfs_time,
+    seconds_since_midnight,
+)
+from backend.geo import AT_STOP_METERS, STOPPED_AT
+from backend.eta import build_trip_stops
+from backend.loaders.records import StmTrip, intern_id, parse_flag
+from backend.loaders.ids import IdRegistry, stop_time_key, split_stop_time_key
+from backend.parsers.gtfs_rt_stream import parse_entities_for_routes, feed_stats
+import numpy as np
+import logging
+logger = logging.getLogger('BdeB-GTFS.stm')
+
+# Integer ids for the STM static tables (route short names stay interned
+# strings: there are only a few hundred of them)
+stm_trip_ids = IdRegistry()
+stm_stop_ids = IdRegistry()
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
-def load_calendar_data():
-    global _calendar_data
-    if _calendar_data is None:
-        cal_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "STM", "calendar.txt")
-        _calendar_data = {}
-        try:
-            with open(cal_path, mode="r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    service_id = row["service_id"]
-                    _calendar_data[service_id] = row
-        except Exception as e:
-            print("Error loading calendar.txt:", e)
-    return _calendar_data
-
-def load_calendar_dates_data():
-    global _calendar_dates_data
-    if _calendar_dates_data is None:
-        cal_dates_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "STM", "calendar_dates.txt")
-        _calendar_dates_data = {}
-        try:
-            with open(cal_dates_path, mode="r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    service_id = row["service_id"]
-                    if service_id not in _calendar_dates_data:
-                        _calendar_dates_data[service_id] = []
-                    _calendar_dates_data[service_id].append(row)
-        except Exception as e:
-            print("Error loading calendar_dates.txt:", e)
-    return _calendar_dates_data
-
-def serviceRunsToday(service_id):
-    today = datetime.now().date()
-    run_today = False
-
-    cal_data = load_calendar_data()
-    cal_dates = load_calendar_dates_data()
-
-    # Check the regular calendar
-    if service_id in cal_data:
-        row = cal_data[service_id]
-        try:
-            start_date = datetime.strptime(row["start_date"], "%Y%m%d").date()
-            end_date = datetime.strptime(row["end_date"], "%Y%m%d").date()
-        except Exception as e:
-            print(f"Error parsing dates for service_id {service_id}: {e}")
-            return False
-        weekday = today.weekday()  # Monday=0, Sunday=6
-        days = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
-        if start_date <= today <= end_date and row[days[weekday]] == "1":
-            run_today = True
-    else:
-        print(f"Service_id {service_id} not found in calendar.txt")
-
-    # Apply exceptions from calendar_dates.txt
-    if service_id in cal_dates:
-        for row in cal_dates[service_id]:
-            try:
-                exception_date = datetime.strptime(row["date"], "%Y%m%d").date()
-            except Exception as e:
-                print(f"Error parsing exception date for service_id {service_id}: {e}")
-                continue
-            if exception_date == today:
-                # exception_type "1" means added service, "2" means removed service.
-                if row["exception_type"] == "2":
-                    run_today = False
-                elif row["exception_type"] == "1":
-                    run_today = True
-    return run_today
-
 def fetch_stm_realtime_data():
     headers = {
         "accept": "application/x-protobuf",
         "apiKey": STM_API_KEY,
     }
-    response = requests.get(STM_REALTIME_ENDPOINT, headers=headers)
+    response = fetch("stm_trip_updates", STM_REALTIME_ENDPOINT, headers=headers)
     if response.status_code == 200:
-        print("API Fetch Success")
+        logger.info("API Fetch Success", extra={"sample": "stm_trip_updates_success"})
         feed = gtfs_realtime_pb2.FeedMessage()
         feed.ParseFromString(response.content)
         return feed.entity
     else:
-        print(f"API Error: {response.status_code} - {response.text}")
+        logger.error("API Error: %s - %s", response.status_code, response.text[:200],
+                     extra={"fields": {"source": "stm_trip_updates", "status": response.status_code}})
         return []
     
-def fetch_stm_vehicle_positions():
+def fetch_stm_vehicle_positions(route_ids=None):
+    """
+    Fetch STM vehicle positions. With ``route_ids``, only the entities of those
+    routes are parsed out of the island-wide feed.
+    """
     headers = {
         "accept": "application/x-protobuf",
         "apiKey": STM_API_KEY,
     }
-    response = requests.get(STM_VEHICLE_POSITIONS_ENDPOINT, headers=headers)
+    response = fetch("stm_vehicle_positions", STM_VEHICLE_POSITIONS_ENDPOINT, headers=headers)
     if response.status_code == 200:
-        print("Vehicle Positions Fetch Success")
+        if route_ids:
+            entities = parse_entities_for_routes(response.content, route_ids, "stm_vehicle_positions")
+            stats = feed_stats["stm_vehicle_positions"]
+            logger.info(
+                "Vehicle Positions Fetch Success: kept %d/%d entities in %.1f ms (%s, protobuf %s)",
+                stats["entities_parsed"], stats["entities_total"], stats["parse_ms"], stats["mode"], stats["backend"],
+                extra={"sample": "stm_vehicle_positions_success"},
+            )
+            return entities
+        logger.info("Vehicle Positions Fetch Success", extra={"sample": "stm_vehicle_positions_success"})
         feed = gtfs_realtime_pb2.FeedMessage()
         feed.ParseFromString(response.content)
         return feed.entity
     else:
-        print(f"API Error: {response.status_code} - {response.text}")
+        logger.error("API Error: %s - %s", response.status_code, response.text[:200],
+                     extra={"fields": {"source": "stm_vehicle_positions", "status": response.status_code}})
         return []   
 
 def fetch_stm_alerts():
@@ -124,12 +87,12 @@ def fetch_stm_alerts():
         "apiKey": STM_API_KEY,
     }
     try:
-        response = requests.get(STM_ALERTS_ENDPOINT, headers=headers)
+        response = fetch("stm_alerts", STM_ALERTS_ENDPOINT, headers=headers)
         if response.status_code == 200:
             return response.json()
         return None
     except Exception as e:
-        print(f"Error fetching alerts: {str(e)}")
+        logger.error("Error fetching alerts: %s", e)
         return None
 
 def process_metro_alerts():
@@ -139,7 +102,7 @@ def process_metro_alerts():
     """
     alerts_data = fetch_stm_alerts()
     if not alerts_data:
-        print("No alerts data received")
+        logger.warning("No alerts data received", extra={"sample": "stm_no_alerts"})
         return get_default_metro_status()
     
     # Initialize metro lines with default normal status
@@ -199,14 +162,15 @@ def process_metro_alerts():
                     
                     if french_description:
                         # Check if it's a normal service message
-                        is_normal_service = "service normal" in french_description.lower()
+                        # The text is the line status itself, so it decides (not the effect)
+                        is_normal_service = says_normal_service(french_description)
                         
                         metro_status[route_short_name]["status"] = french_description
                         metro_status[route_short_name]["is_normal"] = is_normal_service
                         metro_status[route_short_name]["statusColor"] = "text-green-400" if is_normal_service else "text-red-400"
                         
         except Exception as e:
-            print(f"Error processing alert: {e}")
+            logger.error("Error processing alert: %s", e)
             continue
     
     # Convert to list format expected by frontend
@@ -277,16 +241,24 @@ def load_stm_routes(routes_file):
         for row in reader:
             real_id = row["route_id"]              # e.g. "1"
             short_name = row["route_short_name"]   # e.g. "171"
-            routes_data[real_id] = short_name
+            routes_data[real_id] = intern_id(short_name)
     return routes_data
 
 def load_stm_stop_times(filepath):
+    """
+    Map stop_time_key(trip, stop) to the scheduled arrival in seconds after
+    midnight, with trip and stop resolved through the STM id registries.
+    """
     stop_times = {}
     with open(filepath, mode="r", encoding="utf-8-sig") as file:
         reader = csv.DictReader(file)
         for row in reader:
-            key = (row["trip_id"], row["stop_id"])
-            stop_times[key] = row["arrival_time"]
+            try:
+                arrival_seconds = parse_gtfs_time(row["arrival_time"])
+            except (ValueError, IndexError, AttributeError):
+                continue
+            key = stop_time_key(stm_trip_ids.intern(row["trip_id"]), stm_stop_ids.intern(row["stop_id"]))
+            stop_times[key] = arrival_seconds
     return stop_times
 
 def load_stm_gtfs_trips(filepath, routes_map):
@@ -294,15 +266,16 @@ def load_stm_gtfs_trips(filepath, routes_map):
     with open(filepath, mode="r", encoding="utf-8-sig") as file:
         reader = csv.DictReader(file)
         for row in reader:
-            trip_id = row["trip_id"]
+            trip_id = stm_trip_ids.intern(row["trip_id"])
             real_route_id = row["route_id"]   # e.g. "1"
             # Convert real_route_id -> short_name
             short_name = routes_map.get(real_route_id, real_route_id)
-            w_str = row.get("wheelchair_accessible", "0")
-            trips_data[trip_id] = {
-                "route_id": short_name,  # store the short name, e.g. "171"
-                "wheelchair_accessible": w_str
-            }
+            trips_data[trip_id] = StmTrip(
+                route_id=intern_id(short_name),  # store the short name, e.g. "171"
+                service_id=intern_id(row.get("service_id")),
+                wheelchair_accessible=parse_flag(row.get("wheelchair_accessible")),
+                shape_id=intern_id(row.get("shape_id")) or None,
+            )
     return trips_data
 
 def stm_map_occupancy_status(status):
@@ -316,15 +289,20 @@ def stm_map_occupancy_status(status):
       
 
 def validate_trip(trip_id, route_id, gtfs_trips):
-    trip_info = gtfs_trips.get(trip_id)
+    trip_info = gtfs_trips.get(stm_trip_ids.get(trip_id))
     if not trip_info:
         return False
-    return trip_info["route_id"] == route_id
+    return trip_info.route_id == route_id
 
 
 def fetch_stm_positions_dict(desired_routes, stm_trips):
+    entities = fetch_stm_vehicle_positions(desired_routes)
+    return build_stm_positions_dict(entities, desired_routes, stm_trips)
+
+
+def build_stm_positions_dict(entities, desired_routes, stm_trips):
+    """Map (route_id, trip_id) to the live position/occupancy of each watched bus."""
     positions = {}
-    entities = fetch_stm_vehicle_positions()
     if not entities:
         return positions  # empty
     
@@ -347,6 +325,7 @@ def fetch_stm_positions_dict(desired_routes, stm_trips):
                     occupancy_raw = vehicle.occupancy_status
                 
                 feed_stop_id = vehicle.stop_id if vehicle.HasField("stop_id") else None
+                fix_ts = vehicle.timestamp if vehicle.HasField("timestamp") else None
 
                 # currentStatus => e.g. IN_TRANSIT_TO, STOPPED_AT, etc.
                 # In the proto, it might be "current_status" or "current_status_value"
@@ -361,36 +340,124 @@ def fetch_stm_positions_dict(desired_routes, stm_trips):
                     "occupancy": occupancy_raw,
                     "feed_stop_id": feed_stop_id,
                     "current_status": current_status_str,
+                    "timestamp": fix_ts,
                 }
     return positions
 
 
-def process_stm_trip_updates(trip_entities, stm_trips, stm_stop_times, positions_dict):
-    import time
-    from datetime import datetime, timedelta
+# The combos we care about
+STM_DESIRED_COMBOS = [
+    ("171","50270","171_Est"),
+    ("171","62374","171_Ouest"),
+    ("180","50270","180_Est"),
+    ("180","62374","180_Ouest"),
+    ("164","50270","164_Est"),
+    ("164","62420","164_Ouest"),
+]
+STM_WATCHED_ROUTES = tuple(dict.fromkeys(route for (route, _, _) in STM_DESIRED_COMBOS))
+
+STM_COMBO_INFO = {
+    "171_Est":   {"direction": "Est",    "location": "Collège de Bois-de-Boulogne"},
+    "171_Ouest": {"direction": "Ouest",  "location": "Henri-Bourassa/du Bois-de-Boulogne"},
+    "180_Est":   {"direction": "Est",    "location": "Collège de Bois-de-Boulogne"},
+    "180_Ouest": {"direction": "Ouest",  "location": "Henri-Bourassa/du Bois-de-Boulogne"},
+    "164_Est":   {"direction": "Est",    "location": "Collège de Bois-de-Boulogne"},
+    "164_Ouest": {"direction": "Ouest",  "location": "du Bois-de-Boulogne/Henri-Bourassa"},
+}
+
+STM_COMBO_ORDER = ["171_Est","171_Ouest","180_Est","180_Ouest","164_Est","164_Ouest"]
+
+def build_stm_departure_board(stm_trips, stm_stop_times):
+    """
+    Flatten the scheduled arrivals of every watched route/stop combo into a
+    DepartureBoard, so the schedule fallback no longer rescans stop_times.
+    """
+    combo_keys = {(route, stm_stop_ids.get(stop)): key for (route, stop, key) in STM_DESIRED_COMBOS}
+    watched_stops = {stop for (_, stop) in combo_keys}
+    rows = []
+    for key, sched_seconds in stm_stop_times.items():
+        trip_id, stop_id = split_stop_time_key(key)
+        if stop_id not in watched_stops:
+            continue
+        trip_data = stm_trips.get(trip_id)
+        if not trip_data:
+            continue
+        final_key = combo_keys.get((trip_data.route_id, stop_id))
+        if final_key:
+            rows.append((final_key, sched_seconds, trip_id, trip_data.service_id))
+    return build_departure_board(rows)
 
-    # The combos we care about
-    desired_combos = [
-        ("171","50270","171_Est"),
-        ("171","62374","171_Ouest"),
-        ("180","50270","180_Est"),
-        ("180","62374","180_Ouest"),
-        ("164","50270","164_Est"),
-        ("164","62420","164_Ouest"),
-    ]
+def build_stm_trip_stops(stm_trips, stm_stop_times, stop_index, shapes=None):
+    """
+    eta.TripStops of every trip of the watched routes that serves a watched
+    stop, by trip key, for the arrival estimates of located buses. Buses are
+    projected on their trip's shape when ``shapes`` has it, otherwise placed
+    between stops in a straight line.
+    """
+    routes = set(STM_WATCHED_ROUTES)
+    watched_stops = {stm_stop_ids.get(stop) for (_, stop, _) in STM_DESIRED_COMBOS}
+    by_trip = {}
+    for key, sched_seconds in stm_stop_times.items():
+        trip_id, stop_id = split_stop_time_key(key)
+        trip_data = stm_trips.get(trip_id)
+        if trip_data is not None and trip_data.route_id in routes:
+            by_trip.setdefault(trip_id, []).append((sched_seconds, stop_id))
+    trip_stops = {}
+    for trip_id, rows in by_trip.items():
+        if not any(stop_id in watched_stops for _, stop_id in rows):
+            continue
+        rows.sort()
+        trip_data = stm_trips[trip_id]
+        trip_stops[trip_id] = build_trip_stops(
+            trip_data.route_id,
+            [(stm_stop_ids.name(stop_id), sched_seconds) for sched_seconds, stop_id in rows],
+            stop_index,
+            trip_data.shape_id,
+            shapes,
+        )
+    return trip_stops
+
+
+def track_stm_vehicles(positions_dict, trip_stops, estimator):
+    """Feed the position of every located bus to the ETA estimator."""
+    for (route_id, trip_id), pos in positions_dict.items():
+        trip = trip_stops.get(stm_trip_ids.get(trip_id))
+        if trip is not None and pos.get("lat") is not None:
+            estimator.observe((route_id, trip_id), trip, pos["lat"], pos["lon"], pos.get("timestamp"))
+    estimator.prune()
+
+
+def estimate_stm_arrival(route_id, stop_id, positions_dict, estimator):
+    """(seconds, trip_id) of the located bus of the route expected first at the stop, None if none."""
+    best = None
+    for (bus_route, trip_id) in positions_dict:
+        if bus_route != route_id:
+            continue
+        progress = estimator.progress((bus_route, trip_id))
+        seconds = estimator.estimate(progress, stop_id) if progress else None
+        if seconds is not None and (best is None or seconds < best[0]):
+            best = (seconds, trip_id)
+    return best
 
-    combo_info = {
-        "171_Est":   {"direction": "Est",    "location": "Collège de Bois-de-Boulogne"},
-        "171_Ouest": {"direction": "Ouest",  "location": "Henri-Bourassa/du Bois-de-Boulogne"},
-        "180_Est":   {"direction": "Est",    "location": "Collège de Bois-de-Boulogne"},
-        "180_Ouest": {"direction": "Ouest",  "location": "Henri-Bourassa/du Bois-de-Boulogne"},
-        "164_Est":   {"direction": "Est",    "location": "Collège de Bois-de-Boulogne"},
-        "164_Ouest": {"direction": "Ouest",  "location": "du Bois-de-Boulogne/Henri-Bourassa"},
-    }
 
-    closest_buses = { combo[2]: None for combo in desired_combos }
+def process_stm_trip_updates(trip_entities, stm_trips, stm_stop_times, positions_dict, departure_board=None, stop_index=None, estimator=None, calendar=None):
+    """
+    Closest bus of each watched combo. With a ``stop_index`` (stops.txt), a
+    bus with a known position is at the stop when it is within
+    geo.AT_STOP_METERS of it (or stopped there); the others keep the
+    minutes-to-arrival rule. Combos without a trip update are estimated
+    from the located buses (``estimator``, see eta.py) before falling back
+    to the schedule of the services running today (``calendar``, a
+    departures.ServiceCalendar).
+    """
+    import time
+    from datetime import datetime, timedelta
+
+    combo_keys = {(route, stop): key for (route, stop, key) in STM_DESIRED_COMBOS}
+    closest_buses = { combo[2]: None for combo in STM_DESIRED_COMBOS }
 
-    # 1) Real‑time updates
+    # 1) Real‑time updates: collect the candidate stop updates first...
+    candidates = []
     for entity in trip_entities:
         if not entity.HasField("trip_update"):
             continue
@@ -401,109 +468,153 @@ def process_stm_trip_updates(trip_entities, stm_trips, stm_stop_times, positions
 
         if route_id not in ["171","180","164"]:
             continue
-        if not validate_trip(trip_id, route_id, stm_trips):
+        # One registry lookup per entity; same check as validate_trip
+        trip_key = stm_trip_ids.get(trip_id)
+        trip_data = stm_trips.get(trip_key)
+        if not trip_data or trip_data.route_id != route_id:
             continue
 
-        w_str = stm_trips.get(trip_id, {}).get("wheelchair_accessible", "0")
-        wheelchair_accessible = (w_str == "1")
-
         for stop_time in t_update.stop_time_update:
             arrival_unix = stop_time.arrival.time if stop_time.HasField("arrival") else None
             if not arrival_unix:
                 continue
 
             stop_id = stop_time.stop_id
-            final_key = None
-            for (gtfs_route, wanted_stop, key_name) in desired_combos:
-                if route_id == gtfs_route and stop_id == wanted_stop:
-                    final_key = key_name
-                    break
+            final_key = combo_keys.get((route_id, stop_id))
             if not final_key:
                 continue
-
-            # Minutes until arrival (floor)
-            now_ts = time.time()
-            minutes_to_arrival = (arrival_unix - now_ts) // 60
-
-            # —— SIMPLIFIED LATE‑ONLY LOGIC —— 
-            scheduled_arrival_str = stm_stop_times.get((trip_id, stop_id))
+            stop_key = stm_stop_ids.get(stop_id)
+            scheduled_seconds = -1
+            if stop_key is not None:
+                scheduled_seconds = stm_stop_times.get(stop_time_key(trip_key, stop_key), -1)
+            candidates.append((final_key, route_id, trip_id, stop_id, arrival_unix, scheduled_seconds, trip_data))
+
+    # ...then compute minutes, lateness and at-stop flags for all of them at once
+    if candidates:
+        now = datetime.now()
+        now_ts = time.time()
+        midnight_ts = now_ts - seconds_since_midnight(now) - now.microsecond / 1e6
+
+        arrivals = np.fromiter((c[4] for c in candidates), dtype=np.float64, count=len(candidates))
+        scheduled = np.fromiter((c[5] for c in candidates), dtype=np.int64, count=len(candidates))
+
+        # Minutes until arrival (floor)
+        minutes_to_arrival = (arrivals - now_ts) // 60
+        at_stop = minutes_to_arrival < AT_STOP_MINUTES
+
+        # Distance of each bus to its stop (NaN without a position or stops.txt)
+        positions = [positions_dict.get((c[1], c[2]), {}) for c in candidates]
+        distances = np.full(len(candidates), np.nan)
+        if stop_index is not None and len(stop_index):
+            lats = [np.nan if p.get("lat") is None else p["lat"] for p in positions]
+            lons = [np.nan if p.get("lon") is None else p["lon"] for p in positions]
+            distances = stop_index.distances([c[3] for c in candidates], lats, lons)
+            stopped = np.fromiter(
+                (p.get("current_status") == STOPPED_AT and p.get("feed_stop_id") == c[3]
+                 for p, c in zip(positions, candidates)),
+                dtype=bool, count=len(candidates),
+            )
+            located = ~np.isnan(distances)
+            at_stop = np.where(located, stopped | (np.nan_to_num(distances, nan=np.inf) <= AT_STOP_METERS), at_stop)
+
+        # —— SIMPLIFIED LATE‑ONLY LOGIC ——
+        # scheduled time today (or tomorrow if already past)
+        sched_ts = midnight_ts + scheduled % SECONDS_PER_DAY
+        sched_ts = np.where(sched_ts < now_ts, sched_ts + SECONDS_PER_DAY, sched_ts)
+        late = (scheduled >= 0) & (arrivals > sched_ts)
+
+        for i, (final_key, route_id, trip_id, stop_id, _, _, trip_data) in enumerate(candidates):
             delay_text = None
-            if scheduled_arrival_str:
-                try:
-                    # scheduled datetime today (or tomorrow if already past)
-                    h, m, s = map(int, scheduled_arrival_str.split(":"))
-                    sched_dt = datetime.now().replace(hour=h % 24, minute=m, second=s, microsecond=0)
-                    if sched_dt < datetime.now():
-                        sched_dt += timedelta(days=1)
-
-                    predicted_dt = datetime.fromtimestamp(arrival_unix)
-                    if predicted_dt > sched_dt:
-                        delay_text = f"En retard (prévu à {sched_dt.strftime('%I:%M %p')})"
-                except Exception:
-                    pass
+            if late[i]:
+                sched_dt = datetime.fromtimestamp(sched_ts[i])
+                delay_text = f"En retard (prévu à {sched_dt.strftime('%I:%M %p')})"
 
             # Occupancy
-            pos_info = positions_dict.get((route_id, trip_id), {})
+            pos_info = positions[i]
             raw_occ = pos_info.get("occupancy")
             occ_str = stm_map_occupancy_status(raw_occ) if raw_occ else "Unknown"
 
-            at_stop_flag = isinstance(minutes_to_arrival, (int, float)) and minutes_to_arrival < 2
-
             bus_obj = {
                 "route_id": route_id,
                 "trip_id": trip_id,
                 "stop_id": stop_id,
-                "arrival_time": minutes_to_arrival,
+                "arrival_time": float(minutes_to_arrival[i]),
                 "occupancy": occ_str,
-                "direction": combo_info[final_key]["direction"],
-                "location": combo_info[final_key]["location"],
+                "direction": STM_COMBO_INFO[final_key]["direction"],
+                "location": STM_COMBO_INFO[final_key]["location"],
                 "delayed_text": delay_text,
                 "early_text": None,                 # always None now
-                "at_stop": at_stop_flag,
-                "wheelchair_accessible": wheelchair_accessible
+                "at_stop": bool(at_stop[i]),
+                "wheelchair_accessible": trip_data.wheelchair_accessible,
+                "lat": pos_info.get("lat"),
+                "lon": pos_info.get("lon"),
+                "distance_m": None if np.isnan(distances[i]) else int(round(distances[i])),
             }
 
             existing = closest_buses[final_key]
-            if existing is None or (
-                isinstance(existing["arrival_time"], (int, float)) and
-                isinstance(minutes_to_arrival, (int, float)) and
-                minutes_to_arrival < existing["arrival_time"]
-            ):
+            if existing is None or bus_obj["arrival_time"] < existing["arrival_time"]:
                 closest_buses[final_key] = bus_obj
 
-    # 2) Fallback to schedule-only if no real-time found
-    now = datetime.now()
-    for (gtfs_route, wanted_stop, final_key) in desired_combos:
-        if closest_buses[final_key] is None:
-            nextScheduled = None
-            route_trip_ids = {
-                tid for tid, data in stm_trips.items() if data["route_id"] == gtfs_route
+    # 2) Estimate from the located buses when the trip updates say nothing...
+    missing = [combo for combo in STM_DESIRED_COMBOS if closest_buses[combo[2]] is None]
+    if missing and estimator is not None:
+        for (gtfs_route, wanted_stop, final_key) in missing:
+            estimate = estimate_stm_arrival(gtfs_route, wanted_stop, positions_dict, estimator)
+            if estimate is None:
+                continue
+            seconds, trip_id = estimate
+            pos_info = positions_dict.get((gtfs_route, trip_id), {})
+            raw_occ = pos_info.get("occupancy")
+            distance_m = None
+            if stop_index is not None:
+                distance_m = stop_index.distance_to(wanted_stop, pos_info.get("lat"), pos_info.get("lon"))
+            trip_data = stm_trips.get(stm_trip_ids.get(trip_id))
+            closest_buses[final_key] = {
+                "route_id": gtfs_route,
+                "trip_id": trip_id,
+                "stop_id": wanted_stop,
+                "arrival_time": float(seconds // 60),
+                "occupancy": stm_map_occupancy_status(raw_occ) if raw_occ else "Unknown",
+                "direction": STM_COMBO_INFO[final_key]["direction"],
+                "location": STM_COMBO_INFO[final_key]["location"],
+                "delayed_text": None,
+                "early_text": None,
+                "at_stop": distance_m is not None and distance_m <= AT_STOP_METERS,
+                "wheelchair_accessible": trip_data.wheelchair_accessible if trip_data else False,
+                "lat": pos_info.get("lat"),
+                "lon": pos_info.get("lon"),
+                "distance_m": None if distance_m is None else int(round(distance_m)),
+                "estimated": True,
             }
-            for (trip_id, stop_id), schedTimeStr in stm_stop_times.items():
-                if trip_id not in route_trip_ids or stop_id != wanted_stop:
-                    continue
-                try:
-                    parts = schedTimeStr.split(":")
-                    hours = int(parts[0]) % 24
-                    mins  = int(parts[1])
-                    secs  = int(parts[2]) if len(parts) > 2 else 0
-                    schedDt = datetime(now.year, now.month, now.day, hours, mins, secs)
-                    if schedDt <= now:
-                        schedDt += timedelta(days=1)
-                    if nextScheduled is None or schedDt < nextScheduled:
-                        nextScheduled = schedDt
-                except:
-                    continue
-
-            arrival_str = nextScheduled.strftime("%I:%M %p") if nextScheduled else "Indisponible"
+        missing = [combo for combo in missing if closest_buses[combo[2]] is None]
+
+    # 3) ...and fall back to schedule-only if still nothing
+    if missing:
+        if departure_board is None:
+            departure_board = build_stm_departure_board(stm_trips, stm_stop_times)
+        now = datetime.now()
+        scheduled_next = next_departures(
+            departure_board,
+            seconds_since_midnight(now),
+            active_services=calendar.active(now.date()) if calendar is not None else None,
+            include_now=False,
+        )
+
+        for (gtfs_route, wanted_stop, final_key) in missing:
+            departure = scheduled_next.get(final_key)
+            if departure:
+                scheduled_dt = datetime(1900, 1, 1) + timedelta(seconds=departure["scheduled_seconds"])
+                arrival_str = scheduled_dt.strftime("%I:%M %p")
+            else:
+                arrival_str = "Indisponible"
             fallback = {
                 "route_id": gtfs_route,
                 "trip_id": "N/A",
                 "stop_id": wanted_stop,
                 "arrival_time": arrival_str,
                 "occupancy": "Unknown",
-                "direction": combo_info[final_key]["direction"],
-                "location": combo_info[final_key]["location"],
+                "direction": STM_COMBO_INFO[final_key]["direction"],
+                "location": STM_COMBO_INFO[final_key]["location"],
                 "delayed_text": None,
                 "early_text": None,
                 "at_stop": False,
@@ -511,14 +622,13 @@ def process_stm_trip_updates(trip_entities, stm_trips, stm_stop_times, positions
             }
             closest_buses[final_key] = fallback
 
-    # 3) Return in desired order
-    order = ["171_Est","171_Ouest","180_Est","180_Ouest","164_Est","164_Ouest"]
-    return [closest_buses[k] for k in order if closest_buses[k] is not None]
+    # 4) Return in desired order
+    return [closest_buses[k] for k in STM_COMBO_ORDER if closest_buses[k] is not None]
 
 
 
 def debug_print_stm_occupancy_status(desired_routes, stm_trips):
-    entities = fetch_stm_vehicle_positions()
+    entities = fetch_stm_vehicle_positions(desired_routes)
     
     if not entities:
         print("No STM vehicle positions found.")
@@ -0,0 +1,139 @@
+# logging_setup.py
+"""
+Logging for the display API.
+
+All 'BdeB-GTFS.*' loggers go through a DeferredQueueHandler: request threads
+only put the record on a queue, and a background QueueListener formats it
+(message, traceback) and writes it to stdout (read by capture_app_logs in admin.py). Configuration, from the
+environment:
+
+  LOG_LEVEL        level of the 'BdeB-GTFS' logger (default INFO)
+  LOG_LEVELS       per-module overrides, e.g. "exo=DEBUG,stm=WARNING,feeds=INFO"
+  LOG_FORMAT       "text" (default) or "json", one object per line
+  LOG_SAMPLE_SECS  minimum interval between two sampled events of the same key
+
+Structured fields go in ``extra={"fields": {...}}``. High-frequency events
+(one per fetch, per vehicle...) pass ``extra={"sample": "<key>"}`` and are
+kept at most once per LOG_SAMPLE_SECS, with the number of dropped events.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+ROOT_LOGGER = "BdeB-GTFS"
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_listener = None
+
+
+class SamplingFilter(logging.Filter):
+    """Let through one record per ``sample`` key every ``interval`` seconds."""
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._last = {}
+        self._dropped = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, float("-inf")) < self.interval:
+                self._dropped[key] = self._dropped.get(key, 0) + 1
+                return False
+            self._last[key] = now
+            dropped = self._dropped.pop(key, 0)
+        if dropped:
+            record.fields = {**getattr(record, "fields", {}), "sampled_out": dropped}
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves the record unformatted. The stock ``prepare``
+    renders the message and traceback on the calling thread, and folds the
+    traceback into ``msg`` (so StructuredFormatter never saw ``exc_info``).
+    Here the record is only copied; arguments are formatted by the listener,
+    so they must not be mutated after the call.
+    """
+
+    def prepare(self, record):
+        return copy.copy(record)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Text lines with trailing key=value fields, or one JSON object per line."""
+
+    def __init__(self, as_json=False):
+        super().__init__(TEXT_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        if self.as_json:
+            payload = {
+                "ts": self.formatTime(record, self.datefmt),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                payload["exc"] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+        line = super().format(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def parse_levels(spec):
+    """"exo=DEBUG,stm=WARNING" -> {"BdeB-GTFS.exo": DEBUG, "BdeB-GTFS.stm": WARNING}."""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if not name or not level:
+            continue
+        if not name.startswith(ROOT_LOGGER):
+            name = f"{ROOT_LOGGER}.{name}"
+        levels[name] = logging.getLevelName(level) if not level.isdigit() else int(level)
+    return levels
+
+
+def setup_logging(stream=None):
+    """Install the queue handler and start the writer thread (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in parse_levels(os.getenv("LOG_LEVELS")).items():
+        if isinstance(level, int):
+            logging.getLogger(name).setLevel(level)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(StructuredFormatter(as_json=os.getenv("LOG_FORMAT", "text").lower() == "json"))
+
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_SECS", "60"))))
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
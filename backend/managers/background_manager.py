@@ -2,6 +2,9 @@
 import os, shutil, json
 from datetime import datetime
 
+from .background_schedule import parse_slots
+from . import image_pipeline
+
 BASE_DIR    = os.path.dirname(__file__)            # .../src/bdeb_gtfs/managers
 PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, '..'))  # .../src/bdeb_gtfs
 
@@ -15,35 +18,16 @@ def get_slots():
       [{ "path": "./assets/images/foo.png",
          "start": "2025-07-01",
          "end":   "2025-07-31" }, …]
+    (same parser as the display, see background_schedule.parse_slots)
     """
     with open(CSS_FILE, 'r', encoding='utf-8') as f:
         text = f.read()
-    # find between /* MULTISLOT:  …  */
-    start_token = '/* MULTISLOT:'
-    start = text.find(start_token)
-    if start == -1:
-        # No MULTISLOT block present
-        return []
-    end = text.find('*/', start)
-    if end == -1:
-        # Unterminated block
-        return []
-
-    raw = text[start + len(start_token):end].strip()
-    if not raw:
-        # Empty block
-        return []
-
-    try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
-        # Invalid JSON inside the block
-        return []
+    return parse_slots(text)
 
 def set_slots(slots):
     """
     Given a list of slot dicts, copy any .path file
-    into IMAGES_DIR, rewrite CSS_FILE’s MULTISLOT block.
+    into IMAGES_DIR (and queue its variants), rewrite CSS_FILE’s MULTISLOT block.
     """
     # ensure images dir exists
     os.makedirs(IMAGES_DIR, exist_ok=True)
@@ -53,6 +37,7 @@ def set_slots(slots):
         src = slot.get("path")
         if src and os.path.isfile(src):
             dst = shutil.copy(src, IMAGES_DIR)
+            image_pipeline.import_image(dst)
             # normalize to relative web path
             slot["path"] = "./assets/images/" + os.path.basename(dst)
 
@@ -68,16 +53,7 @@ def set_slots(slots):
 def list_images():
     """
     Return all image file paths in IMAGES_DIR, newest first.
-    Each entry is a web-relative path like './assets/images/foo.png'.
+    Each entry is a web-relative path like './assets/images/foo.png'
+    (read from the image manifest, see image_pipeline).
     """
-    # ensure the folder is there
-    os.makedirs(IMAGES_DIR, exist_ok=True)
-
-    entries = []
-    for e in os.scandir(IMAGES_DIR):
-        if e.is_file():
-            entries.append((e.stat().st_mtime, e.name))
-
-    # sort newest first
-    entries.sort(reverse=True)
-    return [f"./assets/images/{name}" for _, name in entries]
+    return image_pipeline.list_images()
@@ -0,0 +1,139 @@
+# background_schedule.py
+"""
+Which background the display shows, from the MULTISLOT block of
+static/index.css.
+
+The block is the JSON list written by the admin console
+([{"path": ..., "start": "YYYY-MM-DD", "end": "YYYY-MM-DD" or null}, ...]);
+the older one-slot-per-line form ("SLOT1: <url> from <date> to <date>") is
+still read. The slots are parsed once per file modification, and the active
+slot is computed with the time of the next switch (a start or the day after
+an end), so it is only recomputed once that time has passed.
+"""
+import os, re, json, threading
+from datetime import datetime, date, time as dt_time, timedelta
+
+BASE_DIR    = os.path.dirname(__file__)                       # .../backend/managers
+PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, '..'))   # .../backend
+
+CSS_FILE = os.path.join(PROJECT_DIR, 'static', 'index.css')
+
+_BLOCK_RE = re.compile(r"/\*\s*MULTISLOT:\s*(.*?)\*/", re.IGNORECASE | re.DOTALL)
+_LEGACY_SLOT_RE = re.compile(
+    r"SLOT\d+:\s+(.*?)\s+from\s+(\d{4}-\d{2}-\d{2})\s+to\s+(\d{4}-\d{2}-\d{2})", re.IGNORECASE
+)
+
+_lock = threading.Lock()
+# css path -> {"mtime", "slots", "active" (last result), "valid_until" (its next switch)}
+_cache = {}
+
+
+def parse_slots(css_text):
+    """Slot dicts ({"path", "start", "end"}) of the MULTISLOT block, [] if none."""
+    match = _BLOCK_RE.search(css_text)
+    if not match:
+        return []
+    raw = match.group(1).strip()
+    if not raw:
+        return []
+    if raw.startswith("["):
+        try:
+            slots = json.loads(raw)
+        except json.JSONDecodeError:
+            return []
+        return [slot for slot in slots if isinstance(slot, dict)]
+    slots = []
+    for line in raw.splitlines():
+        m = _LEGACY_SLOT_RE.match(line.strip())
+        if m:
+            slots.append({"path": m.group(1).strip(), "start": m.group(2), "end": m.group(3)})
+    return slots
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _image_exists(path_url, css_path):
+    """Whether a "/static/..." slot path points to an existing file (other URLs are trusted)."""
+    if not path_url.startswith("/static/"):
+        return True
+    static_root = os.path.dirname(os.path.dirname(os.path.abspath(css_path)))  # CSS file is static/index.css
+    return os.path.isfile(os.path.join(static_root, *path_url.lstrip("/").split("/")))
+
+
+def get_slots(css_path=CSS_FILE):
+    """
+    The parsed slots, re-read only when the CSS file changed. Slots whose
+    image is missing get path None (as in the admin console).
+    """
+    try:
+        mtime = os.path.getmtime(css_path)
+    except OSError:
+        mtime = None
+    with _lock:
+        entry = _cache.get(css_path)
+        if entry is None or entry["mtime"] != mtime:
+            slots = []
+            if mtime is not None:
+                with open(css_path, "r", encoding="utf-8") as f:
+                    slots = parse_slots(f.read())
+            for slot in slots:
+                if slot.get("path") and not _image_exists(slot["path"], css_path):
+                    slot["path"] = None
+            entry = _cache[css_path] = {"mtime": mtime, "slots": slots, "active": None, "valid_until": None}
+        return entry["slots"]
+
+
+def compute_active(slots, now):
+    """
+    (active slot index or None, datetime of the next switch or None). A slot
+    is active from its start date to its end date included; the first active
+    slot with an image wins.
+    """
+    today = now.date()
+    active = None
+    boundaries = []
+    for index, slot in enumerate(slots):
+        if not slot.get("path"):
+            continue
+        start = _parse_date(slot.get("start"))
+        end = _parse_date(slot.get("end"))
+        if start:
+            boundaries.append(datetime.combine(start, dt_time.min))
+        if end:
+            boundaries.append(datetime.combine(end + timedelta(days=1), dt_time.min))
+        if active is None and (start is None or start <= today) and (end is None or today <= end):
+            active = index
+    upcoming = [b for b in boundaries if b > now]
+    return active, (min(upcoming) if upcoming else None)
+
+
+def active_background(now=None, css_path=CSS_FILE):
+    """
+    {"path", "slot", "start", "end", "next_switch"} of the background to show
+    now (path None if no slot is active); next_switch is a local ISO time or
+    None. Served from the cache until the file changes or the switch passes.
+    """
+    now = now or datetime.now()
+    slots = get_slots(css_path)
+    with _lock:
+        entry = _cache[css_path]
+        if entry["active"] is not None and (entry["valid_until"] is None or now < entry["valid_until"]):
+            return entry["active"]
+        index, next_switch = compute_active(slots, now)
+        slot = slots[index] if index is not None else {}
+        entry["active"] = {
+            "path": slot.get("path"),
+            "slot": index,
+            "start": slot.get("start"),
+            "end": slot.get("end"),
+            "next_switch": next_switch.isoformat() if next_switch else None,
+        }
+        entry["valid_until"] = next_switch
+        return entry["active"]
@@ -0,0 +1,390 @@
+# image_pipeline.py
+"""
+Background images: processed once when imported, listed from a manifest.
+
+``import_image`` hashes the original (content addressed: the first 16 hex
+digits of its SHA-256) and records it, then a background worker, when
+Pillow is installed, writes WebP variants (and AVIF ones if the Pillow
+build supports it) at each width of VARIANT_WIDTHS below the original
+width, plus a tiny blurred placeholder inlined as a data URI. Variants go
+to static/assets/variants/<hash>/ and never change once written, so
+admin.py serves them with an immutable Cache-Control; the directory of a
+hash no image uses any more (replaced or removed file) is deleted. Without
+Pillow only the original is recorded and served.
+
+MANIFEST_FILE lists every image of IMAGES_DIR with its variants. It is
+written atomically and read back once per modification, so list_images()
+does not scan the folder: it only checks the folder's mtime, and syncs
+when files were added, removed or renamed (on first use too).
+``sync_manifest`` rebuilds it from the folder (at admin startup, or
+``python -m backend.managers.image_pipeline``).
+
+Manifest layout: {"version": 1, "images": {name: {"hash", "bytes", "mtime",
+"width", "height", "variants": [{"width", "height", "format", "url"}],
+"placeholder"}}}
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+import logging
+logger = logging.getLogger('BdeB-GTFS.images')
+
+try:
+    from PIL import Image, ImageFilter, ImageOps, features
+except ImportError:  # optional: originals are served as is
+    Image = None
+
+BASE_DIR    = os.path.dirname(__file__)                       # .../backend/managers
+PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, '..'))   # .../backend
+
+IMAGES_DIR    = os.path.join(PROJECT_DIR, 'static', 'assets', 'images')
+VARIANTS_DIR  = os.path.join(PROJECT_DIR, 'static', 'assets', 'variants')
+MANIFEST_FILE = os.path.join(PROJECT_DIR, 'static', 'assets', 'images.manifest.json')
+
+IMAGES_URL   = "/static/assets/images"
+VARIANTS_URL = "/static/assets/variants"
+
+MANIFEST_VERSION = 1
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp", ".avif"}
+# Common wall screen widths; the original width is added when smaller than 3840
+VARIANT_WIDTHS = (1280, 1920, 2560, 3840)
+# format -> (extension, Pillow save options)
+VARIANT_FORMATS = {
+    "avif": ("avif", {"quality": 60, "speed": 6}),
+    "webp": ("webp", {"quality": 82, "method": 4}),
+}
+PLACEHOLDER_WIDTH = 32
+PLACEHOLDER_BLUR = 2
+
+_lock = threading.Lock()
+_manifest = {"mtime": None, "images": {}}
+_folder = {"mtime": None}  # IMAGES_DIR mtime at the last sync
+
+# Variant encoding runs on one background thread (started on first use)
+_queue = queue.Queue()
+_queued = set()  # names waiting or being processed
+_worker = None
+
+
+def pillow_formats():
+    """Variant formats the installed Pillow can write ([] without Pillow)."""
+    if Image is None:
+        return []
+    return [fmt for fmt in VARIANT_FORMATS if fmt != "avif" or features.check("avif")]
+
+
+def content_hash(path):
+    """First 16 hex digits of the SHA-256 of the file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".img-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _encode(image, fmt, options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **options)
+    return buffer.getvalue()
+
+
+def _variant_widths(width):
+    widths = [w for w in VARIANT_WIDTHS if w < width]
+    if width <= VARIANT_WIDTHS[-1]:
+        widths.append(width)
+    return widths
+
+
+def _make_variants(path, digest):
+    """(width, height, variants, placeholder) of the image, variants written to VARIANTS_DIR."""
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    width, height = image.size
+
+    variants = []
+    directory = os.path.join(VARIANTS_DIR, digest)
+    for target in _variant_widths(width):
+        target_height = max(1, round(height * target / width))
+        resized = None
+        for fmt in pillow_formats():
+            extension, options = VARIANT_FORMATS[fmt]
+            filename = f"{target}w.{extension}"
+            variant_path = os.path.join(directory, filename)
+            if not os.path.isfile(variant_path):  # same content, same variants
+                if resized is None:
+                    resized = image if target == width else image.resize((target, target_height), Image.LANCZOS)
+                _write_atomic(variant_path, _encode(resized, fmt, options))
+            variants.append({
+                "width": target,
+                "height": target_height,
+                "format": fmt,
+                "url": f"{VARIANTS_URL}/{digest}/{filename}",
+            })
+
+    thumb = image.resize((PLACEHOLDER_WIDTH, max(1, round(height * PLACEHOLDER_WIDTH / width))), Image.BILINEAR)
+    thumb = thumb.filter(ImageFilter.GaussianBlur(PLACEHOLDER_BLUR))
+    placeholder = "data:image/webp;base64," + base64.b64encode(_encode(thumb, "webp", {"quality": 40})).decode("ascii")
+    return width, height, variants, placeholder
+
+
+def process_image(path, generate=True, previous=None):
+    """
+    Manifest entry of the image at ``path``; with ``generate`` (and Pillow)
+    its variants and placeholder are made, otherwise only the original is
+    described (keeping those of ``previous`` if the content is the same).
+    """
+    stat = os.stat(path)
+    digest = content_hash(path)
+    if not generate and previous and previous.get("hash") == digest:
+        return dict(previous, bytes=stat.st_size, mtime=stat.st_mtime)
+    entry = {
+        "hash": digest,
+        "bytes": stat.st_size,
+        "mtime": stat.st_mtime,
+        "width": None,
+        "height": None,
+        "variants": [],
+        "placeholder": None,
+    }
+    if generate and Image is not None:
+        try:
+            entry["width"], entry["height"], entry["variants"], entry["placeholder"] = _make_variants(path, digest)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not make variants of %s: %s", os.path.basename(path), e)
+    return entry
+
+
+def load_manifest(path=MANIFEST_FILE):
+    """{name: entry} of the manifest, re-read only when the file changed ({} if missing)."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _lock:
+        if _manifest["mtime"] == mtime:
+            return _manifest["images"]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable image manifest %s: %s", path, e)
+        return {}
+    images = payload.get("images") if isinstance(payload, dict) and payload.get("version") == MANIFEST_VERSION else None
+    with _lock:
+        _manifest["mtime"] = mtime
+        _manifest["images"] = images if isinstance(images, dict) else {}
+        return _manifest["images"]
+
+
+def _prune_variants(images):
+    """Delete the variant directories of hashes no image of ``images`` uses."""
+    used = {entry.get("hash") for entry in images.values()}
+    try:
+        directories = [e for e in os.scandir(VARIANTS_DIR) if e.is_dir()]
+    except OSError:
+        return
+    for directory in directories:
+        if directory.name not in used:
+            shutil.rmtree(directory.path, ignore_errors=True)
+            logger.info("Removed orphaned variants %s", directory.name)
+
+
+def _save_manifest(images, path=MANIFEST_FILE):
+    payload = {"version": MANIFEST_VERSION, "images": images}
+    _write_atomic(path, json.dumps(payload, indent=1, ensure_ascii=False).encode("utf-8"))
+    with _lock:
+        _manifest["mtime"] = os.path.getmtime(path)
+        _manifest["images"] = images
+    _prune_variants(images)
+
+
+_write_lock = threading.Lock()  # one read-modify-write of the manifest at a time
+
+
+def _needs_variants(entry):
+    return Image is not None and entry is not None and not entry.get("variants")
+
+
+def _generate(name):
+    """Make the variants of manifest image ``name``, unless it changed meanwhile."""
+    entry = load_manifest().get(name)
+    if not _needs_variants(entry):
+        return
+    try:
+        generated = process_image(os.path.join(IMAGES_DIR, name))
+    except OSError:
+        return  # removed since
+    with _write_lock:
+        images = dict(load_manifest())
+        current = images.get(name)
+        if current is None or current.get("hash") != generated["hash"]:
+            _prune_variants(images)  # replaced while encoding: drop what was written
+            return
+        images[name] = generated
+        _save_manifest(images)
+    logger.info("Made %d variants of %s", len(generated["variants"]), name)
+
+
+def _work():
+    while True:
+        name = _queue.get()
+        try:
+            _generate(name)
+        except Exception:
+            logger.exception("Could not make variants of %s", name)
+        finally:
+            with _lock:
+                _queued.discard(name)
+
+
+def _submit(name):
+    global _worker
+    with _lock:
+        if name in _queued:
+            return
+        _queued.add(name)
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name="image-variants", daemon=True)
+            _worker.start()
+    _queue.put(name)
+
+
+def is_processing(name):
+    """Whether the variants of ``name`` are still being made."""
+    with _lock:
+        return name in _queued
+
+
+def import_image(path):
+    """
+    Add an image already copied into IMAGES_DIR to the manifest (original
+    only) and queue its variants; returns its entry as recorded now.
+    """
+    name = os.path.basename(path)
+    with _write_lock:
+        images = dict(load_manifest())
+        entry = process_image(path, generate=False, previous=images.get(name))
+        images[name] = entry
+        _save_manifest(images)
+    if _needs_variants(entry):
+        _submit(name)
+    logger.info("Imported %s (%s)", name, entry["hash"])
+    return entry
+
+
+def sync_manifest(generate=True):
+    """
+    Bring the manifest in line with IMAGES_DIR: new or modified images are
+    recorded, removed ones dropped (with their variants). With ``generate``
+    the entries missing variants (new, or made without Pillow) are completed
+    before returning. Returns the images.
+    """
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    with _lock:
+        _folder["mtime"] = os.path.getmtime(IMAGES_DIR)
+    current = load_manifest()
+    on_disk = {}
+    for e in os.scandir(IMAGES_DIR):
+        if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_EXTENSIONS:
+            on_disk[e.name] = e.stat()
+
+    images = {}
+    for name, stat in on_disk.items():
+        entry = current.get(name)
+        if entry is None or entry.get("bytes") != stat.st_size or entry.get("mtime") != stat.st_mtime:
+            entry = process_image(os.path.join(IMAGES_DIR, name), generate=False, previous=entry)
+        images[name] = entry
+
+    with _write_lock:
+        latest = load_manifest()
+        # keep entries imported (or given variants) while the folder was being processed
+        images.update({
+            name: entry for name, entry in latest.items()
+            if current.get(name) != entry and (name in on_disk or name not in current)
+        })
+        if images != latest or not os.path.isfile(MANIFEST_FILE):
+            _save_manifest(images)
+
+    if generate:
+        for name, entry in images.items():
+            if _needs_variants(entry):
+                _generate(name)
+        return load_manifest()
+    return images
+
+
+def _sync_if_changed():
+    """
+    Sync the manifest when IMAGES_DIR changed since the last sync (images
+    dropped in or deleted by hand), and queue the variants of new images.
+    An image overwritten in place does not change the folder's mtime; the
+    console imports those itself.
+    """
+    try:
+        mtime = os.path.getmtime(IMAGES_DIR)
+    except OSError:
+        mtime = None
+    with _lock:
+        if mtime is not None and _folder["mtime"] == mtime:
+            return
+    images = sync_manifest(generate=False)
+    for name, entry in images.items():
+        if _needs_variants(entry):
+            _submit(name)
+
+
+def list_images():
+    """Web paths ('./assets/images/foo.png') of the manifest images, newest first."""
+    _sync_if_changed()
+    images = load_manifest()
+    ordered = sorted(images.items(), key=lambda item: item[1].get("mtime") or 0, reverse=True)
+    return [f"./assets/images/{name}" for name, _ in ordered]
+
+
+def image_info(path_url):
+    """
+    {"variants", "placeholder"} of a slot path ("/static/assets/images/foo.png"
+    or "./assets/images/foo.png"); empty lists/None if it is not in the manifest.
+    """
+    info = {"variants": [], "placeholder": None}
+    if not path_url or "/assets/images/" not in path_url:
+        return info
+    entry = load_manifest().get(path_url.rsplit("/", 1)[1])
+    if entry:
+        info["variants"] = entry.get("variants") or []
+        info["placeholder"] = entry.get("placeholder")
+    return info
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if Image is None:
+        logger.warning("Pillow is not installed: only the originals are listed")
+    synced = sync_manifest()
+    print(f"{len(synced)} images, {sum(len(e['variants']) for e in synced.values())} variants, formats: {pillow_formats() or 'none'}")
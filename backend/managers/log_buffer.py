@@ -0,0 +1,78 @@
+# log_buffer.py
+"""
+Bounded buffer for the main app's console output (read by admin.py).
+
+Each line gets an increasing sequence number so the admin console can ask
+only for what it has not seen yet (``since(after)``). Once ``capacity``
+lines are held, the oldest ones are dropped from memory; if a spill file is
+configured they are appended to it first, with size-based rotation
+(``main_app.log``, ``main_app.log.1``, ...).
+"""
+import os
+import threading
+from collections import deque
+
+
+class LogBuffer:
+    def __init__(self, capacity=5000, spill_path=None, spill_max_bytes=5 * 1024 * 1024, spill_backups=3):
+        self._lines = deque(maxlen=capacity)  # (seq, line)
+        self._last_seq = 0
+        self._lock = threading.Lock()
+        self.spill_path = spill_path
+        self.spill_max_bytes = spill_max_bytes
+        self.spill_backups = spill_backups
+        self._spill_file = None
+
+    def append(self, line):
+        with self._lock:
+            if self.spill_path and len(self._lines) == self._lines.maxlen:
+                self._spill(self._lines[0][1])
+            self._last_seq += 1
+            self._lines.append((self._last_seq, line))
+            return self._last_seq
+
+    def since(self, after=0, limit=None):
+        """
+        Lines with a sequence number above ``after``, oldest first, as a dict:
+        {"lines": [...], "first": <seq of lines[0]>, "last": <latest seq>,
+         "truncated": True if lines after ``after`` were already dropped}.
+        """
+        with self._lock:
+            last = self._last_seq
+            oldest = self._lines[0][0] if self._lines else last + 1
+            # deque indexes are contiguous sequence numbers
+            start = max(after + 1 - oldest, 0)
+            entries = [self._lines[i] for i in range(start, len(self._lines))]
+        if limit is not None and len(entries) > limit:
+            entries = entries[-limit:]
+        return {
+            "lines": [line for _, line in entries],
+            "first": entries[0][0] if entries else last + 1,
+            "last": last,
+            "truncated": bool(entries) and entries[0][0] > after + 1,
+        }
+
+    def text(self):
+        with self._lock:
+            return "\n".join(line for _, line in self._lines)
+
+    def __len__(self):
+        return len(self._lines)
+
+    def _spill(self, line):
+        try:
+            if self._spill_file is None:
+                self._spill_file = open(self.spill_path, "a", encoding="utf-8")
+            elif self._spill_file.tell() >= self.spill_max_bytes:
+                self._spill_file.close()
+                for i in range(self.spill_backups - 1, 0, -1):
+                    older = f"{self.spill_path}.{i}"
+                    if os.path.exists(older):
+                        os.replace(older, f"{self.spill_path}.{i + 1}")
+                os.replace(self.spill_path, f"{self.spill_path}.1")
+                self._spill_file = open(self.spill_path, "a", encoding="utf-8")
+            self._spill_file.write(line + "\n")
+            self._spill_file.flush()
+        except OSError:
+            # Losing old console lines is acceptable, blocking the reader is not
+            self._spill_file = None
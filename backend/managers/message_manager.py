@@ -0,0 +1,120 @@
+# message_manager.py
+"""
+Custom messages shown with the alerts (GTFSManager/public/custom_messages.json).
+
+The messages live in memory; readers get the current list, which is replaced
+(never modified) on change, so a read is never torn. ``replace`` persists
+with write-to-temp + os.replace, bumps ``generation`` and calls the
+subscribers (the display pipeline reschedules the messages right away).
+Edits made to the file by hand are picked up by ``check_disk``, at most every
+``DISK_CHECK_INTERVAL`` seconds.
+"""
+import os, json, tempfile, threading, time
+import logging
+logger = logging.getLogger('BdeB-GTFS.messages')
+
+BASE_DIR    = os.path.dirname(__file__)                       # .../backend/managers
+PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, '..'))   # .../backend
+
+MESSAGES_FILE = os.path.join(PROJECT_DIR, 'GTFSManager', 'public', 'custom_messages.json')
+DISK_CHECK_INTERVAL = 5  # seconds
+
+
+class MessageStore:
+    def __init__(self, path=MESSAGES_FILE):
+        self.path = path
+        self.generation = 0
+        self._messages = []
+        self._exists = False
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._load()
+
+    def _load(self):
+        """Read the file into memory; a missing or invalid file means no messages."""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r', encoding='utf-8') as f:
+                messages = json.load(f)
+            exists = True
+        except FileNotFoundError:
+            mtime, messages, exists = None, [], False
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable %s: %s", self.path, e)
+            mtime, messages, exists = None, [], True
+        if not isinstance(messages, list):
+            messages = []
+        self._messages = messages
+        self._exists = exists
+        self._mtime = mtime
+
+    def messages(self):
+        """The current list of messages (do not modify it)."""
+        return self._messages
+
+    def exists(self):
+        return self._exists
+
+    def subscribe(self, callback):
+        """Call ``callback(generation, messages)`` after each change."""
+        self._subscribers.append(callback)
+
+    def replace(self, messages):
+        """Persist ``messages`` (a list) atomically and notify the subscribers."""
+        if not isinstance(messages, list):
+            raise ValueError("custom messages must be a JSON list")
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.custom_messages-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(messages, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self._messages = list(messages)
+            self._exists = True
+            self._mtime = os.path.getmtime(self.path)
+            self.generation += 1
+            generation, current = self.generation, self._messages
+        self._notify(generation, current)
+        return generation
+
+    def check_disk(self, now=None):
+        """Reload if the file was changed by something else (throttled)."""
+        now = time.monotonic() if now is None else now
+        if now - self._checked_at < DISK_CHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            self._load()
+            self.generation += 1
+            generation, current = self.generation, self._messages
+        logger.info("custom_messages.json changed on disk, %d messages", len(current))
+        self._notify(generation, current)
+        return True
+
+    def _notify(self, generation, messages):
+        for callback in list(self._subscribers):
+            try:
+                callback(generation, messages)
+            except Exception:
+                logger.exception("Custom messages subscriber failed")
+
+
+message_store = MessageStore()
@@ -0,0 +1,139 @@
+# metrics.py
+"""
+In-process metrics in the Prometheus text format (served at /api/metrics).
+
+Counters, gauges and histograms are keyed by name and label values and kept
+in module-level dicts, like the other caches of the backend. Everything is
+cheap enough to call on the request path: one lock and a few dict lookups.
+"""
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds: upstream calls are 50 ms - 5 s, stages much less
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "bdeb_stage_seconds": "Duration of each stage of /api/data (fetch, parse, process, merge).",
+    "bdeb_request_seconds": "Duration of HTTP requests served by the display API.",
+    "bdeb_requests_total": "HTTP requests served by the display API, by endpoint and status.",
+    "bdeb_upstream_seconds": "Duration of upstream feed requests.",
+    "bdeb_upstream_responses_total": "Upstream feed responses by source and HTTP status (error = no response).",
+    "bdeb_entities_total": "Feed entities / rows handled, by feed.",
+    "bdeb_cache_requests_total": "Lookups of the Chrono and weather caches (hit, miss or stale fallback).",
+    "bdeb_feed_parse_ms": "Parse time of the last filtered GTFS-RT parse.",
+    "bdeb_feed_entities": "Entities in the last filtered GTFS-RT feed (total and parsed).",
+    "bdeb_upstream_skipped_total": "Guarded upstream requests answered from the last good response, by reason.",
+    "bdeb_circuit_state": "Circuit breaker state per guarded endpoint (0 closed, 1 half-open, 2 open).",
+    "bdeb_upstream_tokens": "Request budget left per guarded endpoint.",
+    "bdeb_last_good_age_seconds": "Age of the last good response of each guarded endpoint.",
+    "bdeb_alert_cache_total": "Lookups of processed alerts by fingerprint (hit: unchanged alert, not processed again).",
+    "bdeb_eta_estimates_total": "Arrivals estimated from vehicle positions (no realtime prediction for the stop).",
+    "bdeb_snapshot_restored_age_seconds": "Age of each cache entry restored from the snapshot at startup.",
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_gauges = {}      # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+
+def _key(name, labels):
+    # Label values are strings in the output (and must sort: 200 vs "error")
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    index = bisect.bisect_left(DEFAULT_BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        histogram[index] += 1  # index == len(DEFAULT_BUCKETS) is the +Inf bucket
+        histogram[-1] += seconds
+
+
+class StageTimer:
+    """
+    Times consecutive stages of a request: each ``lap(stage)`` records the
+    time since the previous lap (or since the timer was created).
+    """
+
+    __slots__ = ("_last",)
+
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        observe("bdeb_stage_seconds", now - self._last, stage=stage)
+        self._last = now
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+
+    lines = []
+    for kind, series in (("counter", counters), ("gauge", gauges)):
+        for name in sorted({name for name, _ in series}):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (series_name, labels), value in sorted(series.items()):
+                if series_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for (series_name, labels), values in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(DEFAULT_BUCKETS, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            cumulative += values[len(DEFAULT_BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
@@ -0,0 +1,165 @@
+# gtfs_rt_stream.py
+"""
+Filter large GTFS-RT feeds at the wire level.
+
+The STM vehicle positions feed covers the whole island but the display only
+keeps a handful of routes. Instead of parsing the entire FeedMessage, the raw
+bytes are split into FeedEntity chunks and only the chunks that contain one of
+the wanted route_id values are parsed.
+"""
+import time
+from bisect import bisect_right
+
+from google.protobuf.internal import api_implementation
+from google.transit import gtfs_realtime_pb2
+
+# FeedMessage.entity is field 2; TripDescriptor.route_id is field 5 (tag 0x2a)
+ENTITY_FIELD = 2
+ROUTE_ID_TAG = b"\x2a"
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+# Stats of the last filtered parse of each feed, e.g. for /api/metrics
+feed_stats = {}
+
+
+def protobuf_backend():
+    """Name of the active protobuf implementation: 'upb', 'cpp' or 'python'."""
+    return api_implementation.Type()
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise ValueError("malformed varint")
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def entity_spans(data):
+    """
+    Return the (starts, ends) offsets of every serialized FeedEntity in a
+    FeedMessage. The header and unknown fields are skipped without being
+    decoded; single-byte keys and lengths take the fast path.
+    """
+    starts = []
+    ends = []
+    pos = 0
+    size = len(data)
+    while pos < size:
+        key = data[pos]
+        if key & 0x80:
+            key, pos = _read_varint(data, pos)
+        else:
+            pos += 1
+        wire_type = key & 0x7
+        if wire_type == WIRE_LENGTH_DELIMITED:
+            length = data[pos]
+            if length & 0x80:
+                length, pos = _read_varint(data, pos)
+            else:
+                pos += 1
+            end = pos + length
+            if end > size:
+                raise ValueError("truncated feed")
+            if key >> 3 == ENTITY_FIELD:
+                starts.append(pos)
+                ends.append(end)
+            pos = end
+        elif wire_type == WIRE_VARINT:
+            _, pos = _read_varint(data, pos)
+        elif wire_type == WIRE_FIXED64:
+            pos += 8
+        elif wire_type == WIRE_FIXED32:
+            pos += 4
+        else:
+            raise ValueError(f"unsupported wire type {wire_type}")
+    return starts, ends
+
+
+def find_all(data, marker):
+    """Offsets of every occurrence of ``marker`` in ``data``."""
+    hits = []
+    pos = data.find(marker)
+    while pos != -1:
+        hits.append(pos)
+        pos = data.find(marker, pos + 1)
+    return hits
+
+
+def route_id_markers(route_ids):
+    """Encoded `route_id` fields to look for inside an entity's bytes."""
+    markers = []
+    for route_id in route_ids:
+        raw = str(route_id).encode("utf-8")
+        markers.append(ROUTE_ID_TAG + _encode_varint(len(raw)) + raw)
+    return markers
+
+
+def parse_entities_for_routes(data, route_ids, feed_name="feed"):
+    """
+    Parse only the entities of a serialized FeedMessage that mention one of
+    ``route_ids``. The byte match is a prefilter: callers still check the
+    parsed route_id. Falls back to a full parse if the bytes cannot be split.
+    Returns the list of parsed FeedEntity messages.
+    """
+    started = time.perf_counter()
+    markers = route_id_markers(route_ids)
+    wanted = {str(route_id) for route_id in route_ids}
+    entities = []
+    total = 0
+
+    try:
+        # Locate the route markers in C, then parse only the entities holding them
+        hits = sorted(pos for marker in markers for pos in find_all(data, marker))
+        starts, ends = entity_spans(data)
+        total = len(starts)
+        parsed = set()
+        for hit in hits:
+            index = bisect_right(starts, hit) - 1
+            if index < 0 or index in parsed or hit >= ends[index]:
+                continue
+            parsed.add(index)
+            entities.append(gtfs_realtime_pb2.FeedEntity.FromString(data[starts[index]:ends[index]]))
+        mode = "stream"
+    except (ValueError, IndexError):
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(data)
+        total = len(feed.entity)
+        entities = [
+            entity for entity in feed.entity
+            if entity.HasField("vehicle") and entity.vehicle.trip.route_id in wanted
+        ]
+        mode = "full"
+
+    feed_stats[feed_name] = {
+        "bytes": len(data),
+        "entities_total": total,
+        "entities_parsed": len(entities),
+        "parse_ms": (time.perf_counter() - started) * 1000,
+        "mode": mode,
+        "backend": protobuf_backend(),
+        "at": time.time(),
+    }
+    return entities
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+"""
+Offline benchmark of the realtime processing pipeline.
+
+Replays recorded GTFS-RT snapshots (raw .pb FeedMessages, the format read by
+parsers/parse_vehicle_position.py) against the static GTFS under backend/GTFS
+and reports latency percentiles, peak memory and retained allocations for
+each stage, optionally with the feeds and static schedules scaled up.
+
+    python -m backend.scripts.benchmark --fixtures recordings/ --scale 1,10,100
+    python -m backend.scripts.benchmark --output bench.json --compare last.json
+
+Expected fixture names in --fixtures: stm_trip_updates.pb,
+stm_vehicle_positions.pb, chrono_trip_updates.pb, chrono_vehicle_positions.pb.
+Missing fixtures (and a missing STM GTFS) are synthesized from the static data
+with a fixed seed, so the report stays comparable between runs.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from google.transit import gtfs_realtime_pb2
+
+from backend.loaders.stm import (
+    build_stm_departure_board,
+    build_stm_positions_dict,
+    load_stm_gtfs_trips,
+    load_stm_routes,
+    load_stm_stop_times,
+    process_stm_trip_updates,
+)
+from backend.loaders.exo import (
+    EXO_WATCHED_STOPS,
+    build_exo_departure_board,
+    index_exo_stop_times,
+    index_exo_watched_arrivals,
+    load_exo_gtfs_trips,
+    load_exo_stop_times,
+    process_exo_train_schedule_with_occupancy,
+    process_exo_vehicle_positions,
+)
+from backend.parsers.gtfs_rt_stream import parse_entities_for_routes, protobuf_backend
+from backend.scripts.synthetic_feeds import (
+    GTFS_DIR,
+    STM_ROUTES,
+    chrono_feeds,
+    stm_feeds,
+    write_synthetic_stm_gtfs,
+)
+
+FIXTURE_FILES = {
+    "stm_trip_updates": "stm_trip_updates.pb",
+    "stm_vehicle_positions": "stm_vehicle_positions.pb",
+    "chrono_trip_updates": "chrono_trip_updates.pb",
+    "chrono_vehicle_positions": "chrono_vehicle_positions.pb",
+}
+
+SEED = 20240901
+
+
+# ====================================================================
+# Static data (scaled copies are written to a temp dir and loaded with
+# the real loaders, so loading is benchmarked too)
+# ====================================================================
+def _scale_csv(src, dst, factor, id_columns):
+    """Copy a GTFS table, repeating every row ``factor`` times with prefixed ids."""
+    with open(src, newline="", encoding="utf-8-sig") as fin, \
+            open(dst, "w", newline="", encoding="utf-8") as fout:
+        reader = csv.DictReader(fin)
+        writer = csv.DictWriter(fout, fieldnames=reader.fieldnames)
+        writer.writeheader()
+        rows = list(reader)
+        for copy in range(factor):
+            for row in rows:
+                if copy:
+                    row = dict(row)
+                    for column in id_columns:
+                        row[column] = f"{copy}x{row[column]}"
+                writer.writerow(row)
+
+
+def load_static(workdir, factor, rng):
+    stm_src = GTFS_DIR / "stm"
+    stm_dir = workdir / "stm"
+    exo_dir = workdir / "exo"
+    stm_dir.mkdir(exist_ok=True)
+    exo_dir.mkdir(exist_ok=True)
+
+    stm_synthetic = not (stm_src / "stop_times.txt").is_file()
+    if stm_synthetic:
+        write_synthetic_stm_gtfs(stm_dir, rng)
+        stm_src = stm_dir
+    routes_fp = stm_src / "routes.txt"
+    if factor > 1 or stm_synthetic:
+        _scale_csv(stm_src / "trips.txt", stm_dir / "trips.scaled.txt", factor, ["trip_id"])
+        _scale_csv(stm_src / "stop_times.txt", stm_dir / "stop_times.scaled.txt", factor, ["trip_id"])
+        stm_trips_fp, stm_stop_times_fp = stm_dir / "trips.scaled.txt", stm_dir / "stop_times.scaled.txt"
+    else:
+        stm_trips_fp, stm_stop_times_fp = stm_src / "trips.txt", stm_src / "stop_times.txt"
+
+    _scale_csv(GTFS_DIR / "exo" / "trips.txt", exo_dir / "trips.txt", factor, ["trip_id"])
+    _scale_csv(GTFS_DIR / "exo" / "stop_times.txt", exo_dir / "stop_times.txt", factor, ["trip_id"])
+
+    static = {"stm_synthetic": stm_synthetic}
+    static["stm_routes"] = load_stm_routes(routes_fp)
+    static["stm_trips"] = load_stm_gtfs_trips(stm_trips_fp, static["stm_routes"])
+    static["stm_stop_times"] = load_stm_stop_times(stm_stop_times_fp)
+    static["stm_board"] = build_stm_departure_board(static["stm_trips"], static["stm_stop_times"])
+    static["stm_stop_times_fp"] = stm_stop_times_fp
+    static["exo_trips"] = load_exo_gtfs_trips(exo_dir / "trips.txt")
+    static["exo_stop_times"] = load_exo_stop_times(exo_dir / "stop_times.txt")
+    static["exo_trip_stops"] = index_exo_stop_times(static["exo_stop_times"])
+    static["exo_watched_arrivals"] = index_exo_watched_arrivals(static["exo_stop_times"])
+    static["exo_board"] = build_exo_departure_board(static["exo_stop_times"], static["exo_trips"])
+    static["exo_stop_times_fp"] = exo_dir / "stop_times.txt"
+    return static
+
+
+# ====================================================================
+# Realtime fixtures
+# ====================================================================
+def load_fixtures(fixtures_dir, stm_dir, rng):
+    """Raw feed bytes by fixture name, plus where each one came from."""
+    now = time.time()
+    feeds = {}
+    sources = {}
+    if fixtures_dir:
+        for name, filename in FIXTURE_FILES.items():
+            path = Path(fixtures_dir) / filename
+            if path.is_file():
+                feeds[name] = path.read_bytes()
+                sources[name] = str(path)
+
+    if "stm_trip_updates" not in feeds or "stm_vehicle_positions" not in feeds:
+        updates, positions = stm_feeds(stm_dir, rng, now)
+        for name, data in (("stm_trip_updates", updates), ("stm_vehicle_positions", positions)):
+            if name not in feeds:
+                feeds[name] = data
+                sources[name] = "synthetic"
+    if "chrono_trip_updates" not in feeds or "chrono_vehicle_positions" not in feeds:
+        updates, positions = chrono_feeds(GTFS_DIR / "exo", rng, now)
+        for name, data in (("chrono_trip_updates", updates), ("chrono_vehicle_positions", positions)):
+            if name not in feeds:
+                feeds[name] = data
+                sources[name] = "synthetic"
+    return feeds, sources
+
+
+def scale_feed(data, factor):
+    """Repeat every entity ``factor`` times (ids suffixed, payload unchanged)."""
+    if factor <= 1:
+        return data
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(data)
+    originals = list(feed.entity)
+    for copy in range(1, factor):
+        for entity in originals:
+            clone = feed.entity.add()
+            clone.CopyFrom(entity)
+            clone.id = f"{entity.id}~{copy}"
+    return feed.SerializeToString()
+
+
+def parse_entities(data):
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(data)
+    return feed.entity
+
+
+# ====================================================================
+# Measurement
+# ====================================================================
+def measure(fn, iterations, budget):
+    """
+    Latency percentiles (ms) over up to ``iterations`` runs, then one traced
+    run. Slow stages stop early once ``budget`` seconds are spent.
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        fn()  # warm-up, kept as the only sample when it already blows the budget
+        warmup = time.perf_counter() - started
+        samples = []
+        deadline = time.perf_counter() + budget
+        if warmup > budget:
+            samples.append(warmup * 1000)
+        else:
+            for _ in range(iterations):
+                started = time.perf_counter()
+                fn()
+                samples.append((time.perf_counter() - started) * 1000)
+                if len(samples) >= 3 and started > deadline:
+                    break
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        blocks_before = sys.getallocatedblocks()
+        baseline, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+        blocks_after = sys.getallocatedblocks()
+        tracemalloc.stop()
+        del result
+
+    samples.sort()
+    if len(samples) > 1:
+        cuts = statistics.quantiles(samples, n=100, method="inclusive")
+        p50, p90, p99 = cuts[49], cuts[89], cuts[98]
+    else:
+        p50 = p90 = p99 = samples[0]
+    return {
+        "iterations": len(samples),
+        "p50_ms": round(p50, 3),
+        "p90_ms": round(p90, 3),
+        "p99_ms": round(p99, 3),
+        "max_ms": round(samples[-1], 3),
+        "peak_kib": round((peak - baseline) / 1024, 1),
+        "retained_kib": round((current - baseline) / 1024, 1),
+        "retained_blocks": blocks_after - blocks_before,
+    }
+
+
+def stages_for(static, feeds):
+    """(stage name, entity count, callable) for every pipeline stage."""
+    stm_tu = parse_entities(feeds["stm_trip_updates"])
+    stm_vp = parse_entities_for_routes(feeds["stm_vehicle_positions"], STM_ROUTES, "benchmark")
+    positions = build_stm_positions_dict(stm_vp, STM_ROUTES, static["stm_trips"])
+    chrono_tu = parse_entities(feeds["chrono_trip_updates"])
+    chrono_vp = parse_entities(feeds["chrono_vehicle_positions"])
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        exo_vehicle_data = process_exo_vehicle_positions(chrono_vp, static["exo_stop_times"],
+                                                         watched_arrivals=static["exo_watched_arrivals"])
+
+    return [
+        ("load_stm_stop_times", len(static["stm_stop_times"]),
+         lambda: load_stm_stop_times(static["stm_stop_times_fp"])),
+        ("load_exo_stop_times", len(static["exo_stop_times"]),
+         lambda: load_exo_stop_times(static["exo_stop_times_fp"])),
+        ("parse_stm_trip_updates", len(stm_tu),
+         lambda: parse_entities(feeds["stm_trip_updates"])),
+        ("process_stm_trip_updates", len(stm_tu),
+         lambda: process_stm_trip_updates(stm_tu, static["stm_trips"], static["stm_stop_times"],
+                                          positions, static["stm_board"])),
+        ("stm_positions_dict", len(stm_vp),
+         lambda: build_stm_positions_dict(
+             parse_entities_for_routes(feeds["stm_vehicle_positions"], STM_ROUTES, "benchmark"),
+             STM_ROUTES, static["stm_trips"])),
+        ("parse_chrono_feeds", len(chrono_tu) + len(chrono_vp),
+         lambda: (parse_entities(feeds["chrono_trip_updates"]),
+                  parse_entities(feeds["chrono_vehicle_positions"]))),
+        ("process_exo_vehicle_positions", len(chrono_vp),
+         lambda: process_exo_vehicle_positions(chrono_vp, static["exo_stop_times"],
+                                               watched_arrivals=static["exo_watched_arrivals"])),
+        ("process_exo_train_schedule", len(chrono_tu),
+         lambda: process_exo_train_schedule_with_occupancy(
+             static["exo_stop_times"], static["exo_trips"], exo_vehicle_data, chrono_tu,
+             static["exo_trip_stops"], static["exo_board"])),
+    ]
+
+
+def compare(results, previous, threshold):
+    """Stages whose p50 grew by more than ``threshold`` percent."""
+    before = {(r["stage"], r["scale"]): r for r in previous.get("results", [])}
+    regressions = []
+    for result in results:
+        old = before.get((result["stage"], result["scale"]))
+        if not old or not old["p50_ms"]:
+            continue
+        change = (result["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        result["p50_change_pct"] = round(change, 1)
+        if change > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def print_table(results):
+    header = f"{'stage':<32}{'scale':>6}{'n':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak KiB':>11}{'Δp50':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        change = f"{r['p50_change_pct']:+.0f}%" if "p50_change_pct" in r else ""
+        print(f"{r['stage']:<32}{r['scale']:>6}{r['entities']:>9}{r['p50_ms']:>10.2f}"
+              f"{r['p90_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['peak_kib']:>11.0f}{change:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BdeB-Go realtime pipeline offline.")
+    parser.add_argument("--fixtures", help="directory with recorded .pb feeds")
+    parser.add_argument("--scale", default="1", help="comma-separated scale factors, e.g. 1,10,100 (default: 1)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=5.0,
+                        help="seconds per stage before stopping early (default: 5)")
+    parser.add_argument("--stage", action="append", help="only run stages containing this text")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="p50 increase (in %%) reported as a regression (default: 20)")
+    args = parser.parse_args(argv)
+
+    factors = [int(f) for f in args.scale.split(",") if f.strip()]
+    results = []
+    sources = {}
+    static_kind = None
+    for factor in factors:
+        rng = random.Random(SEED)
+        with tempfile.TemporaryDirectory(prefix="bdeb-bench-") as tmp:
+            workdir = Path(tmp)
+            static = load_static(workdir, factor, rng)
+            stm_dir = workdir / "stm" if static["stm_synthetic"] else GTFS_DIR / "stm"
+            feeds, sources = load_fixtures(args.fixtures, stm_dir, rng)
+            feeds = {name: scale_feed(data, factor) for name, data in feeds.items()}
+            static_kind = "synthetic STM + Exo" if static["stm_synthetic"] else "backend/GTFS"
+
+            for stage, entities, fn in stages_for(static, feeds):
+                if args.stage and not any(s in stage for s in args.stage):
+                    continue
+                print(f"[{factor}x] {stage}...", file=sys.stderr)
+                result = {"stage": stage, "scale": factor, "entities": entities}
+                result.update(measure(fn, args.iterations, args.budget))
+                results.append(result)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "protobuf_backend": protobuf_backend(),
+            "static": static_kind,
+            "fixtures": sources,
+            "watched_exo_stops": list(EXO_WATCHED_STOPS),
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than {args.threshold:.0f}%:")
+        for r in regressions:
+            print(f"   • {r['stage']} ({r['scale']}x): {r['p50_change_pct']:+.1f}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Regression checks for the alert keyword classification.
+
+Each case is an alert text (and optionally its effect) with the category and
+stop badge it must get, or a metro line status and whether it is shown as
+normal service. Exits non-zero and lists the failures otherwise:
+
+    python -m backend.scripts.check_alerts
+"""
+import sys
+
+from backend.alerts import CATEGORY_BADGES, classify_alert, says_normal_service
+
+# (text, effect, expected category)
+CASES = (
+    # "vous déplacer" is a verb, not "arrêt déplacé": the stop is cancelled
+    ("Arrêt annulé. Veuillez vous déplacer à l'arrêt Henri-Bourassa.", None, "stop_cancelled"),
+    ("Arrêt annulé. Veuillez vous déplacer à l'arrêt Henri-Bourassa.", "DETOUR", "stop_cancelled"),
+    ("Arrêt déplacé au coin de la rue.", None, "stop_moved"),
+    ("Arrêts déplacés pendant les travaux.", "DETOUR", "stop_moved"),
+    ("Arrêt relocalisé devant le collège.", None, "stop_relocated"),
+    ("Arrêts annulés sur le boulevard.", None, "stop_cancelled"),
+    ("Stop cancelled due to construction.", None, "stop_cancelled"),
+    ("Ascenseur hors service à Sauvé.", None, "elevator_outage"),
+    ("Service normal du métro.", None, "normal_service"),
+    ("Ralentissements sur la ligne.", None, "delay"),
+    ("Veuillez vous déplacer vers l'arrêt temporaire.", "DETOUR", "detour"),
+)
+
+# (metro line status, shown as normal service)
+METRO_CASES = (
+    ("Service normal du métro.", True),
+    # An elevator outage does not make the line abnormal
+    ("Service normal du métro. Ascenseur hors service à Sauvé", True),
+    ("Service interrompu entre Berri-UQAM et Henri-Bourassa.", False),
+    ("Ralentissements sur la ligne orange.", False),
+)
+
+
+def main():
+    failures = []
+    for text, effect, expected in CASES:
+        category = classify_alert(text, effect)
+        if category != expected:
+            failures.append(f"{text!r} ({effect}): {category}, expected {expected}")
+    # The stop badge follows the category
+    badge = CATEGORY_BADGES.get(classify_alert(CASES[0][0]))
+    if badge != "annule":
+        failures.append(f"{CASES[0][0]!r}: badge {badge}, expected annule")
+    for text, expected in METRO_CASES:
+        if says_normal_service(text) != expected:
+            failures.append(f"metro {text!r}: normal={not expected}, expected {expected}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        return 1
+    print(f"{len(CASES) + len(METRO_CASES)} cases passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Cold-start profile of the display server.
+
+Imports a module in a fresh interpreter under ``python -X importtime`` and
+reports the slowest imports (cumulative and self time) and the total per
+top-level package, then the time spent in ``create_app()``:
+
+    python -m backend.scripts.import_profile
+    python -m backend.scripts.import_profile --module backend.display --top 30
+
+With --serve, also starts ``waitress --call backend.main:create_app`` on a
+spare port and reports when /healthz (listening) and /readyz (static data and
+first snapshot) first answer 200. That needs the static GTFS and reachable
+feeds, e.g. scripts/mock_upstream.py.
+"""
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# Runs in the child: import the module, then time the factory (no warm-up)
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+module = __import__({module!r}, fromlist=["*"])
+imported = time.perf_counter()
+if {factory!r} and hasattr(module, {factory!r}):
+    getattr(module, {factory!r})(warm=False)
+done = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - started) * 1000, "factory_ms": (done - imported) * 1000,
+                  "modules": len(sys.modules)}}))
+"""
+
+
+def parse_importtime(stderr):
+    """[(name, self_us, cumulative_us, depth)] from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(fields[0]), int(fields[1]), depth))
+    return rows
+
+
+def profile_import(module, factory):
+    code = _CHILD.format(module=module, factory=factory)
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=PROJECT_ROOT, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f"importing {module} failed (exit {proc.returncode})")
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    timings["wall_ms"] = wall_ms
+    return timings, parse_importtime(proc.stderr)
+
+
+def report_imports(module, timings, rows, top):
+    print(f"{module}: import {timings['import_ms']:.0f} ms, create_app {timings['factory_ms']:.0f} ms, "
+          f"process {timings['wall_ms']:.0f} ms, {timings['modules']} modules loaded")
+
+    print(f"\nSlowest imports (cumulative, top {top}):")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+    print(f"\nSlowest modules (self time, top {top}):")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    packages = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print("\nBy top-level package (self time):")
+    for package, total_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {total_us / 1000:8.1f} ms  {package}")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _first_ok(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter(), json.loads(response.read() or b"null")
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    return None, None
+
+
+def profile_serve(timeout):
+    port = _free_port()
+    cmd = [sys.executable, "-m", "waitress", "--threads=8", "--host=127.0.0.1", f"--port={port}",
+           "--call", "backend.main:create_app"]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        healthy_at, _ = _first_ok(f"http://127.0.0.1:{port}/healthz", deadline)
+        ready_at, ready = _first_ok(f"http://127.0.0.1:{port}/readyz", deadline)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    print("\nwaitress --call backend.main:create_app:")
+    if healthy_at is None:
+        print(f"  /healthz: no answer within {timeout:.0f} s")
+        return 1
+    print(f"  /healthz 200 after {(healthy_at - started) * 1000:.0f} ms")
+    if ready_at is None:
+        print(f"  /readyz: not ready within {timeout:.0f} s")
+        return 1
+    print(f"  /readyz  200 after {(ready_at - started) * 1000:.0f} ms "
+          f"(static {ready['static_ms']} ms, first snapshot {ready['first_snapshot_ms']} ms)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the cold start of the display server.")
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--factory", default="create_app", help="called after the import ('' to skip)")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--serve", action="store_true", help="also time /healthz and /readyz of a real server")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args(argv)
+
+    timings, rows = profile_import(args.module, args.factory)
+    report_imports(args.module, timings, rows, args.top)
+    if args.serve:
+        return profile_serve(args.timeout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the STM, Chrono and WeatherAPI endpoints.
+
+Serves synthetic feeds (scripts/synthetic_feeds.py) or the responses of a
+feed archive recorded with FEED_MODE=record (see backend/feeds.py), with
+configurable latency, error and rate-limit rates. Point the backend at it:
+
+    python -m backend.scripts.mock_upstream --port 8000 --latency-ms 200 --rate-limit 0.05
+
+    STM_API_BASE=http://localhost:8000/stm
+    CHRONO_BASE_URL=http://localhost:8000/chrono
+    WEATHER_API_BASE=http://localhost:8000/weather
+
+No API keys are needed with these bases. The failure knobs can be changed
+while running: ``curl -X POST localhost:8000/_control -d '{"error_rate": 0.5}'``
+and ``GET /_control`` returns the settings and request counters.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from flask import Flask, Response, jsonify, request
+
+from backend.scripts import synthetic_feeds
+from backend.scripts.synthetic_feeds import GTFS_DIR
+
+app = Flask(__name__)
+
+settings = {
+    "latency_ms": 0.0,
+    "jitter_ms": 0.0,
+    "error_rate": 0.0,       # share of 500/503 responses
+    "rate_limit": 0.0,       # share of 429 responses
+    "retry_after": 30,       # seconds, sent with the 429s
+    "seed": None,
+}
+counters = {}
+_lock = threading.Lock()
+_rng = random.Random()
+_state = {"archive": None, "stm_dir": None}
+
+# Upstream source name (as used by backend/feeds.py) -> content type
+SOURCES = {
+    "stm_trip_updates": "application/x-protobuf",
+    "stm_vehicle_positions": "application/x-protobuf",
+    "stm_alerts": "application/json",
+    "chrono_trip_updates": "application/x-protobuf",
+    "chrono_vehicle_positions": "application/x-protobuf",
+    "chrono_alerts": "application/x-protobuf",
+    "weather": "application/json",
+}
+
+
+class Archive:
+    """Recorded responses, served in order per source (looping at the end)."""
+
+    def __init__(self, directory):
+        self.files = {}
+        self.position = {}
+        for source in os.scandir(directory):
+            if source.is_dir():
+                names = sorted(n for n in os.listdir(source.path) if n.endswith(".gz"))
+                if names:
+                    self.files[source.name] = [os.path.join(source.path, n) for n in names]
+        # Both weather calls of the backend are answered from the same recordings
+        if "weather" not in self.files and "weather_alerts" in self.files:
+            self.files["weather"] = self.files["weather_alerts"]
+
+    def next(self, source):
+        files = self.files.get(source)
+        if not files:
+            return None
+        index = self.position.get(source, 0)
+        self.position[source] = (index + 1) % len(files)
+        path = files[index]
+        status = int(os.path.basename(path)[:-3].split("-")[1])
+        with gzip.open(path, "rb") as f:
+            return status, f.read()
+
+
+def _synthetic_body(source):
+    now = time.time()
+    if source in ("stm_trip_updates", "stm_vehicle_positions"):
+        updates, positions = synthetic_feeds.stm_feeds(_state["stm_dir"], _rng, now)
+        return updates if source == "stm_trip_updates" else positions
+    if source in ("chrono_trip_updates", "chrono_vehicle_positions"):
+        updates, positions = synthetic_feeds.chrono_feeds(GTFS_DIR / "exo", _rng, now)
+        return updates if source == "chrono_trip_updates" else positions
+    if source == "chrono_alerts":
+        return synthetic_feeds.chrono_alerts(_rng, now)
+    if source == "stm_alerts":
+        return json.dumps(synthetic_feeds.stm_alerts(_rng, now), ensure_ascii=False).encode("utf-8")
+    return json.dumps(synthetic_feeds.weather(_rng), ensure_ascii=False).encode("utf-8")
+
+
+def serve(source):
+    with _lock:
+        counters[source] = counters.get(source, 0) + 1
+        delay = max(settings["latency_ms"] + _rng.uniform(-1, 1) * settings["jitter_ms"], 0)
+        roll = _rng.random()
+        rate_limited = roll < settings["rate_limit"]
+        failed = not rate_limited and roll < settings["rate_limit"] + settings["error_rate"]
+    if delay:
+        time.sleep(delay / 1000)
+
+    if rate_limited:
+        with _lock:
+            counters["429"] = counters.get("429", 0) + 1
+        return Response("Too Many Requests", status=429,
+                        headers={"Retry-After": str(settings["retry_after"])})
+    if failed:
+        with _lock:
+            counters["5xx"] = counters.get("5xx", 0) + 1
+        return Response("Upstream error", status=_rng.choice([500, 503]))
+
+    with _lock:
+        recorded = _state["archive"].next(source) if _state["archive"] else None
+        if recorded is None:
+            recorded = 200, _synthetic_body(source)
+    status, body = recorded
+    return Response(body, status=status, content_type=SOURCES[source])
+
+
+@app.route("/stm/gtfs-rt/ic/v2/tripUpdates")
+def stm_trip_updates():
+    return serve("stm_trip_updates")
+
+
+@app.route("/stm/gtfs-rt/ic/v2/vehiclePositions")
+def stm_vehicle_positions():
+    return serve("stm_vehicle_positions")
+
+
+@app.route("/stm/i3/v2/messages/etatservice")
+def stm_alerts():
+    return serve("stm_alerts")
+
+
+@app.route("/chrono/TRAINS/tripupdate")
+def chrono_trip_updates():
+    return serve("chrono_trip_updates")
+
+
+@app.route("/chrono/TRAINS/vehicleposition")
+def chrono_vehicle_positions():
+    return serve("chrono_vehicle_positions")
+
+
+@app.route("/chrono/TRAINS/alert")
+def chrono_alerts():
+    return serve("chrono_alerts")
+
+
+@app.route("/weather/current.json")
+def weather():
+    return serve("weather")
+
+
+@app.route("/_control", methods=["GET", "POST"])
+def control():
+    if request.method == "POST":
+        updates = request.get_json(force=True, silent=True) or {}
+        unknown = sorted(set(updates) - set(settings))
+        if unknown:
+            return jsonify({"error": f"unknown settings: {', '.join(unknown)}"}), 400
+        with _lock:
+            settings.update(updates)
+            if "seed" in updates:
+                _rng.seed(updates["seed"])
+    return jsonify({"settings": settings, "requests": counters})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock STM / Chrono / WeatherAPI server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--archive", help="serve a feed archive recorded with FEED_MODE=record")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 5xx responses (0-1)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of 429 responses (0-1)")
+    parser.add_argument("--retry-after", type=int, default=30, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, help="seed for reproducible synthetic data and failures")
+    args = parser.parse_args(argv)
+
+    settings.update(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    _rng.seed(args.seed)
+    if args.archive:
+        _state["archive"] = Archive(args.archive)
+        print(f"Serving recorded responses from {args.archive}: {', '.join(sorted(_state['archive'].files))}")
+
+    stm_dir = GTFS_DIR / "stm"
+    if not (stm_dir / "trips.txt").is_file():
+        stm_dir = Path(tempfile.mkdtemp(prefix="bdeb-mock-stm-"))
+        synthetic_feeds.write_synthetic_stm_gtfs(stm_dir, random.Random(args.seed))
+        print(f"No STM GTFS found, using synthetic trips in {stm_dir}")
+    _state["stm_dir"] = stm_dir
+
+    from waitress import serve as waitress_serve
+    print(f"Mock upstream on http://{args.host}:{args.port} (stm/, chrono/, weather/)")
+    waitress_serve(app, host=args.host, port=args.port, threads=8)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Synthetic upstream data built from the static GTFS, shared by benchmark.py
+and mock_upstream.py: GTFS-RT trip updates / vehicle positions for STM and
+Chrono, STM i3 service alerts and a WeatherAPI current-conditions payload.
+
+Nothing here imports backend.config, so no API keys are needed.
+"""
+import csv
+from pathlib import Path
+
+from google.transit import gtfs_realtime_pb2
+
+GTFS_DIR = Path(__file__).resolve().parent.parent / "GTFS"
+
+# Same routes/stops as STM_DESIRED_COMBOS in loaders/stm.py
+STM_ROUTES = ["171", "180", "164"]
+STM_WATCHED_STOPS = ["50270", "62374", "62420"]
+# Around the Collège de Bois-de-Boulogne (synthetic stops.txt and vehicle positions)
+STM_ORIGIN = (45.5370, -73.6780)
+
+# Rows of the static tables, by path (the mock regenerates feeds on each request)
+_csv_cache = {}
+
+
+def csv_rows(path):
+    path = Path(path)
+    if path not in _csv_cache:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            _csv_cache[path] = list(csv.DictReader(f))
+    return _csv_cache[path]
+
+
+def _new_feed(now):
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = int(now)
+    return feed
+
+
+def write_synthetic_stm_gtfs(directory, rng):
+    """Small STM-like GTFS (routes, trips, stop_times, stops): the watched routes plus filler routes."""
+    directory = Path(directory)
+    routes = STM_ROUTES + [str(r) for r in range(10, 200)]
+    stops = STM_WATCHED_STOPS + [str(50000 + i) for i in range(30)]
+    with open(directory / "stops.txt", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["stop_id", "stop_name", "stop_lat", "stop_lon"])
+        for i, stop in enumerate(stops):
+            # One stop every ~300 m along a line through the origin
+            writer.writerow([stop, f"Arrêt {stop}", f"{STM_ORIGIN[0] + i * 0.0027:.6f}", f"{STM_ORIGIN[1]:.6f}"])
+    with open(directory / "routes.txt", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["route_id", "route_short_name"])
+        for route in routes:
+            writer.writerow([route, route])
+    with open(directory / "trips.txt", "w", newline="", encoding="utf-8") as f, \
+            open(directory / "stop_times.txt", "w", newline="", encoding="utf-8") as g:
+        trips = csv.writer(f)
+        stop_times = csv.writer(g)
+        trips.writerow(["route_id", "service_id", "trip_id", "wheelchair_accessible"])
+        stop_times.writerow(["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"])
+        for i in range(4000):
+            route = STM_ROUTES[i % 3] if i % 4 == 0 else rng.choice(routes)
+            trip_id = str(280000000 + i)
+            trips.writerow([route, f"S{i % 7}", trip_id, rng.choice("01")])
+            start = rng.randint(5 * 3600, 24 * 3600)
+            for seq, stop in enumerate(stops):
+                t = start + seq * 90
+                hhmmss = f"{t // 3600:02d}:{t % 3600 // 60:02d}:{t % 60:02d}"
+                stop_times.writerow([trip_id, hhmmss, hhmmss, stop, seq + 1])
+
+
+def stm_feeds(stm_dir, rng, now, max_trips=1500):
+    """Serialized (trip updates, vehicle positions) for the trips in ``stm_dir``/trips.txt."""
+    trips = csv_rows(Path(stm_dir) / "trips.txt")
+    updates = _new_feed(now)
+    positions = _new_feed(now)
+    for i, trip in enumerate(trips[:max_trips]):
+        entity = updates.entity.add()
+        entity.id = str(i)
+        entity.trip_update.trip.trip_id = trip["trip_id"]
+        entity.trip_update.trip.route_id = trip["route_id"]
+        for stop in STM_WATCHED_STOPS + [str(50000 + rng.randint(0, 29)) for _ in range(3)]:
+            update = entity.trip_update.stop_time_update.add()
+            update.stop_id = stop
+            update.arrival.time = int(now + rng.randint(-60, 3600))
+
+        entity = positions.entity.add()
+        entity.id = str(i)
+        vehicle = entity.vehicle
+        vehicle.trip.trip_id = trip["trip_id"]
+        vehicle.trip.route_id = trip["route_id"]
+        vehicle.vehicle.id = str(30000 + i)
+        # Within ~9 km north of the origin, along the line of stops
+        vehicle.position.latitude = STM_ORIGIN[0] + rng.random() * 0.08
+        vehicle.position.longitude = STM_ORIGIN[1] + rng.uniform(-0.0005, 0.0005)
+        vehicle.occupancy_status = rng.randint(1, 4)
+        vehicle.current_status = rng.randint(0, 2)
+        vehicle.timestamp = int(now)
+    return updates.SerializeToString(), positions.SerializeToString()
+
+
+def chrono_feeds(exo_dir, rng, now):
+    """Serialized (trip updates, vehicle positions) with one entity per Exo train."""
+    exo_dir = Path(exo_dir)
+    trips = {row["trip_id"]: row for row in csv_rows(exo_dir / "trips.txt")}
+    stops = {row["stop_id"]: row for row in csv_rows(exo_dir / "stops.txt")} if (exo_dir / "stops.txt").is_file() else {}
+    trains = {}
+    for row in csv_rows(exo_dir / "stop_times.txt"):
+        trains.setdefault(row["trip_id"].split("-")[0], []).append(row)
+    updates = _new_feed(now)
+    positions = _new_feed(now)
+    for train, rows in sorted(trains.items()):
+        route_id = trips.get(rows[0]["trip_id"], {}).get("route_id", "")
+        entity = updates.entity.add()
+        entity.id = train
+        entity.trip_update.trip.trip_id = train
+        entity.trip_update.trip.route_id = route_id
+        # Only the next couple of stops carry a prediction, like the live feed
+        for row in rows[:2]:
+            update = entity.trip_update.stop_time_update.add()
+            update.stop_id = row["stop_id"]
+            update.arrival.delay = rng.choice([0, 0, 60, 180, 420, -60])
+
+        entity = positions.entity.add()
+        entity.id = train
+        entity.vehicle.trip.trip_id = train
+        entity.vehicle.trip.route_id = route_id
+        entity.vehicle.occupancy_status = rng.randint(1, 4)
+        # At (or just past) one of its stops
+        stop = stops.get(rng.choice(rows)["stop_id"])
+        if stop:
+            entity.vehicle.position.latitude = float(stop["stop_lat"]) + rng.uniform(-0.002, 0.002)
+            entity.vehicle.position.longitude = float(stop["stop_lon"]) + rng.uniform(-0.002, 0.002)
+    return updates.SerializeToString(), positions.SerializeToString()
+
+
+def chrono_alerts(rng, now):
+    """Serialized Chrono alert feed with a single train alert."""
+    feed = _new_feed(now)
+    entity = feed.entity.add()
+    entity.id = "mock-1"
+    alert = entity.alert
+    period = alert.active_period.add()
+    period.start = int(now) - 600
+    period.end = int(now) + 3600
+    alert.informed_entity.add().route_id = rng.choice(["4", "6"])
+    alert.header_text.translation.add(text="Retards possibles", language="fr")
+    alert.description_text.translation.add(text="Ralentissements en raison d'un bris d'équipement.", language="fr")
+    return feed.SerializeToString()
+
+
+def stm_alerts(rng, now):
+    """STM i3 etatservice JSON: a bus alert on a watched stop and a metro line status."""
+    route = rng.choice(STM_ROUTES)
+    return {
+        "header": {"timestamp": int(now)},
+        "alerts": [
+            {
+                "effect": "DETOUR",
+                "header_texts": [{"language": "fr", "text": f"Détour ligne {route}"}],
+                "description_texts": [{"language": "fr", "text": "Arrêt déplacé en raison de travaux."}],
+                "informed_entities": [
+                    {"route_short_name": route},
+                    {"direction_id": "E"},
+                    {"stop_code": STM_WATCHED_STOPS[0]},
+                ],
+                "active_periods": {"start": int(now) - 3600, "end": None},
+            },
+            {
+                "effect": "MODIFIED_SERVICE",
+                "header_texts": [{"language": "fr", "text": "Ligne orange"}],
+                "description_texts": [{"language": "fr", "text": "Service normal du métro"}],
+                "informed_entities": [{"route_short_name": "2"}],
+                "active_periods": {"start": int(now) - 3600, "end": None},
+            },
+        ],
+    }
+
+
+def weather(rng):
+    """WeatherAPI /current.json payload (occasionally a 'bad' condition code)."""
+    code, text = rng.choice([(1000, "Ensoleillé"), (1003, "Partiellement nuageux"), (1195, "Forte pluie")])
+    return {
+        "location": {"name": "Montreal", "region": "Quebec", "country": "Canada"},
+        "current": {
+            "temp_c": round(rng.uniform(-20, 30), 1),
+            "condition": {"text": text, "icon": f"//cdn.weatherapi.com/weather/64x64/day/{code % 1000 + 113}.png", "code": code},
+        },
+    }
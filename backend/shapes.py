@@ -0,0 +1,170 @@
+# shapes.py
+"""
+Trip shapes (shapes.txt) and the progress of live vehicles along them.
+
+Every polyline of a feed is stored in one ShapeIndex: x/y in metres around
+the feed's mean position (local equirectangular projection) and the
+cumulative distance at each point, as flat float32 arrays with a slice per
+shape_id. The cumulative distance is measured on the geometry rather than
+read from shape_dist_traveled, whose unit varies between feeds (km for Exo).
+
+``project`` snaps a position to its shape in one vectorized pass over the
+segments and returns the segment index and the distance travelled; the
+distance left to a stop is the stop's own projection minus the vehicle's.
+``eta_seconds`` turns that into a rough arrival estimate for trips without
+a prediction in the trip update feed.
+"""
+import csv
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+import logging
+logger = logging.getLogger('BdeB-GTFS.shapes')
+
+EARTH_RADIUS_M = 6_371_000.0
+# A vehicle farther than this from its trip's shape is not snapped
+MAX_SNAP_M = 250.0
+# Snapping noise: a stop less than this behind the vehicle is not passed yet
+PASSED_STOP_M = 50.0
+# Average commercial speeds (stops included) used when nothing better is known
+BUS_SPEED_MPS = 18 / 3.6
+TRAIN_SPEED_MPS = 45 / 3.6
+
+
+@dataclass(slots=True, frozen=True)
+class ShapeProjection:
+    segment: int      # index of the segment (point i to i + 1) within the shape
+    along_m: float    # distance travelled along the shape
+    offset_m: float   # distance from the position to the shape
+
+
+class ShapeIndex:
+    """Polylines of a feed, by shape_id, as flat float32 arrays."""
+
+    __slots__ = ("x", "y", "cum_m", "_spans", "_lat0", "_lon0", "_cos0", "_stop_along")
+
+    def __init__(self, shapes):
+        """``shapes``: {shape_id: [(lat, lon), ...]} in sequence order."""
+        lats = [lat for points in shapes.values() for lat, _ in points]
+        lons = [lon for points in shapes.values() for _, lon in points]
+        self._lat0 = float(np.mean(lats)) if lats else 0.0
+        self._lon0 = float(np.mean(lons)) if lons else 0.0
+        self._cos0 = math.cos(math.radians(self._lat0))
+
+        x, y = self._project(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        cum = np.zeros(len(lats), dtype=np.float64)
+        self._spans = {}
+        start = 0
+        for shape_id, points in shapes.items():
+            stop = start + len(points)
+            if stop - start > 1:
+                steps = np.hypot(np.diff(x[start:stop]), np.diff(y[start:stop]))
+                cum[start + 1:stop] = np.cumsum(steps)
+            self._spans[shape_id] = (start, stop)
+            start = stop
+        self.x = x.astype(np.float32)
+        self.y = y.astype(np.float32)
+        self.cum_m = cum.astype(np.float32)
+        self._stop_along = {}  # (shape_id, stop_id) -> distance along the shape
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, shape_id):
+        return shape_id in self._spans
+
+    def _project(self, lat, lon):
+        x = np.radians(np.subtract(lon, self._lon0)) * EARTH_RADIUS_M * self._cos0
+        y = np.radians(np.subtract(lat, self._lat0)) * EARTH_RADIUS_M
+        return x, y
+
+    def length_m(self, shape_id):
+        span = self._spans.get(shape_id)
+        return float(self.cum_m[span[1] - 1]) if span and span[1] > span[0] else None
+
+    def project(self, shape_id, lat, lon, after_m=None, max_offset_m=MAX_SNAP_M):
+        """
+        ShapeProjection of (lat, lon) on the shape, None if the shape is
+        unknown or the position is more than ``max_offset_m`` away. With
+        ``after_m`` only segments ending past that distance are considered
+        (a vehicle does not move backwards on a shape that loops).
+        """
+        span = self._spans.get(shape_id)
+        if span is None or lat is None or lon is None or span[1] - span[0] < 2:
+            return None
+        start, stop = span
+        px, py = self._project(lat, lon)
+        ax, ay = self.x[start:stop - 1], self.y[start:stop - 1]
+        dx, dy = self.x[start + 1:stop] - ax, self.y[start + 1:stop] - ay
+        length2 = dx * dx + dy * dy
+        t = np.clip(((px - ax) * dx + (py - ay) * dy) / np.where(length2 > 0, length2, 1), 0.0, 1.0)
+        ex, ey = ax + t * dx - px, ay + t * dy - py
+        d2 = ex * ex + ey * ey
+        if after_m is not None:
+            d2 = np.where(self.cum_m[start + 1:stop] >= after_m, d2, np.inf)
+
+        segment = int(np.argmin(d2))
+        offset = math.sqrt(float(d2[segment]))
+        if not offset <= max_offset_m:  # also catches inf/nan
+            return None
+        along = float(self.cum_m[start + segment]) + float(t[segment]) * math.sqrt(float(length2[segment]))
+        return ShapeProjection(segment, along, offset)
+
+    def stop_along(self, shape_id, stop_id, stop_index):
+        """Distance along the shape of a stop of geo.StopIndex (cached), None if unknown."""
+        key = (shape_id, stop_id)
+        if key not in self._stop_along:
+            position = stop_index.position(stop_id) if stop_index is not None else None
+            projection = self.project(shape_id, *position) if position else None
+            self._stop_along[key] = projection.along_m if projection else None
+        return self._stop_along[key]
+
+    def remaining_m(self, shape_id, lat, lon, stop_id, stop_index):
+        """
+        Distance left along the shape from (lat, lon) to the stop: negative
+        once the stop is passed, None if either cannot be snapped.
+        """
+        target = self.stop_along(shape_id, stop_id, stop_index)
+        if target is None:
+            return None
+        projection = self.project(shape_id, lat, lon)
+        if projection is None:
+            return None
+        return target - projection.along_m
+
+
+def eta_seconds(remaining_m, speed_mps):
+    """
+    Seconds to cover ``remaining_m`` at ``speed_mps``: None if unknown or the
+    stop is clearly behind the vehicle, 0 when it is about there.
+    """
+    if remaining_m is None or not speed_mps or remaining_m < -PASSED_STOP_M:
+        return None
+    return max(0.0, remaining_m / speed_mps)
+
+
+def load_shapes(filepath, shape_ids=None):
+    """
+    ShapeIndex of a shapes.txt, limited to ``shape_ids`` if given (empty if
+    the file is missing: the feed may not ship it).
+    """
+    points = {}
+    try:
+        with open(filepath, mode="r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                shape_id = row["shape_id"].strip()
+                if shape_ids is not None and shape_id not in shape_ids:
+                    continue
+                try:
+                    point = (int(row["shape_pt_sequence"]), float(row["shape_pt_lat"]), float(row["shape_pt_lon"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                points.setdefault(shape_id, []).append(point)
+    except FileNotFoundError:
+        logger.warning("%s not found: no shape progress for this feed", filepath)
+    return ShapeIndex({
+        shape_id: [(lat, lon) for _, lat, lon in sorted(rows)]
+        for shape_id, rows in points.items()
+    })
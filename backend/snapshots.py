@@ -0,0 +1,108 @@
+# snapshots.py
+"""
+Last-known-good state persisted across restarts of the display server.
+
+The caches (weather, learned ETA segment times, last good upstream bodies) are
+written to one gzip'd JSON file, SNAPSHOT_FILE, at most every
+SNAPSHOT_SAVE_INTERVAL seconds and at exit. The write goes to a temp file in
+the same directory followed by os.replace, so a crash never leaves a half
+written snapshot. At startup ``load_snapshot`` returns the entries with
+their age; files of another SNAPSHOT_VERSION and entries older than
+SNAPSHOT_MAX_AGE are ignored (callers apply tighter caps per entry).
+
+File layout: {"version": 1, "saved_at": <unix>, "entries": {name: {"ts": <unix>, "data": ...}}}
+"""
+import base64
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .config import SNAPSHOT_FILE, SNAPSHOT_SAVE_INTERVAL, SNAPSHOT_MAX_AGE
+import logging
+logger = logging.getLogger('BdeB-GTFS.snapshots')
+
+SNAPSHOT_VERSION = 1
+
+_lock = threading.Lock()
+_last_save = {"at": 0.0}
+
+
+def encode_bytes(content):
+    return base64.b64encode(content).decode("ascii")
+
+
+def decode_bytes(text):
+    return base64.b64decode(text.encode("ascii"))
+
+
+def save_snapshot(entries, force=False, path=SNAPSHOT_FILE):
+    """
+    Persist ``entries`` ({name: {"ts": unix, "data": json-able}}, or a
+    function returning them, only called when a save is due); skipped if
+    the last save is more recent than SNAPSHOT_SAVE_INTERVAL (unless
+    ``force``). Returns True when the file was written.
+    """
+    now = time.time()
+    if not force and now - _last_save["at"] < SNAPSHOT_SAVE_INTERVAL:
+        return False
+    if not _lock.acquire(blocking=force):
+        return False  # another thread is already saving
+    try:
+        if callable(entries):
+            entries = entries()
+        payload = {"version": SNAPSHOT_VERSION, "saved_at": now, "entries": entries}
+        data = gzip.compress(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), 6)
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        _last_save["at"] = now
+        logger.debug("Snapshot saved: %d entries, %d bytes", len(entries), len(data))
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        logger.error("Could not save snapshot to %s: %s", path, e)
+        return False
+    finally:
+        _lock.release()
+
+
+def load_snapshot(path=SNAPSHOT_FILE, max_age=SNAPSHOT_MAX_AGE):
+    """{name: {"ts", "data", "age"}} of the usable entries ({} if none)."""
+    try:
+        with gzip.open(path, "rb") as f:
+            payload = json.loads(f.read().decode("utf-8"))
+    except FileNotFoundError:
+        return {}
+    except (OSError, EOFError, ValueError) as e:
+        logger.warning("Ignoring unreadable snapshot %s: %s", path, e)
+        return {}
+    if not isinstance(payload, dict) or payload.get("version") != SNAPSHOT_VERSION:
+        logger.warning("Ignoring snapshot %s: version %s, expected %s",
+                       path, payload.get("version") if isinstance(payload, dict) else None, SNAPSHOT_VERSION)
+        return {}
+
+    now = time.time()
+    entries = {}
+    for name, entry in (payload.get("entries") or {}).items():
+        try:
+            age = now - float(entry["ts"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if age <= max_age:
+            entries[name] = {"ts": entry["ts"], "data": entry.get("data"), "age": age}
+    logger.info("Snapshot loaded: %s", ", ".join(f"{name} ({e['age']:.0f} s old)" for name, e in entries.items()) or "empty")
+    return entries
@@ -5,6 +5,10 @@ import os
 import csv
 from datetime import datetime
 import requests
+from backend.config import WEATHER_API_BASE
+from backend.feeds import fetch
+import logging
+logger = logging.getLogger('BdeB-GTFS.utils')
 
 def load_no_service_days(filepath="no_service_days.txt"):
     """Load no-service days from a text file."""
@@ -16,7 +20,7 @@ def load_no_service_days(filepath="no_service_days.txt"):
                 try:
                     no_service_dates.add(datetime.strptime(date_str, "%Y-%m-%d").date())
                 except ValueError:
-                    print(f"Skipping invalid date format: {date_str}")
+                    logger.warning("Skipping invalid date format: %s", date_str)
     return no_service_dates
 
 
@@ -50,6 +54,14 @@ def load_csv_dict(filepath):
     return data
 
 
+def optional_mtime(filepath):
+    """Modification time of a GTFS file the feed may not ship (None if missing)."""
+    try:
+        return os.path.getmtime(filepath)
+    except OSError:
+        return None
+
+
 def get_weather_alerts(weather_api_key, city="Montreal"):
     """
     Fetch current weather for the given city.
@@ -57,9 +69,9 @@ def get_weather_alerts(weather_api_key, city="Montreal"):
     cause delays (for buses and trains), return a weather alert message.
     Otherwise, return an empty list.
     """
-    url = f"http://api.weatherapi.com/v1/current.json?key={weather_api_key}&q={city}&aqi=no"
+    url = f"{WEATHER_API_BASE}/current.json?key={weather_api_key}&q={city}&aqi=no"
     try:
-        response = requests.get(url)
+        response = fetch("weather_alerts", url)
         response.raise_for_status()
         data = response.json()
         condition = data.get("current", {}).get("condition", {})
@@ -105,5 +117,5 @@ def get_weather_alerts(weather_api_key, city="Montreal"):
             }]
         return []
     except requests.exceptions.RequestException as err:
-        print(f"Error fetching weather alerts: {err}")
+        logger.error("Error fetching weather alerts: %s", err)
         return []